@@ -0,0 +1,127 @@
+"""Synthetic source, OSM and notes datasets around Swedish coordinates
+
+The datasets only depend on the size and the seed so
+every run of the benchmarks measures the same data."""
+from datetime import datetime, timedelta
+from typing import Tuple
+
+import numpy
+import shapely
+from geopandas import GeoDataFrame
+from pandas import DataFrame
+
+# Sweden including the coast
+LATITUDES = (55.3, 69.0)
+LONGITUDES = (11.1, 24.1)
+METERS_PER_DEGREE = 111_000
+
+
+def random_points(
+    generator: numpy.random.Generator, number: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Return latitudes and longitudes"""
+    return (
+        generator.uniform(*LATITUDES, number),
+        generator.uniform(*LONGITUDES, number),
+    )
+
+
+def offset(
+    generator: numpy.random.Generator,
+    latitudes: numpy.ndarray,
+    longitudes: numpy.ndarray,
+    max_meters: float,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Move every point up to max_meters in a random direction"""
+    meters = generator.uniform(0, max_meters, len(latitudes))
+    bearing = generator.uniform(0, 2 * numpy.pi, len(latitudes))
+    return (
+        latitudes + meters * numpy.cos(bearing) / METERS_PER_DEGREE,
+        longitudes
+        + meters
+        * numpy.sin(bearing)
+        / (METERS_PER_DEGREE * numpy.cos(numpy.radians(latitudes))),
+    )
+
+
+def source_df(size: int, seed: int = 42) -> GeoDataFrame:
+    generator = numpy.random.default_rng(seed)
+    latitudes, longitudes = random_points(generator, size)
+    return GeoDataFrame(
+        {"objektidentitet": [f"source{i}" for i in range(size)]},
+        geometry=shapely.points(longitudes, latitudes),
+        crs="EPSG:4326",
+    )
+
+
+def osm_df(source: GeoDataFrame, seed: int = 43) -> GeoDataFrame:
+    """Half of the features are within 150m of a source feature
+
+    70% are points, 20% small squares and 10% short lines"""
+    generator = numpy.random.default_rng(seed)
+    size = len(source.index)
+    near = size // 2
+    latitudes, longitudes = random_points(generator, size)
+    latitudes[:near], longitudes[:near] = offset(
+        generator,
+        shapely.get_y(source.geometry.values[:near]),
+        shapely.get_x(source.geometry.values[:near]),
+        max_meters=150,
+    )
+    geometries = shapely.points(longitudes, latitudes)
+    kind = generator.uniform(0, 1, size)
+    # about 50m wide
+    delta = 50 / METERS_PER_DEGREE
+    polygons = (kind >= 0.7) & (kind < 0.9)
+    geometries[polygons] = shapely.box(
+        longitudes[polygons],
+        latitudes[polygons],
+        longitudes[polygons] + delta,
+        latitudes[polygons] + delta / 2,
+    )
+    lines = kind >= 0.9
+    geometries[lines] = shapely.linestrings(
+        numpy.stack(
+            [
+                numpy.stack([longitudes[lines], latitudes[lines]], axis=1),
+                numpy.stack([longitudes[lines] + delta, latitudes[lines]], axis=1),
+            ],
+            axis=1,
+        )
+    )
+    return GeoDataFrame(
+        {"id": [f"node/{i}" for i in range(size)]},
+        geometry=geometries,
+        crs="EPSG:4326",
+    )
+
+
+def notes_df(source: GeoDataFrame, open_notes: int, seed: int = 44) -> DataFrame:
+    """One note within 50m of every source feature
+
+    open_notes of them are open and checked a week ago,
+    the others were closed long ago and are never checked again."""
+    generator = numpy.random.default_rng(seed)
+    size = len(source.index)
+    latitudes, longitudes = offset(
+        generator,
+        shapely.get_y(source.geometry.values),
+        shapely.get_x(source.geometry.values),
+        max_meters=50,
+    )
+    is_open = numpy.zeros(size, dtype=bool)
+    is_open[generator.permutation(size)[:open_notes]] = True
+    week_ago = str(datetime.now() - timedelta(days=7))
+    year_ago = str(datetime.now() - timedelta(days=365))
+    return DataFrame(
+        {
+            "date": year_ago,
+            "note_id": numpy.arange(1, size + 1),
+            "latitude": latitudes,
+            "longitude": longitudes,
+            "open": is_open,
+            "hidden": False,
+            "last_checked": week_ago,
+            "status_changed_at": numpy.where(is_open, None, year_ago),
+        }
+    )
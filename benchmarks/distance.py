@@ -0,0 +1,59 @@
+"""Compare the distance kernels with geopy on our Swedish latitudes
+
+Run with: python -m benchmarks.distance [number of pairs]"""
+import sys
+import time
+
+import numpy
+
+from models.distance import equirectangular, geodesic, haversine, within_radius
+
+
+def random_pairs(number: int, max_meters: float = 200):
+    generator = numpy.random.default_rng(42)
+    latitude1 = generator.uniform(55, 69, number)
+    longitude1 = generator.uniform(11, 24, number)
+    meters = generator.uniform(0, max_meters, number)
+    bearing = generator.uniform(0, 2 * numpy.pi, number)
+    latitude2 = latitude1 + meters * numpy.cos(bearing) / 111_000
+    longitude2 = longitude1 + meters * numpy.sin(bearing) / (
+        111_000 * numpy.cos(numpy.radians(latitude1))
+    )
+    return latitude1, longitude1, latitude2, longitude2
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(number: int = 100_000):
+    pairs = random_pairs(number)
+    expected, geopy_seconds = timed(geodesic, *pairs)
+    print(f"{number} pairs between 0 and 200m at latitude 55-69")
+    print(f"{'kernel':<28}{'seconds':>10}{'speedup':>10}{'max error m':>14}")
+    print(f"{'geopy':<28}{geopy_seconds:>10.3f}{1:>10.1f}{0:>14.4f}")
+    for name, function, kwargs in [
+        ("haversine", haversine, {}),
+        ("equirectangular", equirectangular, {}),
+        ("haversine + fallback", within_radius, dict(radius=100)),
+        (
+            "equirectangular + fallback",
+            within_radius,
+            dict(radius=100, kernel=equirectangular),
+        ),
+    ]:
+        distances, seconds = timed(function, *pairs, **kwargs)
+        error = numpy.abs(distances - expected)
+        print(
+            f"{name:<28}{seconds:>10.3f}{geopy_seconds / seconds:>10.1f}"
+            f"{error.max():>14.4f}"
+        )
+        if "fallback" in name:
+            mismatches = ((distances <= 100) != (expected <= 100)).sum()
+            print(f"{'':<28}decisions differing from geopy: {mismatches}")
+
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:]))
@@ -0,0 +1,309 @@
+"""Time the matching and note bookkeeping stages on synthetic datasets
+
+Run with: python -m benchmarks.stages [--sizes 1000 10000 100000 1000000]
+    [--output results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+Every stage reports the wall time, the throughput and the peak resident
+memory while it ran. The status check talks to the local OSM API stub
+from the tests instead of the real API. With --baseline the results
+are compared with an earlier output file and the exit code is 1
+when a stage got slower or uses more memory than the tolerance allows."""
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import geopandas
+import numpy
+import shapely
+
+import config
+from benchmarks import datasets
+from models.GeojsonHandler import GeojsonHandler
+from models.notes_store import get_notes_store
+from models.osm_note_uploader import OsmNoteHandler
+from models.proximity_join import ProximityJoin
+from tests.osm_api_stub import OsmApiStub
+
+
+def current_rss() -> int:
+    """Return the resident memory in bytes, the peak so far
+    where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class PeakMemory:
+    """Sample the resident memory in a thread while the block runs"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while True:
+            self.peak = max(self.peak, current_rss())
+            if self.stopped.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def measure(stage: str, size: int, items: int, function: Callable) -> Dict[str, Any]:
+    """Run the stage once with its output hidden"""
+    with PeakMemory() as memory, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+    result = dict(
+        stage=stage,
+        size=size,
+        items=items,
+        seconds=round(seconds, 6),
+        items_per_second=round(items / seconds, 1) if seconds else None,
+        peak_rss_mb=round(memory.peak / 1024**2, 1),
+    )
+    print(
+        f"{stage:<52}{size:>9}{items:>9}{seconds:>10.3f}"
+        f"{result['items_per_second'] or 0:>14.0f}{result['peak_rss_mb']:>10.1f}",
+        file=sys.stderr,
+    )
+    return result
+
+
+def run_size(
+    size: int, lookups: int, writes: int, max_requests: int, directory: str
+) -> List[Dict[str, Any]]:
+    source_df = datasets.source_df(size)
+    osm_df = datasets.osm_df(source_df)
+    notes_df = datasets.notes_df(source_df, open_notes=min(size, max_requests))
+    points = list(source_df.geometry.values[: min(size, lookups)])
+    results = []
+
+    handler = GeojsonHandler(osm_df=osm_df)
+    results.append(measure("build_osm_index", size, size, handler.build_osm_index))
+    results.append(
+        measure(
+            "proximity_join",
+            size,
+            size,
+            ProximityJoin(source_df=source_df, osm_layer=handler.osm_index.layer).join,
+        )
+    )
+    results.append(
+        measure(
+            "calculate_distance_to_osm_features",
+            size,
+            len(points),
+            lambda: [handler.calculate_distance_to_osm_features(p) for p in points],
+        )
+    )
+
+    notes_file_path = os.path.join(directory, f"notes-{size}.csv")
+    get_notes_store(notes_file_path).write_dataframe(notes_df)
+    handler.notes_file_path = notes_file_path
+    results.append(
+        measure(
+            "calculate_distance_to_previously_created_osm_notes",
+            size,
+            len(points),
+            lambda: [
+                handler.calculate_distance_to_previously_created_osm_notes(p)
+                for p in points
+            ],
+        )
+    )
+    uploader = OsmNoteHandler(
+        notes_file_path=notes_file_path, notes_index=handler.notes_index
+    )
+    new_points = shapely.points(
+        numpy.random.default_rng(45).uniform(*datasets.LONGITUDES, writes),
+        numpy.random.default_rng(46).uniform(*datasets.LATITUDES, writes),
+    )
+    results.append(
+        measure(
+            "write_note_information_to_csv",
+            size,
+            writes,
+            lambda: [
+                uploader.write_note_information_to_csv(note_id=size + i + 1, point=p)
+                for i, p in enumerate(new_points)
+            ],
+        )
+    )
+
+    status_file_path = os.path.join(directory, f"status-{size}.csv")
+    get_notes_store(status_file_path).write_dataframe(notes_df)
+    open_df = notes_df[notes_df["open"]]
+    stub_notes = {
+        int(note.note_id): dict(
+            lat=note.latitude,
+            lon=note.longitude,
+            # a tenth of them was closed since the last check
+            status="closed" if note.note_id % 10 == 0 else "open",
+        )
+        for note in open_df.itertuples()
+    }
+    with OsmApiStub(stub_notes) as stub:
+        status_handler = GeojsonHandler(
+            notes_file_path=status_file_path,
+            osmnoteuploader=OsmNoteHandler(client=stub.client()),
+        )
+        results.append(
+            measure(
+                "check_note_status",
+                size,
+                size,
+                status_handler.check_note_status,
+            )
+        )
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Return the stages slower or bigger than the baseline beyond the tolerance"""
+    baseline_results = {
+        (result["stage"], result["size"]): result for result in baseline
+    }
+    regressions = []
+    for result in results:
+        previous = baseline_results.get((result["stage"], result["size"]))
+        if previous is None:
+            continue
+        name = f"{result['stage']} at {result['size']}"
+        # per item since the number of lookups and writes can differ
+        seconds = result["seconds"] / result["items"]
+        previous_seconds = previous["seconds"] / previous["items"]
+        if seconds > previous_seconds * (1 + tolerance):
+            regressions.append(
+                f"{name} took {seconds * 1000:.3f}ms per item "
+                f"instead of {previous_seconds * 1000:.3f}ms"
+            )
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{name} peaked at {result['peak_rss_mb']}MB "
+                f"instead of {previous['peak_rss_mb']}MB"
+            )
+    return regressions
+
+
+def run(
+    sizes: List[int],
+    lookups: int = 1000,
+    writes: int = 1000,
+    max_requests: int = 1000,
+) -> Dict[str, Any]:
+    print(
+        f"{'stage':<52}{'size':>9}{'items':>9}{'seconds':>10}"
+        f"{'items/s':>14}{'peak MB':>10}",
+        file=sys.stderr,
+    )
+    results = []
+    requests_per_second = config.api_requests_per_second
+    # the stub is local, do not rate limit it
+    config.api_requests_per_second = 0
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in sizes:
+                results.extend(
+                    run_size(
+                        size,
+                        lookups=lookups,
+                        writes=writes,
+                        max_requests=max_requests,
+                        directory=directory,
+                    )
+                )
+    finally:
+        config.api_requests_per_second = requests_per_second
+    return dict(
+        date=str(datetime.now()),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        versions=dict(
+            numpy=numpy.__version__,
+            geopandas=geopandas.__version__,
+            shapely=shapely.__version__,
+        ),
+        results=results,
+    )
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--lookups",
+        type=int,
+        default=1000,
+        help="Number of single point lookups per size",
+    )
+    parser.add_argument(
+        "--writes", type=int, default=1000, help="Number of notes written per size"
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=1000,
+        help="Number of open notes the status check asks the stub about",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with this earlier output")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown and memory growth as a fraction of the baseline",
+    )
+    args = parser.parse_args(arguments)
+    report = run(
+        args.sizes,
+        lookups=args.lookups,
+        writes=args.writes,
+        max_requests=args.max_requests,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(
+                report["results"], json.load(file)["results"], args.tolerance
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
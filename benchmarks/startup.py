@@ -0,0 +1,99 @@
+"""Measure the import time of the command handlers
+
+Run with: python -m benchmarks.startup [--budget 0.8] [--repeat 5]
+
+Every import runs in a fresh interpreter with -X importtime. The note
+commands (status, list and close) must not import the geo libraries and
+the exit code is 1 when they do or when their median import time is
+over the budget."""
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+from typing import Dict, List, Optional, Tuple
+
+# Modules only the commands that match geometries may import
+GEO_MODULES = {"geopandas", "geopy", "pyproj", "pyogrio", "fiona", "shapely"}
+HANDLERS = {
+    "notes": "models.notes_handler",
+    "geojson": "models.GeojsonHandler",
+}
+
+
+def import_time(module: str) -> Tuple[float, Dict[str, int]]:
+    """Return the seconds it took to import the module and the
+    cumulative microseconds of every top level package it imported"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages: Dict[str, int] = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # the header
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+    return packages[module.split(".")[0]] / 1_000_000, packages
+
+
+def run(repeat: int = 5) -> Dict[str, Dict]:
+    report = {}
+    for name, module in HANDLERS.items():
+        measurements = [import_time(module) for _ in range(repeat)]
+        packages = measurements[-1][1]
+        report[name] = dict(
+            module=module,
+            seconds=round(statistics.median(m[0] for m in measurements), 3),
+            geo_modules=sorted(GEO_MODULES & set(packages)),
+            slowest=sorted(packages.items(), key=lambda item: -item[1])[1:6],
+        )
+    return report
+
+
+def check(report: Dict[str, Dict], budget: float) -> List[str]:
+    """Return the problems of the note commands"""
+    notes = report["notes"]
+    problems = []
+    if notes["geo_modules"]:
+        problems.append(f"{notes['module']} imports {', '.join(notes['geo_modules'])}")
+    if notes["seconds"] > budget:
+        problems.append(
+            f"{notes['module']} took {notes['seconds']}s to import, "
+            f"the budget is {budget}s"
+        )
+    return problems
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.8,
+        help="Seconds the note commands may spend importing",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of imports per handler"
+    )
+    args = parser.parse_args(arguments)
+    report = run(repeat=args.repeat)
+    for name, result in report.items():
+        slowest = ", ".join(
+            f"{package} {microseconds / 1000:.0f}ms"
+            for package, microseconds in result["slowest"]
+        )
+        print(f"{result['module']:<24}{result['seconds']:>8.3f}s  {slowest}")
+    problems = check(report, args.budget)
+    for problem in problems:
+        print(f"Too slow: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,12 +23,18 @@ Min gissning är att göra en ny dataframe med distanskolumn
 import logging
 
 import config
-from models.GeojsonHandler import GeojsonHandler
+from models.cli import NOTES_COMMANDS, parse_arguments
 
 logging.basicConfig(level=config.loglevel)
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
     logger.info("Starting")
-    ls = GeojsonHandler()
-    ls.start()
+    args = parse_arguments()
+    # the note commands start without importing the geo libraries
+    if args.command in NOTES_COMMANDS:
+        from models.notes_handler import NotesHandler as Handler
+    else:
+        from models.GeojsonHandler import GeojsonHandler as Handler
+    ls = Handler()
+    ls.start(args)
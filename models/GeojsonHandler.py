@@ -1,23 +1,48 @@
 import logging
-import os
-from argparse import ArgumentParser
+from argparse import Namespace
+from typing import Iterator, List, Optional
 
 import geopandas
 import pandas
-from geopy.distance import distance
 from pandas import DataFrame
-from pydantic import BaseModel
 from shapely import Point
 
 import config
+from models.area_filter import AreaFilter
 from models.bounding_box import BoundingBox
+from models.async_note_uploader import AsyncNoteUploader
+from models.dataset_diff import DatasetDiff, SourceSnapshot
+from models.distance import distance_meters
 from models.exceptions import GeometryError
-from models.osm_note_uploader import OsmNoteHandler
+from models.frame_cache import FrameCache
+from models.geojson_stream import GeojsonStreamReader, read_geojson
+from models.osm_extract import OverpassSource, PbfSource, TiledOsmCache
+from models.osm_feature_index import OsmFeatureIndex
+from models.notes_handler import NotesHandler
+from models.osm_layer import SUPPORTED_TYPES, closest_point, representative_geometry
+from models.pipeline import NotePipeline, read_candidates, write_candidates
+from models.proximity_join import ProximityJoin
+from models.run_journal import (
+    MATCHED,
+    NEAR_NOTE,
+    NOTE_CREATED,
+    SKIPPED_BY_AREA,
+    RunJournal,
+    geometry_hashes,
+)
+from models.sharded_matcher import ShardedMatcher
+from models.source_clusters import SourceClusters
+from models.upload_journal import UploadJournal
 
 logger = logging.getLogger(__name__)
 
+# The columns we use from the input files
+SOURCE_ID_COLUMN = "objektidentitet"
+SOURCE_COLUMNS = [SOURCE_ID_COLUMN]
+OSM_COLUMNS = ["id"]
 
-class GeojsonHandler(BaseModel):
+
+class GeojsonHandler(NotesHandler):
     """This class takes care of setting up the
     # get source geojson and osmfeatures geojson from the command line
     # parse with geopandas
@@ -33,80 +58,86 @@ class GeojsonHandler(BaseModel):
 
     source_geojson: str = ""
     osm_geojson: str = ""
-    notes_file_path: str = ""
+    # fetch the OSM features with these tags instead of reading osm_geojson
+    osm_tags: List[str] = []
+    osm_pbf: Optional[str] = None
     bounding_box_string: str = ""
-    bbox: BoundingBox = BoundingBox()
+    area_geojson: Optional[str] = None
+    area_filter: AreaFilter = AreaFilter()
 
     source_df: DataFrame = DataFrame()
     osm_df: DataFrame = DataFrame()
-    notes_df: DataFrame = DataFrame()
-
-    osmnoteuploader: OsmNoteHandler = OsmNoteHandler()
-    number_of_open_notes: int = 0
+    osm_index: OsmFeatureIndex = OsmFeatureIndex()
+    match_df: DataFrame = DataFrame()
+
+    stream: bool = False
+    frame_cache: Optional[FrameCache] = None
+    refresh_frame_cache: bool = False
+    processes: int = config.processes
+    # one pool of processes for all the chunks of a streamed run
+    matcher: Optional[ShardedMatcher] = None
+    chunk_size: int = 10000
+    matches_file_path: str = ""
+    plan_file_path: str = ""
+    # skip the source features with an outcome in the run journal
+    resume: bool = False
+    run_journal: Optional[RunJournal] = None
+    # only match the features changed since the snapshot of the last run
+    incremental: bool = False
+    flag_removed: bool = False
+    # the snapshot features that need no work: the ones of earlier runs
+    # outside the areas and the unchanged ones
+    source_snapshot_df: DataFrame = DataFrame()
+    # the added and moved source features before collapsing
+    changed_source_df: DataFrame = DataFrame()
+    # set when the run stops before all source features were worked on
+    stopped: bool = False
 
     class Config:
         arbitrary_types_allowed = True
 
-    def start(self):
-        self.setup_argparse_and_get_filename()
-        self.initialize_note_uploader()
-        self.check_note_status()
-        # self.list_open_notes()
-        # self.print_note_status()
-        self.close_all_open_notes()
-        # self.setup_argparse_and_get_filename()
-        # self.parse_bounding_box()
-        # self.create_geodataframes()
-        # self.print_note_status()
-        # if self.yes_no_question(question="Check and update note status?"):
-        #     self.check_note_status()
-        #     self.print_note_status()
-        # if self.yes_no_question(question="List URL to open notes?"):
-        #     self.list_open_notes()
-        # if self.yes_no_question(question="Iterate features and upload notes?"):
-        #     self.iterate_source_features()
-
-    def check_empty_notes_df(self):
-        if self.notes_df.empty:
-            raise Exception("notes df was empty")
-
-    def close_all_open_notes(self):
-        logger.debug("close_all_open_notes: running")
-        self.read_notes_dataframe()
-        self.check_empty_notes_df()
-        if not self.notes_df.empty:
-            count_open_notes = self.notes_df["open"].sum()
-            print(f"closing all {count_open_notes} open notes...")
-            self.notes_df["open"] = self.notes_df["note_id"].apply(
-                lambda x: self.osmnoteuploader.close(note_id=x, comment="Closing because there is now a maproulette challenge for this, see https://maproulette.org/browse/challenges/48914")
-            )
-            print("done")
-            # for index, row in self.notes_df.iterrows():
-            #     if row['open']:
-            #         note_id = row['note_id']
-            #         print(f"closing https://www.openstreetmap.org/note/{note_id}...")
+    def run_command(self):
+        self.run_geojson_command()
+        if self.incremental and self.command in ("iterate", "pipeline"):
+            self.write_source_snapshot()
+
+    def run_geojson_command(self):
+        if self.command == "iterate":
+            self.create_geodataframes()
+            self.iterate_source_features()
+        elif self.command == "match":
+            self.create_geodataframes()
+            self.match_to_file()
+        elif self.command == "plan":
+            self.plan_to_file()
+        elif self.command == "upload":
+            self.upload_from_file()
+        elif self.command == "pipeline":
+            self.create_geodataframes()
+            self.run_pipeline()
+        elif self.command == "ingest":
+            self.ingest_osm_features()
         else:
-            logger.info("dataframe was empty")
-
-
-    def print_note_status(self):
-        self.check_empty_notes_df()
-        self.print_number_of_open_notes()
-        self.print_number_of_closed_and_unhidden_notes()
-        self.print_number_of_hidden_notes()
-        self.print_number_of_total_notes()
-
-    def list_open_notes(self):
-        logger.debug("list_open_notes: running")
-        self.read_notes_dataframe()
-        self.check_empty_notes_df()
-        if not self.notes_df.empty:
-            for index, row in self.notes_df.iterrows():
-                if row['open']:
-                    note_id = row['note_id']
-                    print(f"https://www.openstreetmap.org/note/{note_id}")
-        else:
-            logger.info("dataframe was empty")
+            super().run_command()
+
+    def apply_arguments(self, args: Namespace):
+        super().apply_arguments(args)
+        self.source_geojson = getattr(args, "source_geojson", "")
+        self.osm_geojson = getattr(args, "osm_geojson", None) or ""
+        self.osm_tags = getattr(args, "osm_tag", None) or []
+        self.osm_pbf = getattr(args, "osm_pbf", None)
+        self.bounding_box_string = ";".join(getattr(args, "bounding_box", None) or [])
+        self.area_geojson = getattr(args, "area_geojson", None)
+        self.stream = getattr(args, "stream", False)
+        self.processes = getattr(args, "processes", config.processes)
+        if not getattr(args, "no_frame_cache", True):
+            self.frame_cache = FrameCache()
+        self.refresh_frame_cache = getattr(args, "refresh_frame_cache", False)
+        self.matches_file_path = getattr(args, "matches_file", "")
+        self.plan_file_path = getattr(args, "plan_file", "")
+        self.resume = getattr(args, "resume", False)
+        self.incremental = getattr(args, "incremental", False)
+        self.flag_removed = getattr(args, "flag_removed", False)
 
     def yes_no_question(self, question: str, default=None) -> bool:
         choices = ("", "y", "n") if default in ("yes", "no") else ("y", "n")
@@ -119,88 +150,170 @@ class GeojsonHandler(BaseModel):
         return (reply == "y") if default != "yes" else (reply in ("", "y"))
 
     def parse_bounding_box(self):
-        """Parse the format from http://osm.duschmarke.de/bbox.html"""
-        if self.bounding_box_string:
-            bbox_list = self.bounding_box_string.split(",")  # x1,y1,x2,y2
-            if not len(bbox_list) == 4:
-                raise GeometryError(
-                    f"Not a correct bounding box with x1,y1,x2,y2: {self.bounding_box_string}"
-                )
-            self.bbox = BoundingBox(
-                x1=bbox_list[0], y1=bbox_list[1], x2=bbox_list[2], y2=bbox_list[3]
-            )
+        """Parse the bounding boxes separated by ; in the format
+        from http://osm.duschmarke.de/bbox.html and the area polygons"""
+        self.area_filter = AreaFilter.from_strings(
+            bounding_box_string=self.bounding_box_string,
+            area_geojson=self.area_geojson,
+        )
 
-    def read_notes_dataframe(self):
-        logger.debug("read_notes_dataframe: running")
-        if self.notes_df.empty:
-            logger.debug("reading dataframe from disk...")
-            # read the csv if any
-            file = self.notes_file_path
-            if os.path.exists(file) and os.path.getsize(file):
-                self.notes_df = pandas.read_csv(file)
-        else:
-            logger.info("dataframe was not empty")
-
-    def print_number_of_open_notes(self):
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            print(f'Open notes: {self.notes_df["open"].sum()}')
-
-    def print_number_of_hidden_notes(self):
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            print(f'Hidden notes: {self.notes_df["hidden"].sum()}')
-
-    def print_number_of_total_notes(self):
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            print(f'Total number of notes: {len(self.notes_df)}')
-
-    def check_note_status(self):
-        print("Checking note status for all notes")
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            # We dont need to login to get the status only
-            # self.initialize_note_uploader()
-            # for each note lookup if open
-            # Use apply() to update the 'open' column based on the lookup method
-            self.notes_df["open"] = self.notes_df["note_id"].apply(
-                lambda x: self.osmnoteuploader.is_open(note_id=x)
+    def create_geodataframes(self):
+        """Create geodataframes based on the geojson input files
+
+        When streaming the source is read chunk by chunk in
+        iterate_source_features and only the columns we use are kept"""
+        self.parse_bounding_box()
+        if not self.stream:
+            self.source_df = read_geojson(
+                self.source_geojson,
+                columns=SOURCE_COLUMNS,
+                stream=False,
+                bbox=self.area_filter.bounds(),
+                filter_function=self.area_filter.filter_points,
+                cache=self.frame_cache,
+                refresh_cache=self.refresh_frame_cache,
             )
-            self.notes_df["hidden"] = self.notes_df["note_id"].apply(
-                lambda x: self.osmnoteuploader.is_hidden(note_id=x)
+            if config.loglevel == logging.INFO:
+                print(self.source_df.info())
+            if self.incremental:
+                self.select_changed_source_features()
+            self.source_df = SourceClusters().collapse(self.source_df)
+        # OSM features just outside the areas can still match
+        osm_area_filter = self.area_filter.buffered(meters=100)
+        if self.osm_tags:
+            self.osm_df = osm_area_filter.filter_features(
+                self.create_osm_cache().load(self.osm_bounds(osm_area_filter))
             )
-            # write back the file
-            self.notes_df.to_csv(self.notes_file_path, index=False)
-            # store number of open notes in an attibute
-            count_open_notes_after_check = self.notes_df["open"].sum()
-            print(f"Open notes after check: {count_open_notes_after_check}")
-            self.number_of_open_notes = count_open_notes_after_check
         else:
-            print(f"No notes found in the notes file")
+            self.osm_df = read_geojson(
+                self.osm_geojson,
+                columns=OSM_COLUMNS,
+                stream=self.stream,
+                bbox=osm_area_filter.bounds(),
+                filter_function=osm_area_filter.filter_features,
+                cache=self.frame_cache,
+                refresh_cache=self.refresh_frame_cache,
+            )
+        self.build_osm_index()
+
+    def select_changed_source_features(self):
+        """Keep only the source features added or moved since the last run
+
+        Only the part of the snapshot inside the areas of this run is
+        compared, the rest is kept for the runs over the other areas"""
+        self.changed_source_df = self.source_df
+        self.source_snapshot_df = self.source_df.iloc[:0]
+        snapshot = SourceSnapshot.for_notes_file(self.notes_file_path)
+        if not snapshot.exists():
+            print("No snapshot from an earlier run, matching all source features")
+            return
+        previous_df = snapshot.read().reset_index(drop=True)
+        inside_df = self.area_filter.filter_points(previous_df)
+        result = DatasetDiff(previous_df=inside_df, current_df=self.source_df).diff()
+        print(result)
+        self.source_snapshot_df = pandas.concat(
+            [
+                previous_df.drop(inside_df.index),
+                self.source_df.drop(result.changed.index),
+            ],
+            ignore_index=True,
+        )
+        self.changed_source_df = self.source_df = result.changed
+        if self.flag_removed:
+            self.flag_notes_of_removed_features(result.removed)
+
+    def finished_source_features(self) -> DataFrame:
+        """Return the changed source features with a final outcome
+
+        The pipeline keeps no journal so its features are only finished
+        when the whole run is. A collapsed feature is finished with the
+        feature representing its cluster."""
+        changed_df = self.changed_source_df
+        if self.command == "pipeline" or changed_df.empty:
+            return changed_df.iloc[:0] if self.stopped else changed_df
+        labels = SourceClusters().labels(changed_df)
+        journal = self.open_run_journal()
+        finished = [
+            journal.outcome(key) not in (None, SKIPPED_BY_AREA)
+            for key in geometry_hashes(changed_df.geometry.values[labels])
+        ]
+        return changed_df[finished]
 
-    def create_geodataframes(self):
-        """Create geodataframes based on the geojson input files"""
-        self.source_df = geopandas.read_file(self.source_geojson)
-        if config.loglevel == logging.INFO:
-            print(self.source_df.info())
-        self.osm_df = geopandas.read_file(self.osm_geojson)
+    def write_source_snapshot(self):
+        """Store the source features that need no work in the next run,
+        the ones left without an outcome are matched again"""
+        finished_df = self.finished_source_features()
+        if len(finished_df.index) < len(self.changed_source_df.index):
+            print(
+                f"{len(self.changed_source_df.index) - len(finished_df.index)} "
+                f"changed source features were not finished and stay changed"
+            )
+        SourceSnapshot.for_notes_file(self.notes_file_path).write(
+            pandas.concat([self.source_snapshot_df, finished_df], ignore_index=True)
+        )
+
+    def flag_notes_of_removed_features(self, removed_df: DataFrame):
+        """Print the open notes near source features that disappeared"""
+        if not self.notes_index.is_built:
+            self.read_notes_dataframe()
+            self.notes_index.build(self.notes_df)
+        note_ids = set()
+        for geometry in removed_df.geometry:
+            notes_df = self.notes_index.query(point=geometry.representative_point())
+            if not notes_df.empty:
+                note_ids.update(notes_df.loc[notes_df["open"].astype(bool), "note_id"])
+        print(f"Open notes near removed source features: {len(note_ids)}")
+        for note_id in sorted(note_ids):
+            print(self.generate_osm_note_url(note_id))
+
+    def create_osm_cache(self) -> TiledOsmCache:
+        if self.osm_pbf:
+            source = PbfSource(tags=self.osm_tags, file_path=self.osm_pbf)
+        else:
+            source = OverpassSource(tags=self.osm_tags)
+        return TiledOsmCache(source=source)
+
+    def osm_bounds(self, osm_area_filter: AreaFilter):
+        """Return the box to fetch the OSM features for, the areas
+        or else the source features grown by the radius"""
+        bounds = osm_area_filter.bounds()
+        if bounds is not None:
+            return bounds
+        if self.source_df.empty:
+            raise GeometryError(
+                "--osm-tag needs --bounding-box or --area-geojson "
+                "when the source is not loaded"
+            )
+        minx, miny, maxx, maxy = self.source_df.total_bounds
+        return AreaFilter(
+            bounding_boxes=[BoundingBox(x1=minx, y1=miny, x2=maxx, y2=maxy)]
+        ).buffered(meters=100).bounds()
+
+    def ingest_osm_features(self):
+        """Fetch the stale OSM tiles of the areas into the cache"""
+        self.parse_bounding_box()
+        osm_area_filter = self.area_filter.buffered(meters=100)
+        cache = self.create_osm_cache()
+        tiles = cache.refresh(self.osm_bounds(osm_area_filter))
+        print(f"Refreshed {len(tiles)} OSM tiles in {cache.source_directory}")
+
+    def build_osm_index(self):
+        """Build the spatial index over the OSM features once"""
+        self.osm_index = OsmFeatureIndex(osm_df=self.osm_df)
+        self.osm_index.build()
 
     @staticmethod
     def calculate_distance_geopandas(row, target_point):
         # This is a Shapely point object where y=latitude and x=longitude
         # see https://stackoverflow.com/questions/49635436/shapely-point-geometry-in-geopandas-df-to-lat-lon-columns
         # invocation Point([y, x])
-        if row.geometry.geom_type == "Point":
-            row_coords = (row.geometry.y, row.geometry.x)
-        elif row.geometry.geom_type == "Polygon":
-            row_coords = (row.geometry.centroid.y, row.geometry.centroid.x)
-        elif row.geometry.geom_type == "LineString":
-            closest_point = row.geometry.interpolate(row.geometry.project(target_point))
-            row_coords = (closest_point.y, closest_point.x)
-        else:
+        if row.geometry.geom_type not in SUPPORTED_TYPES:
             raise GeometryError(f"row.geometry.type: {row.geometry.type} not supported")
-        dist = distance(row_coords, (target_point.y, target_point.x)).meters
+        # the centroid of polygons and the closest point on lines
+        closest = closest_point(representative_geometry(row.geometry), target_point)
+        row_coords = (closest.y, closest.x)
+        # exact with geopy near the 100m threshold, see models.distance
+        dist = distance_meters(*row_coords, target_point.y, target_point.x)
         return dist
 
     @staticmethod
@@ -219,107 +332,276 @@ class GeojsonHandler(BaseModel):
         longitude = point.x
         return f"https://www.openstreetmap.org/#map=19/{latitude}/{longitude}"
 
-    def initialize_note_uploader(self):
-        if not self.osmnoteuploader.initialized:
-            # propagate the notes file path
-            self.osmnoteuploader = OsmNoteHandler(notes_file_path=self.notes_file_path)
-            self.osmnoteuploader.initialize_client()
-
     def generate_osm_note_url(self, note_id: int):
         return f"https://www.openstreetmap.org/note/{note_id}"
 
-    def upload_note(self, point: Point):
+    def upload_note(self, point: Point) -> Optional[int]:
         """Upload note based on the point and the text in the config"""
         self.initialize_note_uploader()
         note_id = self.osmnoteuploader.create_and_upload_note(point=point)
         print(f"Note uploaded, see {self.generate_osm_note_url(note_id)}")
         self.number_of_open_notes += 1
+        return note_id
 
     @staticmethod
     def calculate_distance_points(row, point):
         source_lon = row["longitude"]
         source_lat = row["latitude"]
         target_point = point
-        dist = distance(
-            (source_lat, source_lon), (target_point.y, target_point.x)
-        ).meters
+        dist = distance_meters(source_lat, source_lon, target_point.y, target_point.x)
         return dist
 
     def calculate_distance_to_previously_created_osm_notes(
         self, point: Point
     ) -> DataFrame:
-        """This is a point object where y=latitude and x=longitude"""
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            osm_notes_distance_df = self.notes_df.copy()
-
-            osm_notes_distance_df["distance_to_point"] = osm_notes_distance_df.apply(
-                self.calculate_distance_points,
-                axis=1,
-                args=(point,),
-            )
-
-            osm_notes_distance_df = osm_notes_distance_df[
-                osm_notes_distance_df["distance_to_point"] <= 100
-            ].sort_values(by="distance_to_point", ascending=True)
-
-            return osm_notes_distance_df
-        else:
+        """This is a point object where y=latitude and x=longitude
+
+        The lookup goes through the notes index which is built once
+        and updated by the uploader when new notes are created"""
+        if not self.notes_index.is_built:
+            self.read_notes_dataframe()
+            self.notes_index.build(self.notes_df)
+        if not self.notes_index.notes:
             # Return empty dataframe
             logger.warning("No notes in the notes file")
             return DataFrame()
+        return self.notes_index.query(point=point)
 
     def calculate_distance_to_osm_features(self, point) -> DataFrame:
-        """This is a point object where y=latitude and x=longitude"""
-        osm_distance_df = self.osm_df.copy()
-        # Assuming 'gdf' has a geometry column named 'geometry'
-        # Assuming 'target_point' is a Point object with coordinates (latitude, longitude)
+        """This is a point object where y=latitude and x=longitude
+
+        Only the candidates found in the spatial index are measured"""
+        if self.osm_index.osm_df is not self.osm_df:
+            self.build_osm_index()
+        return self.osm_index.query(point=point)
+
+    def source_chunks(self) -> Iterator[DataFrame]:
+        """Yield the source features in chunks
 
-        osm_distance_df["distance_to_point"] = self.osm_df.apply(
-            self.calculate_distance_geopandas, axis=1, args=(point,)
+        Streamed chunks are collapsed on their own, features within the
+        radius of each other in different chunks are not"""
+        if self.stream:
+            reader = GeojsonStreamReader(
+                file_path=self.source_geojson, columns=SOURCE_COLUMNS
+            )
+            for chunk in reader.iterate_chunks():
+                chunk = self.area_filter.filter_points(chunk)
+                yield SourceClusters().collapse(chunk)
+        else:
+            for start in range(0, len(self.source_df.index), self.chunk_size):
+                yield self.source_df.iloc[start : start + self.chunk_size]
+
+    def create_pipeline(self) -> NotePipeline:
+        """Create the headless pipeline sharing our notes and OSM features"""
+        if not self.notes_index.is_built:
+            self.read_notes_dataframe()
+            self.notes_index.build(self.notes_df)
+        if self.osm_index.osm_df is not self.osm_df:
+            self.build_osm_index()
+        return NotePipeline(
+            osm_df=self.osm_df,
+            osm_layer=self.osm_index.layer,
+            source_id_column=SOURCE_ID_COLUMN,
+            notes_index=self.notes_index,
+            uploader=self.create_async_uploader(),
+            processes=self.processes,
         )
-        # Remove rows with distance over 100 meters
-        osm_distance_df = osm_distance_df.loc[
-            osm_distance_df["distance_to_point"] <= 100
-        ]
 
-        # Sort by ascending distance
-        return osm_distance_df.sort_values(by="distance_to_point", ascending=True)
+    def create_async_uploader(self) -> AsyncNoteUploader:
+        """Create the uploader journaling every note it creates"""
+        return AsyncNoteUploader(
+            osmnoteuploader=self.osmnoteuploader,
+            journal=UploadJournal(file_path=f"{self.notes_file_path}.uploads.csv"),
+            max_in_flight=self.max_uploads_in_flight,
+            number_of_open_notes=self.number_of_open_notes,
+        )
+
+    def match_to_file(self):
+        """Write the source features without an OSM feature nearby"""
+        pipeline = self.create_pipeline()
+        for _ in write_candidates(
+            self.matches_file_path, pipeline.match(self.source_chunks())
+        ):
+            pass
+        print(f"Wrote the unmatched source features to {self.matches_file_path}")
+
+    def plan_to_file(self):
+        """Write the candidates without a note nearby for review"""
+        pipeline = self.create_pipeline()
+        number_of_candidates = sum(
+            1
+            for _ in write_candidates(
+                self.plan_file_path,
+                pipeline.plan(read_candidates(self.matches_file_path)),
+            )
+        )
+        print(f"Wrote {number_of_candidates} candidates to {self.plan_file_path}")
+
+    def upload_from_file(self):
+        """Upload notes for the reviewed candidates with several in flight"""
+        self.check_note_status()
+        if not config.upload_to_osm:
+            print("Upload was skipped in the config")
+            return
+        self.initialize_note_uploader()
+        print(
+            self.create_async_uploader().run(
+                candidate.point for candidate in read_candidates(self.plan_file_path)
+            )
+        )
+
+    def run_pipeline(self):
+        """Match, plan and upload concurrently without asking anything"""
+        self.check_note_status()
+        if config.upload_to_osm:
+            self.initialize_note_uploader()
+        pipeline = self.create_pipeline()
+        number_of_uploaded_notes = pipeline.run(
+            chunks=self.source_chunks(), plan_file=self.plan_file_path
+        )
+        self.stopped = pipeline.stopped
+        print(
+            f"Uploaded {number_of_uploaded_notes} notes, "
+            f"the plan was written to {self.plan_file_path}"
+        )
+
+    def match_source_features(self):
+        """Match every source feature against OSM in one vectorized pass"""
+        logger.debug("match_source_features: running")
+        if self.osm_index.osm_df is not self.osm_df:
+            self.build_osm_index()
+        if self.matcher is not None:
+            self.match_df = self.matcher.join(self.source_df)
+        elif self.processes > 1:
+            with ShardedMatcher(
+                osm_layer=self.osm_index.layer, processes=self.processes
+            ) as matcher:
+                self.match_df = matcher.join(self.source_df)
+        else:
+            self.match_df = ProximityJoin(
+                source_df=self.source_df,
+                osm_df=self.osm_df,
+                osm_layer=self.osm_index.layer,
+            ).join()
+        number_of_matches = self.match_df["matched"].sum()
+        print(
+            f"Found {number_of_matches}/{len(self.match_df.index)} "
+            f"source features already in OSM within 100m"
+        )
+        if config.loglevel == logging.INFO:
+            print(self.match_df[self.match_df["matched"]].head())
+
+    def open_run_journal(self) -> RunJournal:
+        """Continue the journal of the last run with --resume
+        or else start a new one"""
+        if self.run_journal is None:
+            self.run_journal = RunJournal(file_path=f"{self.notes_file_path}.run.csv")
+            if not self.resume:
+                self.run_journal.clear()
+        return self.run_journal
+
+    def record_matched_source_features(self):
+        """Journal the source features with an OSM feature nearby"""
+        matched_df = self.match_df[self.match_df["matched"].astype(bool)]
+        osm_ids = None
+        if "id" in self.osm_df.columns:
+            osm_ids = list(self.osm_df.loc[matched_df["nearest_osm_index"], "id"])
+        self.open_run_journal().record_many(
+            geometry_hashes(self.source_df.geometry.loc[matched_df.index]),
+            MATCHED,
+            osm_ids=osm_ids,
+        )
 
     def iterate_source_features(self):
-        """Iterate the source_df rows and work on them"""
+        """Iterate the source features and work on the unmatched ones
+
+        Every outcome is journaled so --resume skips the
+        features that were done when the last run stopped"""
         if self.number_of_open_notes == 0:
             self.check_note_status()
             self.print_note_status()
-        total_number_of_rows = len(self.source_df.index)
-        for index, row in self.source_df.iterrows():
+        journal = self.open_run_journal()
+        if self.stream:
+            reader = GeojsonStreamReader(
+                file_path=self.source_geojson, columns=SOURCE_COLUMNS
+            )
+            self.start_matcher()
+            try:
+                for chunk in reader.iterate_chunks():
+                    if self.number_of_open_notes >= 100:
+                        print("Maximum number of open notes reached. Stopping")
+                        self.stopped = True
+                        break
+                    self.iterate_chunk(chunk)
+            finally:
+                self.stop_matcher()
+        else:
+            if self.match_df.empty:
+                # the features outside the areas were left out when loading
+                self.source_df = journal.unprocessed(self.source_df)
+                self.match_source_features()
+            self.record_matched_source_features()
+            self.process_unmatched_source_features(
+                total_number_of_rows=len(self.source_df.index)
+            )
+
+    def iterate_chunk(self, chunk: DataFrame):
+        """Work on the source features of a streamed chunk,
+        collapsed without the features of the other chunks"""
+        journal = self.open_run_journal()
+        chunk = journal.unprocessed(chunk)
+        self.source_df = self.area_filter.filter_points(chunk)
+        journal.record_many(
+            geometry_hashes(
+                chunk.geometry.loc[chunk.index.difference(self.source_df.index)]
+            ),
+            SKIPPED_BY_AREA,
+        )
+        self.source_df = SourceClusters().collapse(self.source_df)
+        self.match_source_features()
+        self.record_matched_source_features()
+        self.process_unmatched_source_features(total_number_of_rows="?")
+
+    def start_matcher(self):
+        """Start one pool of processes for all the chunks like the pipeline"""
+        if self.processes <= 1 or self.matcher is not None:
+            return
+        if self.osm_index.osm_df is not self.osm_df:
+            self.build_osm_index()
+        self.matcher = ShardedMatcher(
+            osm_layer=self.osm_index.layer, processes=self.processes
+        )
+        self.matcher.start()
+
+    def stop_matcher(self):
+        if self.matcher is not None:
+            self.matcher.close()
+            self.matcher = None
+
+    def process_unmatched_source_features(self, total_number_of_rows):
+        """Iterate the unmatched source_df rows and work on them"""
+        unmatched_df = self.source_df.loc[~self.match_df["matched"].astype(bool)]
+        journal = self.open_run_journal()
+        keys = geometry_hashes(unmatched_df.geometry)
+        for key, (index, row) in zip(keys, unmatched_df.iterrows()):
             if self.number_of_open_notes >= 100:
                 print("Maximum number of open notes reached. Stopping")
+                self.stopped = True
                 break
             # Access individual columns of the row as needed.
             # This is a point object where y=latitude and x=longitude
             source_point: Point = row["geometry"]  # Access the geometry of the feature.
             # NOTE: this ID is not persistent so we can't trust it
-            lm_id = row["objektidentitet"]  # Access an attribute column.
+            lm_id = row[SOURCE_ID_COLUMN]  # Access an attribute column.
             print(
                 f"Working on feature {index}/{total_number_of_rows}: Geometry: {source_point}, ID: {lm_id}"
             )
-            # First check if the point is withing the bounding box
-            if self.bbox.is_valid:
-                if not self.bbox.check_if_point_is_inside(source_point):
-                    logger.debug(
-                        "skipping this point because it is not inside the boundary box"
-                    )
-                    logger.debug(f"See {self.generate_osm_url(source_point)}")
-                    if config.press_enter_to_continue:
-                        input("Press enter to continue")
-                    continue
-                else:
-                    logger.debug(
-                        f"point is inside box, See {self.generate_osm_url(source_point)}"
-                    )
-                    if config.press_enter_to_continue:
-                        input("Press enter to continue")
+            if row.get("cluster_size", 1) > 1:
+                print(
+                    f"It stands for {row['cluster_size']} source features "
+                    f"within {config.source_cluster_radius}m of each other"
+                )
+            # Points outside the bounding boxes were filtered out when loading
             # First calculate distance to notes previously created
             notes_distance_df = self.calculate_distance_to_previously_created_osm_notes(
                 point=source_point
@@ -329,64 +611,29 @@ class GeojsonHandler(BaseModel):
                 print(notes_distance_df)
             if notes_distance_df.empty:
                 print("No note found withing 100m in OSM in the notes.csv file")
-                osm_distance_df = self.calculate_distance_to_osm_features(
-                    point=source_point
-                )
-                if osm_distance_df.empty:
-                    print("No bathing site found withing 100m in OSM")
-                    print(f"See {self.generate_osm_url(source_point)}")
-                    if config.press_enter_to_continue:
+                # The proximity join already ruled out OSM features within 100m
+                print("No bathing site found withing 100m in OSM")
+                print(f"See {self.generate_osm_url(source_point)}")
+                if config.press_enter_to_continue:
+                    input("Press enter to continue")
+                if (
+                    config.upload_to_osm
+                    and self.number_of_open_notes <= config.max_number_of_open_notes
+                ):
+                    print(f"Open notes: {self.number_of_open_notes}")
+                    print("Uploading new note")
+                    note_id = self.upload_note(point=source_point)
+                    if note_id is not None:
+                        journal.record(key, NOTE_CREATED, note_id=note_id)
+                    # When debugging we show the input
+                    if config.press_enter_to_continue or config.debug:
                         input("Press enter to continue")
-                    if (
-                        config.upload_to_osm
-                        and self.number_of_open_notes <= config.max_number_of_open_notes
-                    ):
-                        print(f"Open notes: {self.number_of_open_notes}")
-                        print("Uploading new note")
-                        self.upload_note(point=source_point)
-                        # When debugging we show the input
-                        if config.press_enter_to_continue or config.debug:
-                            input("Press enter to continue")
-                    else:
-                        print(
-                            "100 open notes already exists or upload was skipped in the config"
-                        )
                 else:
-                    print("Found a bathing site already in OSM within 100m")
-                    if config.loglevel == logging.INFO:
-                        print("Found the following bathing sites within 100m in OSM")
-                        print(osm_distance_df.head())
-                    if config.press_enter_to_continue:
-                        input("Press enter to continue")
+                    print(
+                        "100 open notes already exists or upload was skipped in the config"
+                    )
             else:
                 print("A note has already been created for this feature")
-
-    def setup_argparse_and_get_filename(self):
-        parser = ArgumentParser(
-            description="Read and process Geojson files from the command line."
-        )
-        parser.add_argument(
-            "--source-geojson", required=False, help="Source geojson file"
-        )
-        parser.add_argument("--osm-geojson", required=False, help="OSM geojson file")
-        parser.add_argument("--notes-file", required=True, help="Notes csv file to use")
-        parser.add_argument(
-            "--bounding-box",
-            required=False,
-            help="Restrict note creation to a specific area. "
-            "E.g. 10.5389,53.7768,10.9262,53.9574. "
-            "Generate here: http://osm.duschmarke.de/bbox.html",
-        )
-        args = parser.parse_args()
-
-        self.source_geojson = args.source_geojson
-        self.osm_geojson = args.osm_geojson
-        self.notes_file_path = args.notes_file
-        self.bounding_box_string = args.bounding_box
-
-    def print_number_of_closed_and_unhidden_notes(self):
-        self.read_notes_dataframe()
-        if not self.notes_df.empty:
-            # Count rows where both "open" and "hidden" are False
-            count = len(self.notes_df[(self.notes_df['open'] == False) & (self.notes_df['hidden'] == False)])
-            print(f"Number of closed notes that are not hidden: {count}")
+                journal.record(
+                    key, NEAR_NOTE, note_id=notes_distance_df["note_id"].iloc[0]
+                )
@@ -0,0 +1,127 @@
+import logging
+from typing import List, Optional, Tuple
+
+import geopandas
+import numpy
+import shapely
+from pandas import DataFrame
+from pydantic import BaseModel
+from shapely.geometry.base import BaseGeometry
+
+from models.bounding_box import BoundingBox
+from models.exceptions import GeometryError
+
+logger = logging.getLogger(__name__)
+
+
+class AreaFilter(BaseModel):
+    """Restrict the run to one or more bounding boxes and polygon areas
+
+    The filter is pushed down into loading so features outside the areas
+    are never iterated. Points are checked with vectorized masks
+    over their coordinates.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    bounding_boxes: List[BoundingBox] = []
+    polygons: List[BaseGeometry] = []
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def is_valid(self) -> bool:
+        return bool(self.bounding_boxes or self.polygons)
+
+    @staticmethod
+    def parse_bounding_box(bounding_box_string: str) -> BoundingBox:
+        """Parse the format from http://osm.duschmarke.de/bbox.html"""
+        bbox_list = bounding_box_string.split(",")  # x1,y1,x2,y2
+        if not len(bbox_list) == 4:
+            raise GeometryError(
+                f"Not a correct bounding box with x1,y1,x2,y2: {bounding_box_string}"
+            )
+        return BoundingBox(
+            x1=bbox_list[0], y1=bbox_list[1], x2=bbox_list[2], y2=bbox_list[3]
+        )
+
+    @classmethod
+    def from_strings(
+        cls, bounding_box_string: str = "", area_geojson: Optional[str] = None
+    ) -> "AreaFilter":
+        """Create the filter from bounding boxes separated by ;
+        and the polygons in a geojson file"""
+        bounding_boxes = [
+            cls.parse_bounding_box(string.strip())
+            for string in (bounding_box_string or "").split(";")
+            if string.strip()
+        ]
+        polygons = []
+        if area_geojson:
+            polygons = [
+                geometry
+                for geometry in geopandas.read_file(area_geojson).to_crs(
+                    "EPSG:4326"
+                ).geometry
+                if geometry.geom_type in ("Polygon", "MultiPolygon")
+            ]
+            if not polygons:
+                raise GeometryError(f"No polygons found in {area_geojson}")
+        return cls(bounding_boxes=bounding_boxes, polygons=polygons)
+
+    def boxes(self) -> List[BoundingBox]:
+        """Return the bounding boxes and the envelopes of the polygons"""
+        return self.bounding_boxes + [
+            BoundingBox(x1=minx, y1=miny, x2=maxx, y2=maxy)
+            for minx, miny, maxx, maxy in (polygon.bounds for polygon in self.polygons)
+        ]
+
+    def buffered(self, meters: float) -> "AreaFilter":
+        """Return a filter with all areas replaced by boxes grown by meters,
+        used for the OSM features that can match a source feature inside"""
+        return AreaFilter(
+            bounding_boxes=[bbox.buffered(meters) for bbox in self.boxes()]
+        )
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """Return the box around all areas to read from the files"""
+        if not self.is_valid:
+            return None
+        boxes = self.boxes()
+        return (
+            min(bbox.x1 for bbox in boxes),
+            min(bbox.y1 for bbox in boxes),
+            max(bbox.x2 for bbox in boxes),
+            max(bbox.y2 for bbox in boxes),
+        )
+
+    def mask(self, x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+        """Return True for the coordinates inside any of the areas"""
+        mask = numpy.zeros(len(x), dtype=bool)
+        for bbox in self.bounding_boxes:
+            mask |= bbox.mask(x, y)
+        for polygon in self.polygons:
+            mask |= shapely.contains_xy(polygon, x, y)
+        return mask
+
+    def filter_points(self, df: DataFrame) -> DataFrame:
+        """Keep the features with a point inside the areas"""
+        if not self.is_valid or df.empty:
+            return df
+        points = shapely.point_on_surface(df.geometry.values)
+        return df[self.mask(shapely.get_x(points), shapely.get_y(points))]
+
+    def filter_features(self, df: DataFrame) -> DataFrame:
+        """Keep the features with a bounding box intersecting the areas"""
+        if not self.is_valid or df.empty:
+            return df
+        bounds = shapely.bounds(df.geometry.values)
+        mask = numpy.zeros(len(df.index), dtype=bool)
+        for bbox in self.boxes():
+            mask |= (
+                (bounds[:, 0] <= bbox.x2)
+                & (bounds[:, 2] >= bbox.x1)
+                & (bounds[:, 1] <= bbox.y2)
+                & (bounds[:, 3] >= bbox.y1)
+            )
+        return df[mask]
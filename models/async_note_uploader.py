@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import random
+from typing import Iterable, List, Optional, Set
+
+from osmapi import ApiError
+from pydantic import BaseModel, Field
+from shapely import Point
+
+import config
+from models.http_session import is_transient
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+from models.upload_journal import COMMITTED, PENDING, UploadJournal
+
+logger = logging.getLogger(__name__)
+
+
+class UploadReport(BaseModel):
+    uploaded: int = 0
+    # uploaded notes found on the server after a crash or a lost response
+    recovered: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+    def __str__(self):
+        return (
+            f"Uploaded {self.uploaded} notes ({self.recovered} found after "
+            f"a failed attempt), skipped {self.skipped} and {self.failed} failed"
+        )
+
+
+class AsyncNoteUploader(BaseModel):
+    """Create notes with several requests in flight
+
+    All creates share one token bucket and at most max_in_flight of
+    them wait for the API at the same time. The blocking osmapi calls
+    run in threads so no new HTTP dependency is needed.
+
+    Every create is recorded as pending in the journal before it is sent
+    and as committed after the note is in the notes store. Before a
+    pending location is tried again the API is searched for a note with
+    our text at that location so a crash, a lost response or a retry
+    never creates a second note at the same place.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    osmnoteuploader: OsmNoteHandler = OsmNoteHandler()
+    journal: UploadJournal
+    rate_limiter: RateLimiter = Field(
+        default_factory=lambda: RateLimiter(
+            requests_per_second=config.api_requests_per_second
+        )
+    )
+    max_in_flight: int = config.max_uploads_in_flight
+    max_retries: int = 5
+    backoff_seconds: float = 1.0
+    text: str = config.note_text
+    number_of_open_notes: int = 0
+    max_number_of_open_notes: int = config.max_number_of_open_notes
+    # half the side of the box searched for an earlier attempt, about 1m
+    search_distance_degrees: float = 0.00001
+    report: UploadReport = Field(default_factory=UploadReport)
+    in_flight_keys: Set[str] = set()
+    # note ids in the notes store, read on the first commit
+    stored_note_ids: Optional[Set[int]] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    async def call(self, function, *args, **kwargs):
+        """Call the blocking API in a thread when a token is available"""
+        await self.rate_limiter.acquire_async()
+        return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def backoff(self, attempt: int, error: ApiError):
+        # exponential backoff with jitter
+        wait = self.backoff_seconds * 2**attempt * (1 + random.random())
+        logger.info(f"Got {error.status} from the API, retrying in {wait:.1f}s")
+        await asyncio.sleep(wait)
+
+    async def find_existing_note(self, point: Point) -> Optional[int]:
+        """Return the id of a note with our text at the point if there is one"""
+        distance = self.search_distance_degrees
+        for attempt in range(self.max_retries + 1):
+            try:
+                notes = await self.call(
+                    self.osmnoteuploader.client.NotesGet,
+                    point.x - distance,
+                    point.y - distance,
+                    point.x + distance,
+                    point.y + distance,
+                    closed=-1,
+                )
+                break
+            except ApiError as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                await self.backoff(attempt, e)
+        for note in notes:
+            comments = note.get("comments") or []
+            if comments and (comments[0]["text"] or "").strip() == self.text.strip():
+                return int(note["id"])
+        return None
+
+    async def create(self, point: Point) -> Optional[int]:
+        """Create the note and return its id
+
+        Transient errors are retried but only after checking
+        that the failed attempt did not create the note anyway"""
+        # logs in on the first create only, the reads before are anonymous
+        await asyncio.to_thread(self.osmnoteuploader.authenticate)
+        for attempt in range(self.max_retries + 1):
+            try:
+                note = await self.call(
+                    self.osmnoteuploader.client.NoteCreate,
+                    dict(lat=point.y, lon=point.x, text=self.text),
+                )
+                return int(note["id"])
+            except ApiError as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                await self.backoff(attempt, e)
+            note_id = await self.find_existing_note(point)
+            if note_id is not None:
+                self.report.recovered += 1
+                return note_id
+        return None
+
+    def is_stored(self, note_id: int) -> bool:
+        """True when the note is in the notes store
+
+        The ids are read from the store once and kept up to date by commit"""
+        if self.stored_note_ids is None:
+            notes_store = self.osmnoteuploader.notes_store
+            notes_df = None if notes_store is None else notes_store.read_dataframe()
+            self.stored_note_ids = (
+                set()
+                if notes_df is None or notes_df.empty
+                else {int(stored_id) for stored_id in notes_df["note_id"]}
+            )
+        return note_id in self.stored_note_ids
+
+    def commit(self, key: str, point: Point, note_id: int):
+        """Store the note and mark the creation as done
+
+        This runs in the event loop so the stores are never written concurrently"""
+        if not self.is_stored(note_id):
+            self.osmnoteuploader.write_note_information_to_csv(
+                note_id=note_id, point=point
+            )
+            self.stored_note_ids.add(note_id)
+        self.journal.record(key, COMMITTED, point, note_id=note_id)
+        print(f"Note uploaded, see https://www.openstreetmap.org/note/{note_id}")
+
+    def is_full(self) -> bool:
+        """True when the uploaded and in flight notes reach the maximum"""
+        return (
+            self.number_of_open_notes + len(self.in_flight_keys)
+            >= self.max_number_of_open_notes
+        )
+
+    async def upload(self, point: Point, semaphore: asyncio.Semaphore):
+        key = self.journal.key(point)
+        if self.journal.state(key) == COMMITTED or key in self.in_flight_keys:
+            logger.info(f"A note was already uploaded at {key}")
+            self.report.skipped += 1
+            return
+        if self.is_full():
+            logger.info(f"Maximum number of open notes reached, skipping {key}")
+            self.report.skipped += 1
+            return
+        self.in_flight_keys.add(key)
+        try:
+            async with semaphore:
+                note_id = None
+                if self.journal.state(key) == PENDING:
+                    # an earlier run stopped while creating this note
+                    note_id = await self.find_existing_note(point)
+                    if note_id is not None:
+                        self.report.recovered += 1
+                if note_id is None:
+                    self.journal.record(key, PENDING, point)
+                    note_id = await self.create(point)
+            self.commit(key, point, note_id)
+            self.number_of_open_notes += 1
+            self.report.uploaded += 1
+        except ApiError as e:
+            logger.error(f"Could not create a note at {key}: {e}")
+            self.report.failed += 1
+        finally:
+            self.in_flight_keys.discard(key)
+
+    async def upload_all(self, points: Iterable[Point]) -> UploadReport:
+        """Upload while the points come in
+
+        The points are taken in a thread so a producer that blocks,
+        like the queue of the pipeline, does not stall the uploads in flight"""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        tasks: List[asyncio.Task] = []
+        iterator = iter(points)
+        while True:
+            point = await asyncio.to_thread(next, iterator, None)
+            if point is None:
+                break
+            tasks.append(asyncio.create_task(self.upload(point, semaphore)))
+            # let the task claim its key before the next point is scheduled
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return self.report
+
+    def run(self, points: Iterable[Point]) -> UploadReport:
+        """Upload notes at all the points and return the report"""
+        return asyncio.run(self.upload_all(points))
@@ -1,8 +1,12 @@
 import logging
+from typing import Tuple
 
+import numpy
 from pydantic import BaseModel
 from shapely import Point
 
+from models.distance import meters_to_degrees
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,18 +21,29 @@ class BoundingBox(BaseModel):
         x = point.x  # longitude
         y = point.y  # latitude
         # adapted from https://stackoverflow.com/a/61294889
-        if self.x1 < x < self.x2:
-            logger.debug(
-                f"longitude coordinate {x} is inside box "
-                f"defined by x1: {self.x1} and x2: {self.x2}"
-            )
-            if self.y1 < y < self.y2:
-                logger.debug(
-                    f"latitude coordinate {y} is inside box "
-                    f"defined by y1: {self.y1} and y2: {self.y2}"
-                )
-                return True
-        return False
+        return bool(self.x1 < x < self.x2 and self.y1 < y < self.y2)
+
+    def mask(self, x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+        """Vectorized check_if_point_is_inside over
+        arrays of longitudes (x) and latitudes (y)"""
+        return (self.x1 < x) & (x < self.x2) & (self.y1 < y) & (y < self.y2)
+
+    def buffered(self, meters: float) -> "BoundingBox":
+        """Return a bounding box grown by at least meters in every direction"""
+        delta_latitude, delta_longitude = meters_to_degrees(
+            meters, max(abs(self.y1), abs(self.y2))
+        )
+        return BoundingBox(
+            x1=self.x1 - delta_longitude,
+            x2=self.x2 + delta_longitude,
+            y1=self.y1 - delta_latitude,
+            y2=self.y2 + delta_latitude,
+        )
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Return (minx, miny, maxx, maxy) like shapely"""
+        return self.x1, self.y1, self.x2, self.y2
 
     @property
     def is_valid(self):
@@ -0,0 +1,222 @@
+"""The command line interface
+
+Only the standard library and the config are imported here so
+the commands that work on the notes start without the geo libraries."""
+from argparse import ArgumentParser, Namespace
+from typing import List, Optional
+
+import config
+
+# Commands handled by NotesHandler, the others need GeojsonHandler
+NOTES_COMMANDS = {"status", "list", "close", "login"}
+
+
+def create_argument_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Read and process Geojson files from the command line."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    notes_parser = ArgumentParser(add_help=False)
+    notes_parser.add_argument(
+        "--notes-file", required=True, help="Notes csv file to use"
+    )
+    notes_parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.max_workers,
+        help="Number of concurrent requests to the OSM API",
+    )
+    notes_parser.add_argument(
+        "--no-note-cache",
+        action="store_true",
+        help="Always ask the OSM API for the note status "
+        f"instead of using {config.note_cache_file}",
+    )
+    status_parser = ArgumentParser(add_help=False)
+    status_parser.add_argument(
+        "--bulk-status",
+        action="store_true",
+        help="Check the note status with bounding box queries "
+        "instead of one request per note",
+    )
+    status_parser.add_argument(
+        "--full-status-refresh",
+        action="store_true",
+        help="Check the status of all notes, also the ones that cannot change",
+    )
+    area_parser = ArgumentParser(add_help=False)
+    area_parser.add_argument(
+        "--bounding-box",
+        required=False,
+        action="append",
+        help="Restrict note creation to a specific area. "
+        "E.g. 10.5389,53.7768,10.9262,53.9574. "
+        "Generate here: http://osm.duschmarke.de/bbox.html. "
+        "Can be given multiple times",
+    )
+    area_parser.add_argument(
+        "--area-geojson",
+        required=False,
+        help="Restrict note creation to the polygons in this geojson file",
+    )
+    osm_parser = ArgumentParser(add_help=False)
+    osm_parser.add_argument(
+        "--osm-tag",
+        action="append",
+        help="Fetch the OSM features with this tag into the tiled cache "
+        "instead of reading --osm-geojson. E.g. leisure=bathing_place. "
+        "Can be given multiple times",
+    )
+    osm_parser.add_argument(
+        "--osm-pbf",
+        required=False,
+        help="Read the --osm-tag features from this .osm.pbf extract "
+        f"instead of {config.overpass_url}",
+    )
+    geojson_parser = ArgumentParser(
+        add_help=False, parents=[area_parser, osm_parser]
+    )
+    geojson_parser.add_argument(
+        "--source-geojson", required=True, help="Source geojson file"
+    )
+    geojson_parser.add_argument("--osm-geojson", help="OSM geojson file")
+    geojson_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the geojson files in chunks instead of loading them "
+        "completely. Supports FeatureCollections and GeoJSONSeq",
+    )
+    geojson_parser.add_argument(
+        "--no-frame-cache",
+        action="store_true",
+        help="Parse the geojson files every time instead of caching "
+        f"the parsed frames in {config.frame_cache_directory}",
+    )
+    geojson_parser.add_argument(
+        "--refresh-frame-cache",
+        action="store_true",
+        help="Parse the geojson files again and replace their cached frames",
+    )
+    geojson_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only match the source features added or moved since the last "
+        "run, compared with its snapshot in <notes file>.snapshot",
+    )
+    geojson_parser.add_argument(
+        "--flag-removed",
+        action="store_true",
+        help="With --incremental print the open notes near "
+        "source features that were removed",
+    )
+    geojson_parser.add_argument(
+        "--processes",
+        type=int,
+        default=config.processes,
+        help="Number of processes matching the source features against OSM",
+    )
+    matches_parser = ArgumentParser(add_help=False)
+    matches_parser.add_argument(
+        "--matches-file",
+        default="matches.csv",
+        help="Csv file with the source features without an OSM feature nearby",
+    )
+    plan_parser = ArgumentParser(add_help=False)
+    plan_parser.add_argument(
+        "--plan-file",
+        default="plan.csv",
+        help="Csv file with the candidates to upload notes for",
+    )
+    in_flight_parser = ArgumentParser(add_help=False)
+    in_flight_parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=config.max_uploads_in_flight,
+        help="Number of notes created at the same time",
+    )
+    subparsers.add_parser(
+        "status",
+        parents=[notes_parser, status_parser],
+        help="Check and print the status of the notes",
+    )
+    subparsers.add_parser(
+        "list", parents=[notes_parser], help="List the URLs of the open notes"
+    )
+    close_parser = subparsers.add_parser(
+        "close", parents=[notes_parser], help="Close all open notes"
+    )
+    close_parser.add_argument(
+        "--close-comment",
+        default=config.close_comment,
+        help="Comment used when closing notes",
+    )
+    close_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be closed",
+    )
+    subparsers.add_parser(
+        "login",
+        help="Log in to OSM and store the token for the runs that write notes",
+    )
+    iterate_parser = subparsers.add_parser(
+        "iterate",
+        parents=[notes_parser, status_parser, geojson_parser],
+        help="Iterate the source features interactively and upload notes",
+    )
+    iterate_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the source features with an outcome in "
+        "<notes file>.run.csv from the last run",
+    )
+    subparsers.add_parser(
+        "match",
+        parents=[notes_parser, geojson_parser, matches_parser],
+        help="Write the source features without an OSM feature nearby",
+    )
+    subparsers.add_parser(
+        "plan",
+        parents=[notes_parser, matches_parser, plan_parser],
+        help="Write the matched source features without a note nearby "
+        "to a plan file for review",
+    )
+    subparsers.add_parser(
+        "upload",
+        parents=[notes_parser, status_parser, plan_parser, in_flight_parser],
+        help="Upload notes for the candidates in the plan file",
+    )
+    subparsers.add_parser(
+        "pipeline",
+        parents=[
+            notes_parser,
+            status_parser,
+            geojson_parser,
+            plan_parser,
+            in_flight_parser,
+        ],
+        help="Match, plan and upload concurrently without asking anything",
+    )
+    subparsers.add_parser(
+        "ingest",
+        parents=[area_parser, osm_parser],
+        help="Fetch the stale tiles of the --osm-tag features into the cache",
+    )
+    return parser
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> Namespace:
+    parser = create_argument_parser()
+    args = parser.parse_args(arguments)
+    if hasattr(args, "osm_tag"):
+        if args.command == "ingest" and not args.osm_tag:
+            parser.error("ingest needs --osm-tag")
+        if hasattr(args, "osm_geojson") and (
+            bool(args.osm_geojson) == bool(args.osm_tag)
+        ):
+            parser.error("give either --osm-geojson or --osm-tag")
+    if getattr(args, "incremental", False) and args.stream:
+        parser.error("--incremental needs the whole source, leave out --stream")
+    if getattr(args, "flag_removed", False) and not args.incremental:
+        parser.error("--flag-removed needs --incremental")
+    return args
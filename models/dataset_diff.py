@@ -0,0 +1,152 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy
+import pandas
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
+from pandas import DataFrame
+from pydantic import BaseModel
+
+import config
+from models.frame_files import FRAME_SUFFIX, read_frame, write_frame
+from models.run_journal import geometry_hashes
+
+logger = logging.getLogger(__name__)
+
+
+class DiffResult(BaseModel):
+    """The features of the new release that need matching
+    and the ones of the last release that disappeared"""
+
+    added: DataFrame = DataFrame()
+    moved: DataFrame = DataFrame()
+    removed: DataFrame = DataFrame()
+    unchanged: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def changed(self) -> DataFrame:
+        """The added and moved features in the order of the new release"""
+        if self.moved.empty:
+            return self.added
+        return pandas.concat([self.added, self.moved]).sort_index()
+
+    def __str__(self):
+        return (
+            f"{len(self.added.index)} added, {len(self.moved.index)} moved, "
+            f"{len(self.removed.index)} removed and {self.unchanged} unchanged "
+            f"source features since the last run"
+        )
+
+
+class DatasetDiff(BaseModel):
+    """Compare a release of the source dataset with the previous one
+
+    The source has no stable ids so the features are paired by geometry.
+    Identical geometries (rounded like the run journal keys) are paired
+    by their hash without any geometry operations. The rest are paired
+    one to one with the closest previous feature found in an STRtree,
+    measured with the Hausdorff distance in a local metric CRS:
+    * within tolerance the feature is unchanged
+    * within max_move it moved
+    * otherwise it was added
+    The previous features left without a partner were removed."""
+
+    previous_df: DataFrame
+    current_df: DataFrame
+    tolerance: float = config.diff_tolerance_meters
+    max_move: float = config.diff_max_move_meters
+    # estimated from the current features when not given
+    metric_crs: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def pair_identical(self):
+        """Return the positions of the current and previous features
+        without an identical partner"""
+        previous_positions: Dict[str, List[int]] = defaultdict(list)
+        for position, key in enumerate(geometry_hashes(self.previous_df.geometry)):
+            previous_positions[key].append(position)
+        paired_previous = numpy.zeros(len(self.previous_df.index), dtype=bool)
+        unpaired_current = []
+        for position, key in enumerate(geometry_hashes(self.current_df.geometry)):
+            positions = previous_positions.get(key)
+            if positions:
+                paired_previous[positions.pop()] = True
+            else:
+                unpaired_current.append(position)
+        return (
+            numpy.array(unpaired_current, dtype=int),
+            numpy.flatnonzero(~paired_previous),
+        )
+
+    def project(self, df: DataFrame, positions: numpy.ndarray) -> numpy.ndarray:
+        geometries = GeoSeries(
+            df.geometry.values[positions], crs=getattr(df, "crs", None) or "EPSG:4326"
+        )
+        if self.metric_crs is None:
+            self.metric_crs = (
+                GeoSeries(self.current_df.geometry.values, crs=geometries.crs)
+                .estimate_utm_crs()
+                .to_string()
+            )
+        return geometries.to_crs(self.metric_crs).values
+
+    def diff(self) -> DiffResult:
+        current, previous = self.pair_identical()
+        moved = numpy.zeros(len(current), dtype=bool)
+        paired_current = numpy.zeros(len(current), dtype=bool)
+        paired_previous = numpy.zeros(len(previous), dtype=bool)
+        if len(current) and len(previous):
+            current_geometries = self.project(self.current_df, current)
+            previous_geometries = self.project(self.previous_df, previous)
+            tree = shapely.STRtree(previous_geometries)
+            current_pairs, previous_pairs = tree.query(
+                current_geometries, predicate="dwithin", distance=self.max_move
+            )
+            distances = shapely.hausdorff_distance(
+                current_geometries[current_pairs], previous_geometries[previous_pairs]
+            )
+            # the closest pairs first, ties in the order of the releases
+            for pair in numpy.argsort(distances, kind="stable"):
+                distance = distances[pair]
+                if distance > self.max_move:
+                    break
+                i, j = current_pairs[pair], previous_pairs[pair]
+                if paired_current[i] or paired_previous[j]:
+                    continue
+                paired_current[i] = paired_previous[j] = True
+                moved[i] = distance > self.tolerance
+        added = current[~paired_current]
+        return DiffResult(
+            added=self.current_df.iloc[added],
+            moved=self.current_df.iloc[current[moved]],
+            removed=self.previous_df.iloc[previous[~paired_previous]],
+            unchanged=int(len(self.current_df.index) - len(added) - moved.sum()),
+        )
+
+
+class SourceSnapshot(BaseModel):
+    """The source features processed by the last run"""
+
+    file_path: str
+
+    @classmethod
+    def for_notes_file(cls, notes_file_path: str) -> "SourceSnapshot":
+        return cls(file_path=f"{notes_file_path}.snapshot{FRAME_SUFFIX}")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def read(self) -> GeoDataFrame:
+        return read_frame(self.file_path)
+
+    def write(self, df: GeoDataFrame) -> None:
+        write_frame(GeoDataFrame(df), self.file_path)
+        logger.info(f"Stored {len(df.index)} source features in {self.file_path}")
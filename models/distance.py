@@ -0,0 +1,130 @@
+"""Vectorized distances in meters between WGS84 coordinates
+
+The spherical kernels are orders of magnitude faster than a geodesic solve
+per pair but differ from it by up to about 0.5%. within_radius recomputes
+the pairs close to the radius with geopy so the decisions are the same
+as measuring every pair with geopy.distance.distance."""
+import logging
+import math
+from typing import Callable, Tuple
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# Mean radius of the WGS84 ellipsoid
+EARTH_RADIUS = 6_371_008.8
+# Pairs within this fraction of the radius from it are measured with geopy.
+# Covers the deviation of the sphere from the ellipsoid with a margin
+# and the equirectangular approximation at short distances.
+FALLBACK_MARGIN = 0.01
+
+# Shortest length of one degree of latitude on the WGS84 ellipsoid (at the equator)
+METERS_PER_DEGREE_LATITUDE = 110_574
+# Length of one degree of longitude at the equator on the WGS84 ellipsoid
+METERS_PER_DEGREE_LONGITUDE = 111_320
+
+
+def meters_to_degrees(meters: float, latitude: float) -> Tuple[float, float]:
+    """Return (latitude degrees, longitude degrees) that are at least
+    meters long around the latitude"""
+    # 10% margin to be on the safe side of the ellipsoid approximations
+    meters = meters * 1.1
+    delta_latitude = meters / METERS_PER_DEGREE_LATITUDE
+    # The longitude degrees shrink towards the poles so use the latitude
+    # closest to the pole within the envelope
+    latitude = min(abs(latitude) + delta_latitude, 89.9)
+    delta_longitude = meters / (
+        METERS_PER_DEGREE_LONGITUDE * math.cos(math.radians(latitude))
+    )
+    return delta_latitude, delta_longitude
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2) -> numpy.ndarray:
+    """Great circle distance on the sphere"""
+    latitude1, longitude1, latitude2, longitude2 = (
+        numpy.radians(numpy.asarray(value, dtype=float))
+        for value in (latitude1, longitude1, latitude2, longitude2)
+    )
+    a = (
+        numpy.sin((latitude2 - latitude1) / 2) ** 2
+        + numpy.cos(latitude1)
+        * numpy.cos(latitude2)
+        * numpy.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+
+
+def equirectangular(latitude1, longitude1, latitude2, longitude2) -> numpy.ndarray:
+    """Distance on a local flat projection, accurate for short distances"""
+    latitude1, longitude1, latitude2, longitude2 = (
+        numpy.radians(numpy.asarray(value, dtype=float))
+        for value in (latitude1, longitude1, latitude2, longitude2)
+    )
+    x = (longitude2 - longitude1) * numpy.cos((latitude1 + latitude2) / 2)
+    y = latitude2 - latitude1
+    return EARTH_RADIUS * numpy.hypot(x, y)
+
+
+def geodesic(latitude1, longitude1, latitude2, longitude2) -> numpy.ndarray:
+    """Distance on the WGS84 ellipsoid with geopy, one pair at a time"""
+    # geopy is only imported when a pair is close to the radius
+    from geopy.distance import distance
+
+    latitude1, longitude1, latitude2, longitude2 = numpy.broadcast_arrays(
+        *(
+            numpy.asarray(value, dtype=float)
+            for value in (latitude1, longitude1, latitude2, longitude2)
+        )
+    )
+    return numpy.array(
+        [
+            distance((a, b), (c, d)).meters
+            for a, b, c, d in zip(
+                latitude1.ravel(),
+                longitude1.ravel(),
+                latitude2.ravel(),
+                longitude2.ravel(),
+            )
+        ],
+        dtype=float,
+    ).reshape(latitude1.shape)
+
+
+def within_radius(
+    latitude1,
+    longitude1,
+    latitude2,
+    longitude2,
+    radius: float,
+    kernel: Callable = haversine,
+) -> numpy.ndarray:
+    """Return the distances with the pairs near the radius measured with geopy
+
+    Comparing the result with <= radius gives the same answer
+    as geopy for every pair."""
+    distances = numpy.atleast_1d(kernel(latitude1, longitude1, latitude2, longitude2))
+    near = numpy.abs(distances - radius) <= radius * FALLBACK_MARGIN
+    if near.any():
+        latitude1, longitude1, latitude2, longitude2 = (
+            numpy.broadcast_to(numpy.asarray(value, dtype=float), distances.shape)
+            for value in (latitude1, longitude1, latitude2, longitude2)
+        )
+        distances = distances.copy()
+        distances[near] = geodesic(
+            latitude1[near], longitude1[near], latitude2[near], longitude2[near]
+        )
+    return distances
+
+
+def distance_meters(
+    latitude1: float,
+    longitude1: float,
+    latitude2: float,
+    longitude2: float,
+    radius: float = 100,
+) -> float:
+    """Scalar within_radius"""
+    return float(
+        within_radius(latitude1, longitude1, latitude2, longitude2, radius=radius)[0]
+    )
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Callable, List, Optional
+
+from geopandas import GeoDataFrame
+from pydantic import BaseModel
+
+import config
+from models.frame_files import FRAME_SUFFIX, read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache(BaseModel):
+    """On-disk cache of the parsed input files
+
+    An entry is keyed on the path, size and modification time of the
+    file and the projected columns so a changed file is parsed again.
+    The directory is kept below max_megabytes by removing the least
+    recently used entries, a hit marks an entry as used."""
+
+    directory: str = config.frame_cache_directory
+    max_megabytes: float = config.frame_cache_max_megabytes
+
+    def key(self, file_path: str, columns: List[str]) -> str:
+        stat = os.stat(file_path)
+        return hashlib.sha1(
+            json.dumps(
+                [os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, columns]
+            ).encode()
+        ).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{FRAME_SUFFIX}")
+
+    def get(self, file_path: str, columns: List[str]) -> Optional[GeoDataFrame]:
+        entry_path = self.entry_path(self.key(file_path, columns))
+        if not os.path.exists(entry_path):
+            return None
+        os.utime(entry_path)
+        logger.info(f"Loading the cached frame of {file_path}")
+        return read_frame(entry_path)
+
+    def put(self, file_path: str, columns: List[str], df: GeoDataFrame) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_frame(df, self.entry_path(self.key(file_path, columns)))
+        self.evict()
+
+    def invalidate(self, file_path: str, columns: List[str]) -> None:
+        entry_path = self.entry_path(self.key(file_path, columns))
+        if os.path.exists(entry_path):
+            os.remove(entry_path)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries above the size cap,
+        the newest entry is always kept"""
+        entries = sorted(
+            (
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(FRAME_SUFFIX)
+            ),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        total = 0.0
+        for position, entry_path in enumerate(entries):
+            total += os.path.getsize(entry_path) / 1024**2
+            if position and total > self.max_megabytes:
+                logger.debug(f"Evicting {entry_path}")
+                os.remove(entry_path)
+
+    def read(
+        self,
+        file_path: str,
+        columns: List[str],
+        parse: Callable[[], GeoDataFrame],
+        refresh: bool = False,
+    ) -> GeoDataFrame:
+        """Return the cached frame or parse and cache it"""
+        df = None if refresh else self.get(file_path, columns)
+        if df is None:
+            df = parse()
+            self.put(file_path, columns, df)
+        return df
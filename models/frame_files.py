@@ -0,0 +1,38 @@
+"""Store geodataframes in local cache files
+
+GeoParquet is used when pyarrow is installed, otherwise the
+frames are pickled. Both keep the geometries and the CRS."""
+import logging
+import os
+
+import geopandas
+import pandas
+from geopandas import GeoDataFrame
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET = True
+except ImportError:
+    PARQUET = False
+
+FRAME_SUFFIX = ".parquet" if PARQUET else ".pickle"
+
+
+def write_frame(df: GeoDataFrame, file_path: str) -> None:
+    """Write the frame atomically so readers never see half a file"""
+    temporary_path = f"{file_path}.tmp"
+    if PARQUET:
+        df.to_parquet(temporary_path)
+    else:
+        df.to_pickle(temporary_path)
+    os.replace(temporary_path, file_path)
+
+
+def read_frame(file_path: str) -> GeoDataFrame:
+    if PARQUET:
+        # the columns are read from the page cache without copying the file
+        return geopandas.read_parquet(file_path, memory_map=True)
+    return pandas.read_pickle(file_path)
@@ -0,0 +1,204 @@
+import json
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import geopandas
+import pandas
+import shapely
+from geopandas import GeoDataFrame
+from pydantic import BaseModel
+
+from models.frame_cache import FrameCache
+
+logger = logging.getLogger(__name__)
+
+# GeoJSON text sequences (RFC 8142) start every record with this character
+RECORD_SEPARATOR = "\x1e"
+
+
+class JsonStream:
+    """Incremental JSON reader over a text file
+
+    Only one buffer of buffer_size characters plus the current
+    value is kept in memory."""
+
+    def __init__(self, file, buffer_size: int = 1 << 20):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = ""
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        """Read more data into the buffer, return False at the end of the file"""
+        data = self.file.read(self.buffer_size)
+        if not data:
+            return False
+        self.buffer = self.buffer[self.position :] + data
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next character which is not whitespace or an empty string"""
+        while True:
+            while self.position < len(self.buffer):
+                character = self.buffer[self.position]
+                if character in " \t\r\n" + RECORD_SEPARATOR:
+                    self.position += 1
+                else:
+                    return character
+            if not self.fill():
+                return ""
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(
+                f"Expected {character!r} but got {self.peek()!r} in {self.file.name}"
+            )
+        self.position += 1
+
+    def decode(self) -> Any:
+        """Decode the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self.fill():
+                # a number might continue in the next block
+                continue
+            self.position = end
+            return value
+
+
+class GeojsonStreamReader(BaseModel):
+    """Read features from a GeoJSON FeatureCollection or
+    a GeoJSONSeq (newline delimited) file without loading the whole file
+
+    Only the geometry and the properties in columns are kept and
+    the features are returned in chunks of chunk_size features."""
+
+    file_path: str
+    columns: List[str] = []
+    chunk_size: int = 10000
+    buffer_size: int = 1 << 20
+
+    def iterate_features(self) -> Iterator[Dict[str, Any]]:
+        with open(self.file_path, encoding="utf-8") as file:
+            stream = JsonStream(file, buffer_size=self.buffer_size)
+            head: Dict[str, Any] = {}
+            # walk the top level keys of the first object and
+            # stream the features array when we get to it
+            stream.expect("{")
+            while stream.peek() != "}":
+                key = stream.decode()
+                stream.expect(":")
+                if key == "features":
+                    yield from self.iterate_array(stream)
+                else:
+                    # small values like type, crs and name
+                    head[key] = stream.decode()
+                if stream.peek() == ",":
+                    stream.position += 1
+            stream.expect("}")
+            if head.get("type") == "Feature":
+                # GeoJSONSeq, the first object was a feature
+                yield head
+                while stream.peek():
+                    yield stream.decode()
+
+    @staticmethod
+    def iterate_array(stream: JsonStream) -> Iterator[Any]:
+        stream.expect("[")
+        while stream.peek() != "]":
+            yield stream.decode()
+            if stream.peek() == ",":
+                stream.position += 1
+        stream.expect("]")
+
+    def iterate_chunks(self) -> Iterator[GeoDataFrame]:
+        """Yield GeoDataFrames with the projected columns
+
+        The index continues between chunks like the index of
+        a dataframe read in one go"""
+        offset = 0
+        geometries: List[Optional[str]] = []
+        properties: Dict[str, List[Any]] = {column: [] for column in self.columns}
+        for feature in self.iterate_features():
+            geometry = feature.get("geometry")
+            geometries.append(json.dumps(geometry) if geometry else None)
+            feature_properties = feature.get("properties") or {}
+            for column in self.columns:
+                properties[column].append(feature_properties.get(column))
+            if len(geometries) == self.chunk_size:
+                yield self.to_geodataframe(geometries, properties, offset)
+                offset += len(geometries)
+                geometries = []
+                properties = {column: [] for column in self.columns}
+        if geometries or not offset:
+            yield self.to_geodataframe(geometries, properties, offset)
+
+    @staticmethod
+    def to_geodataframe(
+        geometries: List[Optional[str]], properties: Dict[str, List[Any]], offset: int
+    ) -> GeoDataFrame:
+        return GeoDataFrame(
+            properties,
+            geometry=shapely.from_geojson(geometries) if geometries else [],
+            index=pandas.RangeIndex(offset, offset + len(geometries)),
+            crs="EPSG:4326",
+        )
+
+    def read(self, filter_function: Optional[Callable] = None) -> GeoDataFrame:
+        """Read all features with only the projected columns
+
+        filter_function is applied to every chunk so
+        only the kept features stay in memory"""
+        chunks = self.iterate_chunks()
+        if filter_function is not None:
+            chunks = (filter_function(chunk) for chunk in chunks)
+        return pandas.concat(chunks)
+
+
+def read_geojson(
+    file_path: str,
+    columns: List[str],
+    stream: bool,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    filter_function: Optional[Callable] = None,
+    cache: Optional[FrameCache] = None,
+    refresh_cache: bool = False,
+) -> GeoDataFrame:
+    """Read a whole file either streaming with only the columns or with geopandas
+
+    bbox is used by geopandas to only read the features in the box
+    and filter_function filters the features after reading.
+
+    With a cache the whole file is parsed once with only the columns
+    and the bbox and filter_function are applied to the cached frame."""
+    if cache is not None:
+
+        def parse() -> GeoDataFrame:
+            if stream:
+                return GeojsonStreamReader(file_path=file_path, columns=columns).read()
+            df = geopandas.read_file(file_path)
+            return df[[column for column in columns if column in df] + ["geometry"]]
+
+        df = cache.read(file_path, columns, parse, refresh=refresh_cache)
+        if bbox is not None:
+            minx, miny, maxx, maxy = bbox
+            df = df.cx[minx:maxx, miny:maxy]
+    elif stream:
+        df = GeojsonStreamReader(file_path=file_path, columns=columns).read(
+            filter_function=filter_function
+        )
+        # already filtered chunk by chunk
+        filter_function = None
+    else:
+        df = geopandas.read_file(file_path, bbox=bbox)
+    if filter_function is not None:
+        df = filter_function(df)
+    return df
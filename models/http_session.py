@@ -0,0 +1,92 @@
+import logging
+from typing import Dict, Optional
+
+import requests
+from osmapi import ApiError, OsmApi
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+logger = logging.getLogger(__name__)
+
+OSM_API_URL = "https://www.openstreetmap.org"
+
+# One anonymous session per pool size
+anonymous_sessions: Dict[int, requests.Session] = {}
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for the errors worth retrying: timeouts and lost connections
+    (status 0 from osmapi or a requests error), 429 and 5xx"""
+    if isinstance(error, requests.RequestException):
+        return True
+    return isinstance(error, ApiError) and (
+        error.status in (0, 429) or error.status >= 500
+    )
+
+
+def create_session(
+    pool_size: int = config.max_workers, auth: Optional[requests.auth.AuthBase] = None
+) -> requests.Session:
+    """Create a keep-alive session with a connection pool for the OSM API
+
+    The pool holds a connection for each worker so concurrent requests
+    never wait for or throw away connections. Only idempotent requests are
+    retried by the adapter, creating a note is never sent twice from here."""
+    session = requests.Session()
+    retry = Retry(
+        total=config.http_retries,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        # 429 is handled by the rate limited callers
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max(pool_size, 1), max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "User-Agent": config.user_agent,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        }
+    )
+    session.auth = auth
+    return session
+
+
+def anonymous_session(pool_size: int = config.max_workers) -> requests.Session:
+    """Return the pooled session shared by all unauthenticated reads"""
+    if pool_size not in anonymous_sessions:
+        logger.debug(f"Creating an anonymous session with {pool_size} connections")
+        anonymous_sessions[pool_size] = create_session(pool_size=pool_size)
+    return anonymous_sessions[pool_size]
+
+
+def create_client(
+    session: Optional[requests.Session] = None,
+    api: str = OSM_API_URL,
+    pool_size: int = config.max_workers,
+) -> OsmApi:
+    """Create an OsmApi client using the pooled session with timeouts
+
+    Without a session the shared anonymous session is used
+    so status reads never trigger the OAuth flow.
+
+    osmapi sends every request once. The adapter of the session retries
+    the idempotent ones and the callers retry the rest, a create answered
+    with 5xx might have succeeded so it is only sent again after
+    checking for the note."""
+    client = OsmApi(
+        api=api,
+        created_by=config.user_agent,
+        session=session if session is not None else anonymous_session(pool_size),
+        timeout=(config.http_connect_timeout, config.http_read_timeout),
+    )
+    client._session.MAX_RETRY_LIMIT = 1
+    return client
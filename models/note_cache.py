@@ -0,0 +1,204 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from osmapi import ApiError, OsmApi
+from osmapi.dom import DomParseNote, OsmResponseToDom
+from pydantic import BaseModel, Field
+
+import config
+from models.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStatistics(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    # stale entries confirmed unchanged with a 304
+    revalidated: int = 0
+
+    def __str__(self):
+        total = self.hits + self.misses + self.revalidated
+        return (
+            f"Note cache: {self.hits} hits, {self.revalidated} revalidated "
+            f"and {self.misses} misses of {total} lookups"
+        )
+
+
+class NoteCache(BaseModel):
+    """On-disk cache of the parsed notes from NoteGet keyed by note id
+
+    Fresh entries are returned without a request. Stale entries are
+    revalidated with If-None-Match/If-Modified-Since when the API sent
+    an ETag or Last-Modified header, a 304 only refreshes the entry.
+    At most max_entries notes are kept, the least recently used are evicted.
+
+    A hidden note is cached with note=None."""
+
+    file_path: str = config.note_cache_file
+    ttl: timedelta = timedelta(hours=config.note_cache_ttl_hours)
+    max_entries: int = config.note_cache_max_entries
+    statistics: CacheStatistics = Field(default_factory=CacheStatistics)
+    lock: Any = None
+
+    def model_post_init(self, __context):
+        # the workers share the cache
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.file_path, timeout=30)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "note_id INTEGER PRIMARY KEY, note TEXT, etag TEXT, "
+            "last_modified TEXT, fetched_at REAL, accessed_at REAL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS notes_accessed_at ON notes (accessed_at)"
+        )
+        return connection
+
+    def get(self, note_id: int) -> Optional[Dict[str, Any]]:
+        """Return the cache entry and mark it as used"""
+        with self.lock:
+            connection = self.connect()
+            try:
+                with connection:
+                    row = connection.execute(
+                        "SELECT note, etag, last_modified, fetched_at "
+                        "FROM notes WHERE note_id = ?",
+                        (note_id,),
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    connection.execute(
+                        "UPDATE notes SET accessed_at = ? WHERE note_id = ?",
+                        (time.time(), note_id),
+                    )
+            finally:
+                connection.close()
+        note, etag, last_modified, fetched_at = row
+        return dict(
+            note=json.loads(note),
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+        )
+
+    def put(
+        self,
+        note_id: int,
+        note: Optional[Dict[str, Any]],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Store the note and evict the least recently used entries"""
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            note_id,
+                            json.dumps(note, default=str),
+                            etag,
+                            last_modified,
+                            now,
+                            now,
+                        ),
+                    )
+                    connection.execute(
+                        "DELETE FROM notes WHERE note_id IN (SELECT note_id "
+                        "FROM notes ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+            finally:
+                connection.close()
+
+    def touch(self, note_id: int) -> None:
+        """Mark a revalidated entry as fresh"""
+        with self.lock:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "UPDATE notes SET fetched_at = ? WHERE note_id = ?",
+                        (time.time(), note_id),
+                    )
+            finally:
+                connection.close()
+
+    def invalidate(self, note_id: int) -> None:
+        """Forget a note we changed ourselves, e.g. by closing it"""
+        with self.lock:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "DELETE FROM notes WHERE note_id = ?", (note_id,)
+                    )
+            finally:
+                connection.close()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            setattr(self.statistics, name, getattr(self.statistics, name) + 1)
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl.total_seconds()
+
+    def fetch(
+        self,
+        client: OsmApi,
+        note_id: int,
+        bypass: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Return the note like NoteGet or None if it is hidden
+
+        With bypass the API is always asked and the answer is cached.
+        Only the requests to the API wait for the rate limiter."""
+        entry = None if bypass else self.get(note_id)
+        if entry is not None and self.is_fresh(entry):
+            self.count("hits")
+            return entry["note"]
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        response = client.http_session.get(
+            f"{client._api}/api/0.6/notes/{note_id}",
+            headers=headers,
+            timeout=client._timeout,
+        )
+        if response.status_code == 304 and entry is not None:
+            self.count("revalidated")
+            self.touch(note_id)
+            return entry["note"]
+        self.count("misses")
+        if response.status_code == 410:
+            # hidden by a moderator
+            note = None
+        elif response.status_code == 200:
+            note = DomParseNote(
+                OsmResponseToDom(response.content, tag="note", single=True)
+            )
+        else:
+            raise ApiError(response.status_code, response.reason, response.content)
+        self.put(
+            note_id,
+            note,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        return note
@@ -0,0 +1,104 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from osmapi import ApiError
+from pydantic import BaseModel, Field
+from rich.progress import Progress
+
+import config
+from models.note_status_refresher import NoteStatusRefresher
+from models.notes_store import NotesStore
+
+logger = logging.getLogger(__name__)
+
+
+class CloseReport(BaseModel):
+    closed: int = 0
+    already_closed: int = 0
+    failed: int = 0
+
+    def __str__(self):
+        return (
+            f"Closed {self.closed} notes, {self.already_closed} were already "
+            f"closed or hidden and {self.failed} failed"
+        )
+
+
+class NoteCloser(BaseModel):
+    """Close all open notes in the store
+
+    The open notes are first verified against the API so we only close
+    notes that are actually open. Every result is checkpointed into the
+    notes store as soon as it arrives so a re-run picks up where
+    the previous one stopped.
+
+    The closing requests share the rate limiter and retries of the refresher."""
+
+    notes_store: NotesStore
+    refresher: NoteStatusRefresher = Field(default_factory=NoteStatusRefresher)
+    comment: str = config.close_comment
+    dry_run: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def checkpoint(self, note_id: int, is_open: bool, is_hidden: bool = False):
+        now = str(datetime.now())
+        self.notes_store.update(
+            note_id,
+            open=is_open,
+            hidden=is_hidden,
+            last_checked=now,
+            status_changed_at=now,
+        )
+
+    def close(self, note_id: int) -> int:
+        self.refresher.call_with_retries(
+            self.refresher.osmnoteuploader.close, note_id=note_id, comment=self.comment
+        )
+        return note_id
+
+    def close_open_notes(self) -> CloseReport:
+        report = CloseReport()
+        notes_df = self.notes_store.read_dataframe()
+        if notes_df.empty:
+            return report
+        open_df = notes_df[notes_df["open"].astype(bool)]
+        print(f"Verifying the status of {len(open_df.index)} open notes")
+        statuses = self.refresher.refresh_bulk(notes_df=open_df)
+        # the notes without a status are left open for the next run
+        report.failed += len(set(open_df["note_id"].astype(int)) - set(statuses))
+        note_ids = []
+        for note_id, status in statuses.items():
+            if status.open:
+                note_ids.append(note_id)
+            else:
+                report.already_closed += 1
+                if not self.dry_run:
+                    self.checkpoint(note_id, is_open=False, is_hidden=status.hidden)
+        if self.dry_run:
+            print(f"Would close {len(note_ids)} notes with the comment: {self.comment}")
+            for note_id in sorted(note_ids):
+                print(f"https://www.openstreetmap.org/note/{note_id}")
+            return report
+        with Progress(disable=not self.refresher.show_progress) as progress:
+            task = progress.add_task("Closing notes", total=len(note_ids))
+            with ThreadPoolExecutor(max_workers=self.refresher.max_workers) as executor:
+                futures = {
+                    executor.submit(self.close, note_id): note_id
+                    for note_id in note_ids
+                }
+                for future in as_completed(futures):
+                    note_id = futures[future]
+                    try:
+                        future.result()
+                    except ApiError as e:
+                        logger.error(f"Could not close note {note_id}: {e}")
+                        report.failed += 1
+                    else:
+                        # checkpoint in the main thread as results arrive
+                        self.checkpoint(note_id, is_open=False)
+                        report.closed += 1
+                    progress.advance(task)
+        return report
@@ -0,0 +1,281 @@
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+import pandas
+import requests
+from osmapi import ApiError
+from pandas import DataFrame, Series
+from pydantic import BaseModel, Field
+from rich.progress import Progress
+
+import config
+from models.http_session import is_transient
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class NoteStatus(BaseModel):
+    note_id: int
+    open: bool
+    hidden: bool
+
+
+class RefreshReport(BaseModel):
+    skipped: int = 0
+    fetched: int = 0
+    changed: int = 0
+    # kept with their old status and checked again in the next run
+    failed: int = 0
+
+    def __str__(self):
+        return (
+            f"Skipped {self.skipped} notes, fetched {self.fetched} "
+            f"and {self.changed} changed status, {self.failed} failed"
+        )
+
+
+class NoteStatusRefresher(BaseModel):
+    """Refresh the status of many notes concurrently
+
+    Every note is fetched once and both open and hidden are derived from
+    that single response. All workers share one rate limiter and
+    transient errors (timeouts, lost connections, 429 and 5xx) are
+    retried with exponential backoff. A note that still fails is left
+    out of the result instead of stopping the others.
+
+    In bulk mode the notes are looked up with bounding box queries
+    instead since our notes cluster geographically."""
+
+    osmnoteuploader: OsmNoteHandler = OsmNoteHandler()
+    max_workers: int = config.max_workers
+    rate_limiter: RateLimiter = Field(
+        default_factory=lambda: RateLimiter(
+            requests_per_second=config.api_requests_per_second
+        )
+    )
+    max_retries: int = 5
+    backoff_seconds: float = 1.0
+    show_progress: bool = True
+    # Size of the tiles for the bulk mode in degrees.
+    # The API allows up to 25 square degrees per request.
+    tile_size: float = 0.25
+    # Maximum number of notes per bounding box request allowed by the API
+    bulk_limit: int = 10000
+    # Closed notes whose status changed longer ago than this are not checked again
+    closed_note_terminal_age: timedelta = timedelta(
+        days=config.closed_note_terminal_age_days
+    )
+    # Open notes are checked again after this time
+    open_note_ttl: timedelta = timedelta(hours=config.open_note_ttl_hours)
+    # Ask the API even if the note cache has a fresh answer
+    bypass_cache: bool = False
+
+    def tiles(self, notes_df: DataFrame) -> List[Tuple[float, float, float, float]]:
+        """Return bounding boxes (min_lon, min_lat, max_lon, max_lat)
+        covering the notes in tiles of tile_size degrees
+
+        Each box is shrunk to the notes inside the tile so the API
+        only returns what is needed."""
+        tiles_df = DataFrame(
+            {
+                "latitude": notes_df["latitude"],
+                "longitude": notes_df["longitude"],
+                "row": (notes_df["latitude"] // self.tile_size).astype(int),
+                "column": (notes_df["longitude"] // self.tile_size).astype(int),
+            }
+        )
+        bounds = tiles_df.groupby(["row", "column"]).agg(
+            min_lon=("longitude", "min"),
+            min_lat=("latitude", "min"),
+            max_lon=("longitude", "max"),
+            max_lat=("latitude", "max"),
+        )
+        # pad so notes on the border are included
+        padding = 0.0001
+        return [
+            (
+                row.min_lon - padding,
+                row.min_lat - padding,
+                row.max_lon + padding,
+                row.max_lat + padding,
+            )
+            for row in bounds.itertuples()
+        ]
+
+    def fetch_tile(self, bbox: Tuple[float, float, float, float]) -> List[NoteStatus]:
+        """Fetch all notes including closed ones in the bounding box"""
+        notes = self.call_with_retries(
+            self.osmnoteuploader.client.NotesGet,
+            *bbox,
+            limit=self.bulk_limit,
+            closed=-1,
+        )
+        return [
+            NoteStatus(note_id=note["id"], open=note["status"] == "open", hidden=False)
+            for note in notes
+        ]
+
+    def refresh_bulk(self, notes_df: DataFrame) -> Dict[int, NoteStatus]:
+        """Return the status of the notes by note_id using bounding box queries
+
+        Hidden notes are not returned by the bounding box queries so the
+        notes that no tile returned fall back to one NoteGet each."""
+        note_ids = {int(note_id) for note_id in notes_df["note_id"]}
+        statuses: Dict[int, NoteStatus] = {}
+        tiles = self.tiles(notes_df)
+        with Progress(disable=not self.show_progress) as progress:
+            task = progress.add_task("Checking note status in bulk", total=len(tiles))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self.fetch_tile, bbox): bbox for bbox in tiles
+                }
+                for future in as_completed(futures):
+                    try:
+                        tile_statuses = future.result()
+                    except (ApiError, requests.RequestException) as e:
+                        # its notes are fetched one by one below
+                        logger.error(
+                            f"Could not fetch the notes in {futures[future]}: {e}"
+                        )
+                        tile_statuses = []
+                    for status in tile_statuses:
+                        if status.note_id in note_ids:
+                            statuses[status.note_id] = status
+                    progress.advance(task)
+        missing = sorted(note_ids - set(statuses))
+        logger.info(
+            f"Got {len(statuses)} notes from {len(tiles)} tiles, "
+            f"fetching {len(missing)} one by one"
+        )
+        if missing:
+            statuses.update(self.refresh(note_ids=missing))
+        return statuses
+
+    def call_with_retries(self, function, *args, rate_limited=True, **kwargs):
+        """Call the API rate limited and retry transient errors
+
+        Without rate_limited the function takes the tokens itself"""
+        for attempt in range(self.max_retries + 1):
+            if rate_limited:
+                self.rate_limiter.acquire()
+            try:
+                return function(*args, **kwargs)
+            except (ApiError, requests.RequestException) as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                # exponential backoff with jitter
+                wait = self.backoff_seconds * 2**attempt * (1 + random.random())
+                logger.info(f"Got {e} from the API, retrying in {wait:.1f}s")
+                time.sleep(wait)
+
+    def fetch_status(self, note_id: int) -> NoteStatus:
+        """Fetch the status of a note retrying transient errors,
+        answers from the note cache do not wait for the rate limiter"""
+        is_open, is_hidden = self.call_with_retries(
+            self.osmnoteuploader.get_status,
+            note_id=note_id,
+            bypass_cache=self.bypass_cache,
+            rate_limited=False,
+            rate_limiter=self.rate_limiter,
+        )
+        return NoteStatus(note_id=note_id, open=is_open, hidden=is_hidden)
+
+    def refresh(self, note_ids: Iterable[int]) -> Dict[int, NoteStatus]:
+        """Return the status of the notes by note_id
+
+        The notes that failed after all retries are left out"""
+        note_ids = [int(note_id) for note_id in note_ids]
+        statuses: Dict[int, NoteStatus] = {}
+        with Progress(disable=not self.show_progress) as progress:
+            task = progress.add_task("Checking note status", total=len(note_ids))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self.fetch_status, note_id): note_id
+                    for note_id in note_ids
+                }
+                for future in as_completed(futures):
+                    try:
+                        status = future.result()
+                    except (ApiError, requests.RequestException) as e:
+                        logger.error(
+                            f"Could not fetch the status of note {futures[future]}: {e}"
+                        )
+                    else:
+                        statuses[status.note_id] = status
+                    progress.advance(task)
+        return statuses
+
+    def needs_refresh(self, note: Series, now: datetime) -> bool:
+        """Decide if the note can still change since it was last checked
+
+        Hidden notes and notes closed longer than closed_note_terminal_age
+        ago are terminal. Other notes are checked when their last check
+        is older than open_note_ttl."""
+        last_checked = pandas.to_datetime(note.get("last_checked"), errors="coerce")
+        if pandas.isna(last_checked):
+            return True
+        if note["hidden"]:
+            return False
+        if not note["open"]:
+            status_changed_at = pandas.to_datetime(
+                note.get("status_changed_at"), errors="coerce"
+            )
+            # closed before we started recording the time,
+            # refresh_notes stamps it on the next check
+            if (
+                not pandas.isna(status_changed_at)
+                and now - status_changed_at > self.closed_note_terminal_age
+            ):
+                return False
+        return now - last_checked > self.open_note_ttl
+
+    def refresh_notes(
+        self, notes_df: DataFrame, bulk: bool = False, force: bool = False
+    ) -> RefreshReport:
+        """Refresh the notes that can still change and update
+        open, hidden, last_checked and status_changed_at in notes_df"""
+        now = datetime.now()
+        for column in ("last_checked", "status_changed_at"):
+            if column not in notes_df.columns:
+                notes_df[column] = None
+            notes_df[column] = notes_df[column].astype(object)
+        if force:
+            selected = notes_df.index
+        else:
+            selected = notes_df.index[
+                notes_df.apply(self.needs_refresh, axis=1, args=(now,)).astype(bool)
+            ]
+        report = RefreshReport(
+            skipped=len(notes_df.index) - len(selected), fetched=len(selected)
+        )
+        if not len(selected):
+            return report
+        selected_df = notes_df.loc[selected]
+        if bulk:
+            statuses = self.refresh_bulk(notes_df=selected_df)
+        else:
+            statuses = self.refresh(note_ids=selected_df["note_id"])
+        for index, note in selected_df.iterrows():
+            status = statuses.get(int(note["note_id"]))
+            if status is None:
+                report.failed += 1
+                continue
+            if status.open != note["open"] or status.hidden != note["hidden"]:
+                report.changed += 1
+                notes_df.at[index, "open"] = status.open
+                notes_df.at[index, "hidden"] = status.hidden
+                notes_df.at[index, "status_changed_at"] = str(now)
+            elif not status.open and pandas.isna(
+                pandas.to_datetime(note["status_changed_at"], errors="coerce")
+            ):
+                # closed before we started recording the time,
+                # its terminal age counts from the first check
+                notes_df.at[index, "status_changed_at"] = str(now)
+            notes_df.at[index, "last_checked"] = str(now)
+        return report
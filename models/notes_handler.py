@@ -0,0 +1,206 @@
+import logging
+from argparse import Namespace
+from typing import Optional
+
+from pandas import DataFrame
+from pydantic import BaseModel
+
+import config
+from models.cli import parse_arguments
+from models.http_session import create_client
+from models.note_cache import NoteCache
+from models.note_closer import NoteCloser
+from models.note_status_refresher import NoteStatusRefresher
+from models.notes_index import NotesIndex
+from models.notes_store import NotesStore, get_notes_store
+from models.osm_note_uploader import OsmNoteHandler
+
+logger = logging.getLogger(__name__)
+
+
+class NotesHandler(BaseModel):
+    """Work on the notes we created: check their status, list and close them
+
+    Nothing here needs the geo libraries so these commands start fast.
+    GeojsonHandler adds the commands that match geometries."""
+
+    notes_file_path: str = ""
+    notes_df: DataFrame = DataFrame()
+    notes_index: NotesIndex = NotesIndex()
+    notes_store: Optional[NotesStore] = None
+    note_cache: Optional[NoteCache] = None
+    use_note_cache: bool = True
+
+    osmnoteuploader: OsmNoteHandler = OsmNoteHandler()
+    number_of_open_notes: int = 0
+    max_workers: int = config.max_workers
+    max_uploads_in_flight: int = config.max_uploads_in_flight
+    bulk_status: bool = False
+    full_status_refresh: bool = False
+    close_comment: str = config.close_comment
+    dry_run: bool = False
+    command: str = ""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def start(self, args: Optional[Namespace] = None):
+        if args is None:
+            args = parse_arguments()
+        self.apply_arguments(args)
+        if self.use_note_cache:
+            self.note_cache = NoteCache()
+        # status reads share an anonymous pool sized for the workers
+        self.osmnoteuploader = OsmNoteHandler(
+            client=create_client(pool_size=self.max_workers),
+            note_cache=self.note_cache,
+        )
+        self.run_command()
+
+    def run_command(self):
+        if self.command == "status":
+            self.check_note_status()
+            self.print_note_status()
+        elif self.command == "list":
+            self.list_open_notes()
+        elif self.command == "close":
+            self.initialize_note_uploader()
+            self.close_all_open_notes()
+        elif self.command == "login":
+            self.initialize_note_uploader()
+            self.osmnoteuploader.authenticate()
+            print(f"Logged in, the token is stored in {config.token_cache_file}")
+        else:
+            raise ValueError(f"{self.command} needs GeojsonHandler")
+
+    def setup_argparse_and_get_filename(self):
+        self.apply_arguments(parse_arguments())
+
+    def apply_arguments(self, args: Namespace):
+        self.command = args.command
+        self.notes_file_path = getattr(args, "notes_file", "")
+        self.max_workers = getattr(args, "workers", config.max_workers)
+        self.use_note_cache = not getattr(args, "no_note_cache", False)
+        self.bulk_status = getattr(args, "bulk_status", False)
+        self.full_status_refresh = getattr(args, "full_status_refresh", False)
+        self.close_comment = getattr(args, "close_comment", config.close_comment)
+        self.dry_run = getattr(args, "dry_run", False)
+        self.max_uploads_in_flight = getattr(
+            args, "in_flight", config.max_uploads_in_flight
+        )
+
+    def check_empty_notes_df(self):
+        if self.notes_df.empty:
+            raise Exception("notes df was empty")
+
+    def close_all_open_notes(self):
+        logger.debug("close_all_open_notes: running")
+        self.read_notes_dataframe()
+        self.check_empty_notes_df()
+        closer = NoteCloser(
+            notes_store=self.get_notes_store(),
+            # only close notes that the API says are open right now
+            refresher=NoteStatusRefresher(
+                osmnoteuploader=self.osmnoteuploader,
+                max_workers=self.max_workers,
+                bypass_cache=True,
+            ),
+            comment=self.close_comment,
+            dry_run=self.dry_run,
+        )
+        print(closer.close_open_notes())
+        self.read_notes_dataframe()
+
+    def print_note_status(self):
+        self.check_empty_notes_df()
+        self.print_number_of_open_notes()
+        self.print_number_of_closed_and_unhidden_notes()
+        self.print_number_of_hidden_notes()
+        self.print_number_of_total_notes()
+
+    def list_open_notes(self):
+        logger.debug("list_open_notes: running")
+        self.read_notes_dataframe()
+        self.check_empty_notes_df()
+        if not self.notes_df.empty:
+            for index, row in self.notes_df.iterrows():
+                if row['open']:
+                    note_id = row['note_id']
+                    print(f"https://www.openstreetmap.org/note/{note_id}")
+        else:
+            logger.info("dataframe was empty")
+
+    def get_notes_store(self) -> NotesStore:
+        """Return the live notes store shared with the uploader"""
+        if self.notes_store is None:
+            self.notes_store = get_notes_store(self.notes_file_path)
+        return self.notes_store
+
+    def read_notes_dataframe(self):
+        """Read the notes through the store which
+        includes the notes uploaded during this run"""
+        logger.debug("read_notes_dataframe: running")
+        self.notes_df = self.get_notes_store().read_dataframe()
+
+    def print_number_of_open_notes(self):
+        self.read_notes_dataframe()
+        if not self.notes_df.empty:
+            print(f'Open notes: {self.notes_df["open"].sum()}')
+
+    def print_number_of_hidden_notes(self):
+        self.read_notes_dataframe()
+        if not self.notes_df.empty:
+            print(f'Hidden notes: {self.notes_df["hidden"].sum()}')
+
+    def print_number_of_total_notes(self):
+        self.read_notes_dataframe()
+        if not self.notes_df.empty:
+            print(f'Total number of notes: {len(self.notes_df)}')
+
+    def check_note_status(self):
+        print("Checking note status for all notes")
+        self.read_notes_dataframe()
+        if not self.notes_df.empty:
+            # We dont need to login to get the status only
+            # Each note that can still change is fetched once concurrently
+            refresher = NoteStatusRefresher(
+                osmnoteuploader=self.osmnoteuploader,
+                max_workers=self.max_workers,
+                bypass_cache=self.full_status_refresh,
+            )
+            report = refresher.refresh_notes(
+                notes_df=self.notes_df,
+                bulk=self.bulk_status,
+                force=self.full_status_refresh,
+            )
+            print(report)
+            if self.note_cache is not None:
+                print(self.note_cache.statistics)
+            # write back the file
+            self.get_notes_store().write_dataframe(self.notes_df)
+            # store number of open notes in an attibute
+            count_open_notes_after_check = self.notes_df["open"].sum()
+            print(f"Open notes after check: {count_open_notes_after_check}")
+            self.number_of_open_notes = count_open_notes_after_check
+        else:
+            print(f"No notes found in the notes file")
+
+    def initialize_note_uploader(self):
+        """Set up the uploader for writing, it logs in before its first write"""
+        if not self.osmnoteuploader.initialized:
+            # propagate the notes file path
+            self.osmnoteuploader = OsmNoteHandler(
+                notes_file_path=self.notes_file_path,
+                notes_index=self.notes_index,
+                notes_store=self.get_notes_store(),
+                note_cache=self.note_cache,
+                interactive=self.command == "iterate",
+                pool_size=max(self.max_workers, self.max_uploads_in_flight),
+            )
+
+    def print_number_of_closed_and_unhidden_notes(self):
+        self.read_notes_dataframe()
+        if not self.notes_df.empty:
+            # Count rows where both "open" and "hidden" are False
+            count = len(self.notes_df[(self.notes_df['open'] == False) & (self.notes_df['hidden'] == False)])
+            print(f"Number of closed notes that are not hidden: {count}")
@@ -0,0 +1,93 @@
+import logging
+import math
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+import numpy
+from pandas import DataFrame
+from pydantic import BaseModel
+
+from models.distance import meters_to_degrees, within_radius
+
+if TYPE_CHECKING:
+    # the note commands start without shapely
+    from shapely import Point
+
+logger = logging.getLogger(__name__)
+
+
+class NotesIndex(BaseModel):
+    """In-memory grid index of the notes we created
+
+    The notes are hashed into cells of cell_size degrees on latitude and longitude.
+    A lookup only measures the notes in the cells that
+    overlap the radius around the point.
+
+    The index is built once from the notes dataframe and
+    updated whenever a new note is uploaded so notes created earlier
+    in the same run are found too.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    radius: float = 100
+    cell_size: float = 0.01
+    notes: List[Dict[str, Any]] = []
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    is_built: bool = False
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    def build(self, notes_df: DataFrame):
+        """Build the index from the notes dataframe"""
+        logger.debug("build: running")
+        self.notes = []
+        self.grid = {}
+        if not notes_df.empty:
+            for note in notes_df.to_dict(orient="records"):
+                self.add(note)
+        self.is_built = True
+
+    def add(self, note: Dict[str, Any]):
+        """Add a note with at least the keys latitude and longitude"""
+        self.notes.append(note)
+        self.grid.setdefault(
+            self.cell(note["latitude"], note["longitude"]), []
+        ).append(len(self.notes) - 1)
+
+    def candidates(self, point: "Point") -> List[Dict[str, Any]]:
+        """Return the notes in the cells overlapping the radius around the point"""
+        delta_latitude, delta_longitude = meters_to_degrees(self.radius, point.y)
+        min_row, min_column = self.cell(point.y - delta_latitude, point.x - delta_longitude)
+        max_row, max_column = self.cell(point.y + delta_latitude, point.x + delta_longitude)
+        return [
+            self.notes[position]
+            for row in range(min_row, max_row + 1)
+            for column in range(min_column, max_column + 1)
+            for position in self.grid.get((row, column), [])
+        ]
+
+    def query(self, point: "Point") -> DataFrame:
+        """Return the notes within the radius sorted by ascending distance"""
+        candidates = self.candidates(point)
+        if not candidates:
+            return DataFrame()
+        distances = within_radius(
+            numpy.array([note["latitude"] for note in candidates]),
+            numpy.array([note["longitude"] for note in candidates]),
+            point.y,
+            point.x,
+            radius=self.radius,
+        )
+        nearby_notes = [
+            {**note, "distance_to_point": dist}
+            for note, dist in zip(candidates, distances)
+            if dist <= self.radius
+        ]
+        if not nearby_notes:
+            return DataFrame()
+        return DataFrame(nearby_notes).sort_values(
+            by="distance_to_point", ascending=True
+        )
@@ -0,0 +1,286 @@
+import csv
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas
+from pandas import DataFrame
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Columns of the notes table and the value used when an old file lacks them
+NOTES_COLUMNS: Dict[str, Any] = {
+    "date": None,
+    "note_id": None,
+    "latitude": None,
+    "longitude": None,
+    "open": True,
+    "hidden": False,
+    # when the status was last fetched from the API
+    "last_checked": None,
+    # when the status last changed, closing or hiding the note
+    "status_changed_at": None,
+}
+
+SQLITE_TYPES: Dict[str, str] = {
+    "date": "TEXT",
+    "note_id": "INTEGER",
+    "latitude": "REAL",
+    "longitude": "REAL",
+    "open": "INTEGER",
+    "hidden": "INTEGER",
+    "last_checked": "TEXT",
+    "status_changed_at": "TEXT",
+}
+
+
+class NotesStore(BaseModel, ABC):
+    """Live store of the notes we created
+
+    Writes are O(1) and fsync'd. The dataframe is read from disk once and
+    then kept up to date in memory so readers see every appended note.
+    The backends implement the abstract methods."""
+
+    file_path: str = ""
+    dataframe: Optional[DataFrame] = None
+    pending_notes: List[Dict[str, Any]] = []
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @staticmethod
+    def complete_note(note: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the note with all the columns in the right order"""
+        return {
+            column: note.get(column, default)
+            for column, default in NOTES_COLUMNS.items()
+        }
+
+    def append(self, note: Dict[str, Any]) -> None:
+        """Append one note to the store"""
+        note = self.complete_note(note)
+        self.append_to_disk(note)
+        self.pending_notes.append(note)
+
+    def read_dataframe(self) -> DataFrame:
+        """Return all notes including the ones appended after the first read"""
+        if self.dataframe is None:
+            logger.debug("reading dataframe from disk...")
+            self.dataframe = self.load()
+            # the appended notes are already on disk
+            self.pending_notes = []
+        if self.pending_notes:
+            self.dataframe = pandas.concat(
+                [self.dataframe, DataFrame(self.pending_notes)], ignore_index=True
+            )
+            self.pending_notes = []
+        return self.dataframe
+
+    def update(self, note_id: int, **fields) -> None:
+        """Update fields of one note, e.g. to checkpoint a closed note"""
+        df = self.read_dataframe()
+        rows = df.index[df["note_id"] == note_id]
+        if rows.empty:
+            raise KeyError(f"note {note_id} not found in {self.file_path}")
+        for column, value in fields.items():
+            if column not in df.columns:
+                df[column] = None
+            df[column] = df[column].astype(object)
+            df.loc[rows, column] = value
+        self.update_on_disk(self.complete_note(df.loc[rows[-1]].to_dict()))
+
+    def write_dataframe(self, df: DataFrame) -> None:
+        """Replace all notes, e.g. after a status refresh"""
+        self.replace_on_disk(df)
+        self.dataframe = df
+        self.pending_notes = []
+
+    @abstractmethod
+    def load(self) -> DataFrame:
+        """Read all notes from disk"""
+
+    @abstractmethod
+    def append_to_disk(self, note: Dict[str, Any]) -> None:
+        """Write one new note to disk"""
+
+    @abstractmethod
+    def update_on_disk(self, note: Dict[str, Any]) -> None:
+        """Write the new version of one note to disk"""
+
+    @abstractmethod
+    def replace_on_disk(self, df: DataFrame) -> None:
+        """Write all notes to disk replacing the old ones"""
+
+
+class CsvNotesStore(NotesStore):
+    """Append-only CSV backend
+
+    Updates append a new version of the row and
+    the last version of every note wins when loading."""
+
+    def exists(self) -> bool:
+        file = self.file_path
+        return os.path.exists(file) and bool(os.path.getsize(file))
+
+    def load(self) -> DataFrame:
+        if self.exists():
+            df = pandas.read_csv(self.file_path)
+            for column, default in NOTES_COLUMNS.items():
+                if column not in df.columns:
+                    df[column] = default
+            # keep the order the notes were created in with the last version
+            order = df["note_id"].drop_duplicates(keep="first")
+            latest = df.drop_duplicates(subset="note_id", keep="last")
+            return (
+                latest.set_index("note_id")
+                .loc[order]
+                .reset_index()[df.columns]
+            )
+        return DataFrame()
+
+    def migrate_header(self) -> None:
+        """Rewrite the file once if it is missing columns from an older version"""
+        with open(self.file_path, newline="") as file:
+            header = next(csv.reader(file), [])
+        if header != list(NOTES_COLUMNS):
+            logger.info(f"Adding missing columns to {self.file_path}")
+            self.replace_on_disk(self.load())
+
+    def append_to_disk(self, note: Dict[str, Any]) -> None:
+        if self.exists():
+            self.migrate_header()
+            write_header = False
+        else:
+            write_header = True
+        with open(self.file_path, "a", newline="") as file:
+            writer = csv.writer(file)
+            if write_header:
+                writer.writerow(NOTES_COLUMNS)
+            writer.writerow(note.values())
+            file.flush()
+            os.fsync(file.fileno())
+
+    def update_on_disk(self, note: Dict[str, Any]) -> None:
+        self.append_to_disk(note)
+
+    def replace_on_disk(self, df: DataFrame) -> None:
+        # Write to a temporary file first so a crash never leaves half a file
+        temporary_file = f"{self.file_path}.tmp"
+        df[[column for column in NOTES_COLUMNS if column in df.columns]].to_csv(
+            temporary_file, index=False
+        )
+        with open(temporary_file) as file:
+            os.fsync(file.fileno())
+        os.replace(temporary_file, self.file_path)
+
+
+class SqliteNotesStore(NotesStore):
+    """SQLite backend indexed on note_id and latitude/longitude"""
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.file_path)
+        # fsync on every commit
+        connection.execute("PRAGMA synchronous = FULL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            + ", ".join(f"{column} {SQLITE_TYPES[column]}" for column in NOTES_COLUMNS)
+            + ")"
+        )
+        # add columns from newer versions to an existing database
+        existing_columns = {
+            row[1] for row in connection.execute("PRAGMA table_info(notes)")
+        }
+        for column in NOTES_COLUMNS:
+            if column not in existing_columns:
+                connection.execute(
+                    f"ALTER TABLE notes ADD COLUMN {column} {SQLITE_TYPES[column]}"
+                )
+        connection.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS notes_note_id ON notes (note_id)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS notes_location ON notes (latitude, longitude)"
+        )
+        return connection
+
+    def load(self) -> DataFrame:
+        connection = self.connect()
+        try:
+            df = pandas.read_sql_query(
+                f"SELECT {', '.join(NOTES_COLUMNS)} FROM notes ORDER BY rowid",
+                connection,
+            )
+        finally:
+            connection.close()
+        if df.empty:
+            return DataFrame()
+        df["open"] = df["open"].astype(bool)
+        df["hidden"] = df["hidden"].astype(bool)
+        return df
+
+    @staticmethod
+    def to_row(note: Dict[str, Any]) -> List[Any]:
+        row = []
+        for column in NOTES_COLUMNS:
+            value = note.get(column)
+            if value is not None and pandas.isna(value):
+                value = None
+            elif isinstance(value, datetime):
+                value = str(value)
+            elif hasattr(value, "item"):
+                # numpy scalars from dataframes
+                value = value.item()
+            row.append(value)
+        return row
+
+    def append_to_disk(self, note: Dict[str, Any]) -> None:
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute(
+                    f"INSERT INTO notes ({', '.join(NOTES_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in NOTES_COLUMNS)})",
+                    self.to_row(note),
+                )
+        finally:
+            connection.close()
+
+    def update_on_disk(self, note: Dict[str, Any]) -> None:
+        row = self.to_row(note)
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute(
+                    f"UPDATE notes SET {', '.join(f'{c} = ?' for c in NOTES_COLUMNS)} "
+                    f"WHERE note_id = ?",
+                    row + [int(note["note_id"])],
+                )
+        finally:
+            connection.close()
+
+    def replace_on_disk(self, df: DataFrame) -> None:
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM notes")
+                connection.executemany(
+                    f"INSERT INTO notes ({', '.join(NOTES_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in NOTES_COLUMNS)})",
+                    [
+                        self.to_row(self.complete_note(note))
+                        for note in df.to_dict(orient="records")
+                    ],
+                )
+        finally:
+            connection.close()
+
+
+def get_notes_store(file_path: str) -> NotesStore:
+    """Pick the backend based on the file extension"""
+    if os.path.splitext(file_path)[1] in (".db", ".sqlite", ".sqlite3"):
+        return SqliteNotesStore(file_path=file_path)
+    return CsvNotesStore(file_path=file_path)
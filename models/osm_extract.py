@@ -0,0 +1,410 @@
+"""Fetch the OSM features to match against instead of a manual export
+
+The features with the wanted tags are read from Overpass or a local
+.osm.pbf extract and kept in a tiled on-disk cache. Only the tiles
+covering the run are loaded and only stale tiles are fetched again."""
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy
+import pandas
+import requests
+import shapely
+from geopandas import GeoDataFrame
+from pandas import DataFrame
+from pydantic import BaseModel
+
+import config
+from models.exceptions import MissingInformationError
+from models.frame_files import FRAME_SUFFIX, read_frame, write_frame
+from models.http_session import anonymous_session
+
+logger = logging.getLogger(__name__)
+
+Bounds = Tuple[float, float, float, float]
+Tile = Tuple[int, int]
+
+
+def parse_tag(tag: str) -> Tuple[str, Optional[str]]:
+    """Parse key=value or key for any value"""
+    key, _, value = tag.partition("=")
+    if not key.strip():
+        raise MissingInformationError(f"Not a tag filter with key=value: {tag}")
+    return key.strip(), value.strip() or None
+
+
+def has_tag(tags, filters: List[Tuple[str, Optional[str]]]) -> bool:
+    return any(
+        key in tags and (value is None or tags.get(key) == value)
+        for key, value in filters
+    )
+
+
+def to_geodataframe(ids: List[str], geometries: List[Any]) -> GeoDataFrame:
+    """Return the features like a geojson export with an id column"""
+    return GeoDataFrame(
+        {"id": pandas.Series(ids, dtype=object)},
+        geometry=geometries,
+        crs="EPSG:4326",
+    )
+
+
+def filter_bounds(df: GeoDataFrame, bounds: Bounds) -> GeoDataFrame:
+    """Keep the features with a bounding box intersecting bounds"""
+    if df.empty:
+        return df
+    minx, miny, maxx, maxy = bounds
+    feature_bounds = shapely.bounds(df.geometry.values)
+    return df[
+        (feature_bounds[:, 0] <= maxx)
+        & (feature_bounds[:, 2] >= minx)
+        & (feature_bounds[:, 1] <= maxy)
+        & (feature_bounds[:, 3] >= miny)
+    ]
+
+
+class OverpassSource(BaseModel):
+    """Query the features with any of the tags from an Overpass endpoint
+
+    Ways are returned with their geometry, closed ways become
+    polygons like in overpass-turbo. Relations are reduced to their center.
+    The session never retries a POST so busy servers (429 and 5xx) and
+    lost connections are retried here with exponential backoff."""
+
+    tags: List[str]
+    url: str = config.overpass_url
+    timeout: int = config.overpass_timeout
+    max_retries: int = 5
+    backoff_seconds: float = 1.0
+
+    # Overpass answers one query for a whole tile
+    read_per_tile: bool = True
+
+    @property
+    def key(self) -> str:
+        return json.dumps(dict(url=self.url, tags=sorted(self.tags)))
+
+    @staticmethod
+    def updated_at() -> Optional[float]:
+        """The data changes all the time, only the age of a tile counts"""
+        return None
+
+    def query(self, bounds: Bounds) -> str:
+        minx, miny, maxx, maxy = bounds
+        # Overpass wants south,west,north,east
+        box = f"({miny},{minx},{maxy},{maxx})"
+        selectors = []
+        for key, value in map(parse_tag, self.tags):
+            selectors.append(
+                f'["{key}"]' if value is None else f'["{key}"="{value}"]'
+            )
+        elements = "".join(
+            f"{element}{selector}{box};"
+            for selector in selectors
+            for element in ("node", "way")
+        )
+        relations = "".join(f"relation{selector}{box};" for selector in selectors)
+        return (
+            f"[out:json][timeout:{self.timeout}];"
+            f"({elements});out tags geom;"
+            f"({relations});out tags center;"
+        )
+
+    @staticmethod
+    def parse_elements(elements: List[Dict[str, Any]]) -> GeoDataFrame:
+        ids, geometries = [], []
+        for element in elements:
+            if element["type"] == "node":
+                geometry = shapely.Point(element["lon"], element["lat"])
+            elif element["type"] == "way" and element.get("geometry"):
+                coordinates = [
+                    (position["lon"], position["lat"])
+                    for position in element["geometry"]
+                ]
+                if len(coordinates) >= 4 and coordinates[0] == coordinates[-1]:
+                    geometry = shapely.Polygon(coordinates)
+                elif len(coordinates) >= 2:
+                    geometry = shapely.LineString(coordinates)
+                else:
+                    continue
+            elif element["type"] == "relation" and "center" in element:
+                geometry = shapely.Point(
+                    element["center"]["lon"], element["center"]["lat"]
+                )
+            else:
+                logger.debug(f"Skipping {element['type']}/{element['id']}")
+                continue
+            ids.append(f"{element['type']}/{element['id']}")
+            geometries.append(geometry)
+        return to_geodataframe(ids, geometries)
+
+    @staticmethod
+    def is_transient(status_code: int) -> bool:
+        return status_code == 429 or status_code >= 500
+
+    def backoff(self, attempt: int, response: Optional[requests.Response]):
+        """Wait as long as the server asks or else exponentially with jitter"""
+        retry_after = None if response is None else response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            wait = float(retry_after)
+        else:
+            wait = self.backoff_seconds * 2**attempt * (1 + random.random())
+        status = "no answer" if response is None else response.status_code
+        logger.info(f"Got {status} from {self.url}, retrying in {wait:.1f}s")
+        time.sleep(wait)
+
+    def post(self, query: str) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = anonymous_session().post(
+                    self.url,
+                    data={"data": query},
+                    timeout=(config.http_connect_timeout, self.timeout + 30),
+                )
+                if (
+                    not self.is_transient(response.status_code)
+                    or attempt == self.max_retries
+                ):
+                    response.raise_for_status()
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            self.backoff(attempt, response)
+
+    def read(self, bounds: Bounds) -> GeoDataFrame:
+        logger.info(f"Querying {self.url} for {self.tags} in {bounds}")
+        response = self.post(self.query(bounds))
+        return self.parse_elements(response.json().get("elements", []))
+
+
+class PbfSource(BaseModel):
+    """Read the features with any of the tags from a local .osm.pbf extract
+
+    Needs pyosmium. The whole extract is read in one pass so
+    all stale tiles are filled from the same pass."""
+
+    tags: List[str]
+    file_path: str
+
+    read_per_tile: bool = False
+
+    @property
+    def key(self) -> str:
+        return json.dumps(
+            dict(file_path=os.path.abspath(self.file_path), tags=sorted(self.tags))
+        )
+
+    def updated_at(self) -> Optional[float]:
+        """Tiles older than the extract are stale"""
+        return os.path.getmtime(self.file_path)
+
+    def read(self, bounds: Bounds) -> GeoDataFrame:
+        try:
+            import osmium
+        except ImportError:
+            raise MissingInformationError(
+                "Reading .osm.pbf extracts needs pyosmium, "
+                "install it with pip install osmium"
+            )
+        filters = [parse_tag(tag) for tag in self.tags]
+        factory = osmium.geom.WKBFactory()
+        ids: List[str] = []
+        geometries: List[str] = []
+
+        def add(osm_id: str, create, obj):
+            try:
+                geometries.append(create(obj))
+            except RuntimeError as e:
+                # incomplete ways and broken multipolygons
+                logger.debug(f"Skipping {osm_id}: {e}")
+                return
+            ids.append(osm_id)
+
+        class Handler(osmium.SimpleHandler):
+            def node(self, node):
+                if has_tag(node.tags, filters):
+                    add(f"node/{node.id}", factory.create_point, node)
+
+            def way(self, way):
+                # closed ways come back as areas
+                if not way.is_closed() and has_tag(way.tags, filters):
+                    add(f"way/{way.id}", factory.create_linestring, way)
+
+            def area(self, area):
+                if has_tag(area.tags, filters):
+                    element = "way" if area.from_way() else "relation"
+                    add(
+                        f"{element}/{area.orig_id()}",
+                        factory.create_multipolygon,
+                        area,
+                    )
+
+        logger.info(f"Reading {self.tags} from {self.file_path}")
+        Handler().apply_file(self.file_path, locations=True)
+        df = to_geodataframe(ids, shapely.from_wkb(geometries) if ids else [])
+        return filter_bounds(df, bounds)
+
+
+class TiledOsmCache(BaseModel):
+    """On-disk cache of the OSM features of a source in tiles of tile_size degrees
+
+    Every feature is stored in all the tiles its bounding box
+    intersects. A tile is stale when it is older than max_age or than
+    the extract it was read from, only stale tiles are fetched again."""
+
+    source: Any
+    directory: str = config.osm_cache_directory
+    tile_size: float = config.osm_tile_size
+    max_age: timedelta = timedelta(hours=config.osm_cache_max_age_hours)
+
+    @property
+    def source_directory(self) -> str:
+        """One directory per source and tags"""
+        digest = hashlib.sha1(self.source.key.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, digest)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.source_directory, "tiles.json")
+
+    def tile_path(self, tile: Tile) -> str:
+        return os.path.join(self.source_directory, f"{tile[0]}_{tile[1]}{FRAME_SUFFIX}")
+
+    def tiles(self, bounds: Bounds) -> List[Tile]:
+        """Return the (row, column) of the tiles intersecting bounds"""
+        minx, miny, maxx, maxy = bounds
+        rows = range(
+            math.floor(miny / self.tile_size), math.floor(maxy / self.tile_size) + 1
+        )
+        columns = range(
+            math.floor(minx / self.tile_size), math.floor(maxx / self.tile_size) + 1
+        )
+        return [(row, column) for row in rows for column in columns]
+
+    def tile_bounds(self, tile: Tile) -> Bounds:
+        row, column = tile
+        return (
+            column * self.tile_size,
+            row * self.tile_size,
+            (column + 1) * self.tile_size,
+            (row + 1) * self.tile_size,
+        )
+
+    def read_index(self) -> Dict[str, float]:
+        """Return the time every tile was fetched"""
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as file:
+            return json.load(file)
+
+    def write_index(self, index: Dict[str, float]) -> None:
+        temporary_path = f"{self.index_path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(index, file)
+        os.replace(temporary_path, self.index_path)
+
+    def stale_tiles(self, tiles: List[Tile]) -> List[Tile]:
+        index = self.read_index()
+        oldest = time.time() - self.max_age.total_seconds()
+        updated_at = self.source.updated_at()
+        if updated_at is not None:
+            oldest = max(oldest, updated_at)
+        return [
+            tile
+            for tile in tiles
+            if index.get(f"{tile[0]}_{tile[1]}", 0) < oldest
+            or not os.path.exists(self.tile_path(tile))
+        ]
+
+    def split(self, df: GeoDataFrame) -> Iterator[Tuple[Tile, GeoDataFrame]]:
+        """Split the features by the tiles their bounding box intersects
+
+        A line or polygon crossing a tile edge is in every tile it
+        touches so loading any of them finds it"""
+        if df.empty:
+            return
+        feature_bounds = shapely.bounds(df.geometry.values)
+        located = numpy.flatnonzero(~numpy.isnan(feature_bounds).any(axis=1))
+        tiles = numpy.floor(feature_bounds[located] / self.tile_size).astype(int)
+        min_columns, min_rows, max_columns, max_rows = tiles.T
+        widths = max_columns - min_columns + 1
+        counts = widths * (max_rows - min_rows + 1)
+        positions = numpy.repeat(located, counts)
+        # the n-th tile of a feature counted row by row from its corner
+        offsets = numpy.arange(counts.sum()) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts
+        )
+        widths = numpy.repeat(widths, counts)
+        groups = DataFrame(
+            {
+                "row": numpy.repeat(min_rows, counts) + offsets // widths,
+                "column": numpy.repeat(min_columns, counts) + offsets % widths,
+            }
+        ).groupby(["row", "column"])
+        for (row, column), indices in groups.indices.items():
+            yield (int(row), int(column)), df.iloc[positions[indices]]
+
+    def store(
+        self, tile: Tile, tile_frames: List[GeoDataFrame], index: Dict[str, float]
+    ) -> None:
+        """Write the tile and its time so a failed refresh keeps it"""
+        tile_df = (
+            pandas.concat(tile_frames, ignore_index=True)
+            if tile_frames
+            else to_geodataframe([], [])
+        )
+        write_frame(tile_df, self.tile_path(tile))
+        index[f"{tile[0]}_{tile[1]}"] = time.time()
+        self.write_index(index)
+
+    def refresh(self, bounds: Bounds) -> List[Tile]:
+        """Fetch the stale tiles intersecting bounds and return them
+
+        Every tile is stored as soon as it is fetched so a run that
+        fails halfway only fetches the remaining tiles again"""
+        stale_tiles = self.stale_tiles(self.tiles(bounds))
+        if not stale_tiles:
+            return []
+        os.makedirs(self.source_directory, exist_ok=True)
+        logger.info(f"Refreshing {len(stale_tiles)} OSM tiles")
+        index = self.read_index()
+        if self.source.read_per_tile:
+            for tile in stale_tiles:
+                df = self.source.read(self.tile_bounds(tile))
+                # features of other tiles are stored by their own tile
+                self.store(
+                    tile,
+                    [tile_df for other, tile_df in self.split(df) if other == tile],
+                    index,
+                )
+        else:
+            bounds = numpy.array([self.tile_bounds(tile) for tile in stale_tiles])
+            frames = dict(
+                self.split(
+                    self.source.read(
+                        (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+                    )
+                )
+            )
+            for tile in stale_tiles:
+                self.store(tile, [frames[tile]] if tile in frames else [], index)
+        return stale_tiles
+
+    def load(self, bounds: Bounds) -> GeoDataFrame:
+        """Return the features of the tiles intersecting bounds"""
+        self.refresh(bounds)
+        frames = [read_frame(self.tile_path(tile)) for tile in self.tiles(bounds)]
+        # features crossing tile edges are stored in several tiles
+        df = pandas.concat(frames, ignore_index=True).drop_duplicates(subset="id")
+        df = df.reset_index(drop=True)
+        logger.info(f"Loaded {len(df.index)} OSM features from {len(frames)} tiles")
+        return GeoDataFrame(df, geometry="geometry", crs="EPSG:4326")
@@ -0,0 +1,91 @@
+import logging
+from typing import Callable, Optional
+
+import numpy
+from pandas import DataFrame
+from pydantic import BaseModel
+from shapely import Point, STRtree, box
+
+from models.distance import meters_to_degrees
+from models.osm_layer import OsmLayer
+
+logger = logging.getLogger(__name__)
+
+
+class OsmFeatureIndex(BaseModel):
+    """Spatial index over the OSM features
+
+    The STRtree is built once over the OSM geometries. For each source point
+    we only query the candidates with a bounding box that intersects
+    an envelope of the search radius around the point and then calculate
+    the exact distance for those candidates only.
+
+    The envelope is a superset of what the exact distance accepts:
+    * a Point within the radius is inside the envelope
+    * a (Multi)Polygon centroid always lies inside the bounding box of the polygon
+    * the closest point on a (Multi)LineString lies on the LineString
+
+    The distances are calculated on the precomputed OsmLayer.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    osm_df: DataFrame = DataFrame()
+    radius: float = 100
+    tree: Optional[STRtree] = None
+    layer: Optional[OsmLayer] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def is_built(self) -> bool:
+        return self.tree is not None
+
+    def build(self):
+        """Build the OSM layer and the STRtree over the OSM geometries"""
+        logger.debug("build: running")
+        self.layer = OsmLayer(osm_df=self.osm_df, radius=self.radius)
+        self.tree = STRtree(
+            self.osm_df.geometry.values if not self.osm_df.empty else []
+        )
+
+    def envelope(self, point: Point):
+        """Return a box around the point which contains
+        every location within the radius"""
+        delta_latitude, delta_longitude = meters_to_degrees(self.radius, point.y)
+        return box(
+            point.x - delta_longitude,
+            point.y - delta_latitude,
+            point.x + delta_longitude,
+            point.y + delta_latitude,
+        )
+
+    def query(
+        self, point: Point, distance_function: Optional[Callable] = None
+    ) -> DataFrame:
+        """Return the OSM features within the radius sorted by ascending distance
+
+        The distances are calculated vectorized on the layer unless
+        a distance_function is given which is called with the row and
+        the point like GeojsonHandler.calculate_distance_geopandas"""
+        if not self.is_built:
+            self.build()
+        candidate_positions = numpy.sort(self.tree.query(self.envelope(point)))
+        candidates_df = self.osm_df.iloc[candidate_positions].copy()
+        if candidates_df.empty:
+            candidates_df["distance_to_point"] = []
+            return candidates_df
+        if distance_function is None:
+            candidates_df["distance_to_point"] = self.layer.distances(
+                point, candidate_positions
+            )
+        else:
+            candidates_df["distance_to_point"] = candidates_df.apply(
+                distance_function, axis=1, args=(point,)
+            )
+        # Remove rows with distance over the radius
+        candidates_df = candidates_df.loc[
+            candidates_df["distance_to_point"] <= self.radius
+        ]
+        # Sort by ascending distance
+        return candidates_df.sort_values(by="distance_to_point", ascending=True)
@@ -0,0 +1,108 @@
+import logging
+from typing import Dict, Optional
+
+import numpy
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
+from pandas import DataFrame
+from pydantic import BaseModel
+from shapely import Point
+
+from models.distance import within_radius
+from models.exceptions import GeometryError
+
+logger = logging.getLogger(__name__)
+
+# Measured to their centroid like before
+POLYGON_TYPES = {"Polygon", "MultiPolygon"}
+# Measured to their closest point
+LINE_TYPES = {"LineString", "MultiLineString"}
+POINT_TYPES = {"Point", "MultiPoint"}
+SUPPORTED_TYPES = POLYGON_TYPES | LINE_TYPES | POINT_TYPES
+
+
+def check_geometry_types(geometry: GeoSeries):
+    unsupported = set(geometry.geom_type) - SUPPORTED_TYPES
+    if unsupported:
+        raise GeometryError(f"row.geometry.type: {unsupported} not supported")
+
+
+def representative_geometries(geometry: GeoSeries) -> GeoSeries:
+    """Return the geometries we measure the distance to
+
+    Polygons are replaced by their centroid calculated in
+    longitude/latitude, points and lines are kept."""
+    check_geometry_types(geometry)
+    polygons = geometry.geom_type.isin(POLYGON_TYPES).to_numpy()
+    representative = geometry.copy()
+    if polygons.any():
+        representative.loc[polygons] = shapely.centroid(geometry.to_numpy()[polygons])
+    return representative
+
+
+def representative_geometry(geometry):
+    """Scalar representative_geometries"""
+    if geometry.geom_type in POLYGON_TYPES:
+        return geometry.centroid
+    return geometry
+
+
+def closest_point(geometry, point: Point) -> Point:
+    """Return the closest point on a representative geometry"""
+    return shapely.get_point(shapely.shortest_line(geometry, point), 0)
+
+
+class OsmLayer(BaseModel):
+    """The OSM features preprocessed once after loading
+
+    The representative geometries are computed once for all features
+    so a lookup only calls vectorized shapely and numpy functions
+    on the candidates. The layer projected to a metric CRS is kept
+    for the proximity join of every chunk.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    osm_df: DataFrame = DataFrame()
+    radius: float = 100
+    representative: numpy.ndarray = numpy.array([], dtype=object)
+    projected: Dict[str, GeoDataFrame] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def model_post_init(self, __context):
+        if not self.osm_df.empty:
+            self.representative = representative_geometries(
+                self.osm_df.geometry
+            ).to_numpy()
+
+    def geodataframe(self, crs: Optional[str] = None) -> GeoDataFrame:
+        """Return the representative geometries indexed like osm_df
+        with their position, projected to crs if given"""
+        key = str(crs)
+        if key not in self.projected:
+            layer = GeoDataFrame(
+                # to break ties between equidistant features the same way
+                {"osm_position": numpy.arange(len(self.representative))},
+                geometry=self.representative,
+                index=self.osm_df.index,
+                crs=getattr(self.osm_df, "crs", None) or "EPSG:4326",
+            )
+            if crs is not None:
+                layer = layer.to_crs(crs)
+            self.projected[key] = layer
+        return self.projected[key]
+
+    def distances(self, point: Point, positions: numpy.ndarray) -> numpy.ndarray:
+        """Return the distances in meters from the point to the
+        features at the positions, exact near the radius"""
+        if not len(positions):
+            return numpy.array([], dtype=float)
+        closest = closest_point(self.representative[positions], point)
+        return within_radius(
+            shapely.get_y(closest),
+            shapely.get_x(closest),
+            point.y,
+            point.x,
+            radius=self.radius,
+        )
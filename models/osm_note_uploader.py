@@ -1,17 +1,30 @@
 import logging
-import os.path
+import threading
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
 
-import pandas
 from osmapi import OsmApi, ElementDeletedApiError, NoteAlreadyClosedApiError
-from pandas import DataFrame
-from pydantic import BaseModel, validate_call
-from shapely import Point
+from pydantic import BaseModel, Field
 
 import config
+from models.exceptions import MissingInformationError
+from models.http_session import create_client, create_session
+from models.note_cache import NoteCache
+from models.notes_index import NotesIndex
+from models.notes_store import NotesStore, get_notes_store
+from models.rate_limiter import RateLimiter
+
+if TYPE_CHECKING:
+    # the note commands start without shapely
+    from shapely import Point
 
 logger = logging.getLogger(__name__)
 
+# special value for redirect_uri for non-web applications
+REDIRECT_URI = "urn:ietf:wg:oauth:2.0:oob"
+# only one thread logs in when several write at the same time
+authentication_lock = threading.Lock()
+
 
 class NoneException(BaseException):
     pass
@@ -24,88 +37,127 @@ class HiddenNoteError(BaseException):
 class OsmNoteHandler(BaseModel):
     """Class to handle uploading and saving notes to disk"""
 
-    client: OsmApi = OsmApi()
+    # anonymous pooled client until initialize_client logs in
+    client: OsmApi = Field(default_factory=create_client)
     username: str = config.username
     password: str = config.password
     initialized: bool = False
     notes_file_path: str = ""
+    # shared with GeojsonHandler so new notes block duplicates in the same run
+    notes_index: Optional[NotesIndex] = None
+    # shared with GeojsonHandler so both read the same live notes
+    notes_store: Optional[NotesStore] = None
+    # cache of the NoteGet responses, None to always ask the API
+    note_cache: Optional[NoteCache] = None
+    # False in the headless pipeline which never waits for input
+    interactive: bool = True
+    # connections of the logged in session
+    pool_size: int = config.max_workers
+    # the OAuth2 token is reused from here between runs
+    token_cache_file: str = config.token_cache_file
 
     class Config:
         arbitrary_types_allowed = True
 
-    def initialize_client(self):
-        # install oauthlib for requests:  pip install requests-oauth2client
-        from requests_oauth2client import OAuth2Client, OAuth2AuthorizationCodeAuth
-        import requests
-        import webbrowser
-        import osmapi
-        # from dotenv import load_dotenv, find_dotenv
+    def initialize_client(self, pool_size: int = config.max_workers):
+        """Log in with the cached token or the authorization code flow
+
+        The token of the last login is reused and refreshed when it expires
+        so only the first run asks for an authorization code."""
+        from models.token_cache import CachedTokenAuth, TokenCache
+
+        oauth2client = self.create_oauth2client()
+        token_cache = TokenCache(file_path=self.token_cache_file)
+        token = token_cache.load()
+        if token is None:
+            token = self.authorize(oauth2client)
+            token_cache.save(token)
+        else:
+            logger.info(f"Using the OAuth2 token in {self.token_cache_file}")
+        # one pooled session shared by all the threads writing notes
+        oauth_session = create_session(
+            pool_size=pool_size,
+            auth=CachedTokenAuth(oauth2client, token, token_cache),
+        )
+
+        # use the custom session
+        self.client = create_client(
+            # api="https://api06.dev.openstreetmap.org",
+            session=oauth_session)
+        self.initialized = True
+        logger.info("sucessfully logged into osm using oauth2")
+        # with api.Changeset({"comment": "My first test"}) as changeset_id:
+        #     print(f"Part of Changeset {changeset_id}")
+        #     node1 = api.NodeCreate({"lon": 1, "lat": 1, "tag": {}})
+        #     print(node1)
+
+    @staticmethod
+    def create_oauth2client():
         import os
 
-        # load_dotenv(find_dotenv())
+        # install oauthlib for requests:  pip install requests-oauth2client
+        from requests_oauth2client import OAuth2Client
 
         # Credentials you get from registering a new application
         # register here: https://master.apis.dev.openstreetmap.org/oauth2/applications
         # or on production: https://www.openstreetmap.org/oauth2/applications
         client_id = os.getenv("OSM_OAUTH_CLIENT_ID")
         client_secret = os.getenv("OSM_OAUTH_CLIENT_SECRET")
+        if not client_id or not client_secret:
+            raise MissingInformationError(
+                "Set OSM_OAUTH_CLIENT_ID and OSM_OAUTH_CLIENT_SECRET to log in"
+            )
 
-        # special value for redirect_uri for non-web applications
-        redirect_uri = "urn:ietf:wg:oauth:2.0:oob"
-
-        # production
-        authorization_base_url = "https://www.openstreetmap.org/oauth2/authorize"
-        token_url = "https://www.openstreetmap.org/oauth2/token"
-
-        oauth2client = OAuth2Client(
-            token_endpoint=token_url,
-            authorization_endpoint=authorization_base_url,
-            redirect_uri=redirect_uri,
+        return OAuth2Client(
+            token_endpoint=config.oauth_token_url,
+            authorization_endpoint=config.oauth_authorize_url,
+            redirect_uri=REDIRECT_URI,
             auth=(client_id, client_secret),
             code_challenge_method="",
         )
 
+    @staticmethod
+    def authorize(oauth2client):
+        """Ask the user to authorize us in the browser and return the token"""
+        import sys
+        import webbrowser
+
+        if not sys.stdin.isatty():
+            raise MissingInformationError(
+                "No OAuth2 token is cached, run `python main.py login` first"
+            )
         # open OSM website to authrorize user using the write_api and write_notes scope
         scope = ["write_notes"]
         az_request = oauth2client.authorization_request(scope=scope)
         print(f"Authorize user using this URL: {az_request.uri}")
         webbrowser.open(az_request.uri)
-
-        # create a new requests session using the OAuth authorization
         auth_code = input("Paste the authorization code here: ")
-        auth = OAuth2AuthorizationCodeAuth(
-            oauth2client,
-            auth_code,
-            redirect_uri=redirect_uri,
+        return oauth2client.authorization_code(
+            code=auth_code, redirect_uri=REDIRECT_URI
         )
-        oauth_session = requests.Session()
-        oauth_session.auth = auth
-
-        # use the custom session
-        self.client = osmapi.OsmApi(
-            # api="https://api06.dev.openstreetmap.org",
-            created_by=config.user_agent,
-            session=oauth_session)
-        logger.info("sucessfully logged into osm using oauth2")
-        # with api.Changeset({"comment": "My first test"}) as changeset_id:
-        #     print(f"Part of Changeset {changeset_id}")
-        #     node1 = api.NodeCreate({"lon": 1, "lat": 1, "tag": {}})
-        #     print(node1)
 
     # def initialize_client(self):
     #     self.client = OsmApi(self.username, self.password, created_by=config.user_agent)
     #     self.initialized = True
 
-    @validate_call(config=dict(arbitrary_types_allowed=True))
-    def create_and_upload_note(self, point: Point, text: str = config.note_text) -> int:
+    def authenticate(self):
+        """Log in before the first write, reading notes needs no login"""
+        with authentication_lock:
+            if not self.initialized:
+                self.initialize_client(pool_size=self.pool_size)
+
+    def create_and_upload_note(
+        self, point: "Point", text: str = config.note_text
+    ) -> int:
         logger.debug("Creating a new note")
         latitude = point.y
         longitude = point.x
         try:
+            self.authenticate()
             note = self.client.NoteCreate(dict(lat=latitude, lon=longitude, text=text))
             logger.debug(note)
             # When debugging we show the input
-            if config.press_enter_to_continue or config.debug:
+            if self.interactive and (config.press_enter_to_continue or config.debug):
                 input("Press enter to continue")
             note_id = note["id"]
             if self.is_hidden(note_id=note_id):
@@ -115,63 +167,98 @@ class OsmNoteHandler(BaseModel):
         except Exception as e:
             print(f"Error creating note: {str(e)}")
 
-    @validate_call(config=dict(arbitrary_types_allowed=True))
-    def write_note_information_to_csv(self, note_id: int, point: Point) -> None:
-        """Store the note information in a csv file"""
+    def write_note_information_to_csv(self, note_id: int, point: "Point") -> None:
+        """Store the note information in the notes store"""
         logger.debug("write_note_information_to_csv: running")
-        # open the csv with pandas
-        file = self.notes_file_path
-        if os.path.exists(file) and os.path.getsize(file):
-            df = pandas.read_csv(file)
-        else:
-            df = DataFrame()
-        new_data = {
-            "date": [datetime.today()],
-            "note_id": [note_id],
-            "latitude": [point.y],
-            "longitude": [point.x],
+        if self.notes_store is None:
+            self.notes_store = get_notes_store(self.notes_file_path)
+        note = {
+            "date": datetime.today(),
+            "note_id": note_id,
+            "latitude": point.y,
+            "longitude": point.x,
             "open": True,
-            "hidden": False
+            "hidden": False,
         }
+        self.notes_store.append(note)
+        if self.notes_index is not None:
+            self.notes_index.add(note)
 
-        # Append the new data to the DataFrame
-        df = pandas.concat([df, pandas.DataFrame(new_data)], ignore_index=True)
-        # write
-        df.to_csv(file, index=False)
+    def fetch_note(
+        self,
+        note_id: int,
+        bypass_cache: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> Optional[dict]:
+        """Return the note from NoteGet or None if it is hidden
 
-    def is_open(self, note_id: int) -> bool:
+        Goes through the note cache when there is one, the rate limiter
+        is only waited for when the API is asked"""
+        if self.note_cache is not None:
+            return self.note_cache.fetch(
+                client=self.client,
+                note_id=note_id,
+                bypass=bypass_cache,
+                rate_limiter=rate_limiter,
+            )
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         try:
-            note = self.client.NoteGet(id=note_id)
-            # print(note)
-            # note_id = note["id"]
-            note_status = note["status"]
-            status_mapping = {"open": True, "closed": False}
-            is_open = status_mapping.get(
-                note_status, None
-            )  # Returns False for unknown statuses
-            if is_open is not None:
-                return is_open
-            else:
-                raise NoneException()
+            return self.client.NoteGet(id=note_id)
         except ElementDeletedApiError as e:
             # Why does this happen? Because the node has been hidden by a moderator?
             # See https://wiki.openstreetmap.org/wiki/API_v0.6
             # awaiting response from the operations team
             logger.info(f"Error getting note status: {str(e)}")
-            # Defaulting to False
+            return None
+
+    def is_open(self, note_id: int) -> bool:
+        note = self.fetch_note(note_id=note_id)
+        if note is None:
+            # Hidden, defaulting to False
             return False
+        # print(note)
+        # note_id = note["id"]
+        note_status = note["status"]
+        status_mapping = {"open": True, "closed": False}
+        is_open = status_mapping.get(
+            note_status, None
+        )  # Returns False for unknown statuses
+        if is_open is not None:
+            return is_open
+        else:
+            raise NoneException()
+
+    def get_status(
+        self,
+        note_id: int,
+        bypass_cache: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> Tuple[bool, bool]:
+        """Return (open, hidden) based on a single NoteGet"""
+        note = self.fetch_note(
+            note_id=note_id, bypass_cache=bypass_cache, rate_limiter=rate_limiter
+        )
+        if note is None:
+            # Hidden by a moderator, see fetch_note
+            return False, True
+        status_mapping = {"open": True, "closed": False}
+        is_open = status_mapping.get(note["status"], None)
+        if is_open is None:
+            raise NoneException()
+        return is_open, False
 
     def is_hidden(self, note_id: int) -> bool:
-        try:
-            self.client.NoteGet(id=note_id)
-            return False
-        except ElementDeletedApiError:
-            return True
+        return self.fetch_note(note_id=note_id) is None
 
     def close(self, note_id: int, comment) -> bool:
+        self.authenticate()
         try:
             self.client.NoteClose(note_id, comment)
             return True
         except NoteAlreadyClosedApiError:
             print(f"{note_id} already closed")
-            return True
\ No newline at end of file
+            return True
+        finally:
+            if self.note_cache is not None:
+                self.note_cache.invalidate(note_id)
\ No newline at end of file
@@ -0,0 +1,241 @@
+import csv
+import logging
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+from pandas import DataFrame
+from pydantic import BaseModel
+from shapely import Point
+
+import config
+from models.async_note_uploader import AsyncNoteUploader
+from models.notes_index import NotesIndex
+from models.osm_layer import OsmLayer
+from models.proximity_join import ProximityJoin
+from models.sharded_matcher import ShardedMatcher
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a queue
+DONE = None
+
+
+class Candidate(BaseModel):
+    """A source feature without an OSM feature or a note nearby
+
+    This is a point object where y=latitude and x=longitude"""
+
+    source_index: int
+    source_id: Optional[str] = None
+    latitude: float
+    longitude: float
+
+    @property
+    def point(self) -> Point:
+        return Point(self.longitude, self.latitude)
+
+
+def write_candidates(
+    file_path: str, candidates: Iterable[Candidate]
+) -> Iterator[Candidate]:
+    """Write the candidates to a csv file as they pass through"""
+    with open(file_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(Candidate.model_fields))
+        writer.writeheader()
+        for candidate in candidates:
+            writer.writerow(candidate.model_dump())
+            # make the file reviewable while the pipeline runs
+            file.flush()
+            yield candidate
+
+
+def read_candidates(file_path: str) -> Iterator[Candidate]:
+    with open(file_path, newline="") as file:
+        for row in csv.DictReader(file):
+            yield Candidate(
+                source_index=row["source_index"],
+                source_id=row["source_id"] or None,
+                latitude=row["latitude"],
+                longitude=row["longitude"],
+            )
+
+
+class NotePipeline(BaseModel):
+    """Headless pipeline in three stages:
+    * match: find the source features without an OSM feature within 100m
+    * plan: drop the candidates with a note nearby and write the plan file
+    * upload: create a note for every planned candidate with the
+      journaled uploader so a crash or a retry never duplicates a note
+
+    Each stage can run on its own connected by files or all together
+    in threads connected by bounded queues so uploads of one candidate
+    overlap with matching of the next ones. Nothing waits for user input."""
+
+    osm_df: DataFrame = DataFrame()
+    # precomputed once for all chunks
+    osm_layer: Optional[OsmLayer] = None
+    source_id_column: str = "objektidentitet"
+    notes_index: NotesIndex = NotesIndex()
+    # needed when upload_to_osm is set
+    uploader: Optional[AsyncNoteUploader] = None
+    upload_to_osm: bool = config.upload_to_osm
+    queue_size: int = 100
+    # match in a pool of processes when above 1
+    processes: int = 1
+    # set when the run ends before every candidate got a note
+    stopped: bool = False
+    # the planned candidates skipped or failed when uploading
+    number_of_unfinished_candidates: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def match(self, chunks: Iterable[DataFrame]) -> Iterator[Candidate]:
+        """Yield the source features without an OSM feature nearby"""
+        if self.osm_layer is None:
+            self.osm_layer = OsmLayer(osm_df=self.osm_df)
+        matcher = None
+        if self.processes > 1:
+            # one pool for all the chunks
+            matcher = ShardedMatcher(
+                osm_layer=self.osm_layer, processes=self.processes
+            )
+        try:
+            yield from self.match_chunks(chunks, matcher)
+        finally:
+            if matcher is not None:
+                matcher.close()
+
+    def match_chunks(
+        self, chunks: Iterable[DataFrame], matcher: Optional[ShardedMatcher]
+    ) -> Iterator[Candidate]:
+        for source_df in chunks:
+            if self.stopped:
+                return
+            if matcher is None:
+                match_df = ProximityJoin(
+                    source_df=source_df, osm_df=self.osm_df, osm_layer=self.osm_layer
+                ).join()
+            else:
+                match_df = matcher.join(source_df)
+            unmatched_df = source_df.loc[~match_df["matched"].astype(bool)]
+            logger.info(
+                f"{len(unmatched_df.index)}/{len(source_df.index)} "
+                f"source features have no OSM feature within 100m"
+            )
+            for index, row in unmatched_df.iterrows():
+                source_id = row.get(self.source_id_column)
+                yield Candidate(
+                    source_index=index,
+                    source_id=None if source_id is None else str(source_id),
+                    latitude=row.geometry.y,
+                    longitude=row.geometry.x,
+                )
+
+    def plan(self, candidates: Iterable[Candidate]) -> Iterator[Candidate]:
+        """Yield the candidates without a note nearby
+
+        Candidates planned earlier in the run block duplicates too"""
+        planned_index = NotesIndex(is_built=True)
+        if not self.notes_index.is_built:
+            logger.warning("The notes index was not built, all candidates are kept")
+        for candidate in candidates:
+            if self.stopped:
+                return
+            point = candidate.point
+            if not self.notes_index.query(point=point).empty:
+                logger.info(f"A note already exists near {candidate.source_id}")
+                continue
+            if not planned_index.query(point=point).empty:
+                logger.info(f"A note is already planned near {candidate.source_id}")
+                continue
+            planned_index.add(candidate.model_dump())
+            yield candidate
+
+    def upload(self, candidates: Iterable[Candidate]) -> int:
+        """Upload a note for every candidate and return the number uploaded"""
+        if not self.upload_to_osm:
+            for candidate in candidates:
+                print(f"Upload was skipped in the config for {candidate.source_id}")
+                self.number_of_unfinished_candidates += 1
+            return 0
+
+        def points() -> Iterator[Point]:
+            for candidate in candidates:
+                if self.uploader.is_full():
+                    print("Maximum number of open notes reached. Stopping")
+                    self.stopped = True
+                    return
+                yield candidate.point
+
+        report = self.uploader.run(points())
+        print(report)
+        self.number_of_unfinished_candidates += report.failed
+        return report.uploaded
+
+    def put(self, stage_queue: queue.Queue, item):
+        """Put on a bounded queue without blocking forever when stopped"""
+        while not self.stopped:
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def iterate_queue(self, stage_queue: queue.Queue) -> Iterator[Candidate]:
+        while not self.stopped:
+            try:
+                item = stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is DONE:
+                return
+            yield item
+
+    def run(self, chunks: Iterable[DataFrame], plan_file: str) -> int:
+        """Run all stages concurrently and return the number of uploaded notes"""
+        matched_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        planned_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        errors: List[BaseException] = []
+
+        def stage(candidates: Iterable[Candidate], output_queue: queue.Queue):
+            try:
+                for candidate in candidates:
+                    self.put(output_queue, candidate)
+            except BaseException as e:
+                errors.append(e)
+                self.stopped = True
+            finally:
+                self.put(output_queue, DONE)
+
+        threads = [
+            threading.Thread(
+                target=stage, args=(self.match(chunks), matched_queue), daemon=True
+            ),
+            threading.Thread(
+                target=stage,
+                args=(
+                    write_candidates(
+                        plan_file, self.plan(self.iterate_queue(matched_queue))
+                    ),
+                    planned_queue,
+                ),
+                daemon=True,
+            ),
+        ]
+        for thread in threads:
+            thread.start()
+        stopped = True
+        try:
+            number_of_uploaded_notes = self.upload(self.iterate_queue(planned_queue))
+            stopped = self.stopped
+        finally:
+            # ends the other stages
+            self.stopped = True
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        self.stopped = stopped or self.number_of_unfinished_candidates > 0
+        return number_of_uploaded_notes
@@ -0,0 +1,124 @@
+import logging
+from typing import Optional
+
+import geopandas
+import numpy
+import shapely
+from geopandas import GeoDataFrame
+from pandas import DataFrame
+from pydantic import BaseModel
+
+from models.distance import FALLBACK_MARGIN
+from models.osm_layer import OsmLayer
+
+logger = logging.getLogger(__name__)
+
+
+class ProximityJoin(BaseModel):
+    """Match every source feature against the OSM features in one pass
+
+    Both dataframes are reprojected once to a local metric CRS (UTM zone
+    estimated from the source features) and joined with a single
+    nearest neighbour join limited to the radius.
+
+    The OSM geometries are reduced the same way as in
+    GeojsonHandler.calculate_distance_geopandas:
+    * Points are used as is
+    * Polygons and MultiPolygons are represented by their centroid
+    * LineStrings and MultiLineStrings are measured to their closest point
+
+    Pass the osm_layer built once after loading to reuse the
+    representative and projected geometries between chunks.
+
+    The planar distance in UTM differs from the geodesic distance by
+    less than FALLBACK_MARGIN. The source features with a nearest OSM
+    feature that close to the radius, inside or beyond it, are measured
+    again against all their candidates like OsmLayer.distances so the
+    matches are the same as measuring every pair with geopy."""
+
+    source_df: DataFrame = DataFrame()
+    osm_df: DataFrame = DataFrame()
+    radius: float = 100
+    osm_layer: Optional[OsmLayer] = None
+    # estimated from the source features when not given
+    metric_crs: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def join(self) -> DataFrame:
+        """Return a dataframe with the same index as the source with the columns
+        nearest_osm_index, distance_to_osm and matched"""
+        logger.debug("join: running")
+        result = DataFrame(index=self.source_df.index)
+        result["nearest_osm_index"] = None
+        result["distance_to_osm"] = float("nan")
+        result["matched"] = False
+        if self.osm_layer is None:
+            self.osm_layer = OsmLayer(osm_df=self.osm_df, radius=self.radius)
+        if self.source_df.empty or self.osm_layer.osm_df.empty:
+            return result
+        source = GeoDataFrame(geometry=self.source_df.geometry)
+        if source.crs is None:
+            source = source.set_crs("EPSG:4326")
+        if self.metric_crs is None:
+            self.metric_crs = source.estimate_utm_crs().to_string()
+        logger.info(f"Joining in {self.metric_crs}")
+        margin = self.radius * FALLBACK_MARGIN
+        projected = source.to_crs(self.metric_crs)
+        joined = geopandas.sjoin_nearest(
+            projected,
+            self.osm_layer.geodataframe(crs=self.metric_crs),
+            how="inner",
+            max_distance=self.radius + margin,
+            distance_col="distance_to_osm",
+        )
+        # Equidistant OSM features give multiple rows,
+        # keep the first in the order of osm_df
+        joined = joined.sort_values(
+            by=["distance_to_osm", "osm_position"], kind="stable"
+        )
+        joined = joined[~joined.index.duplicated(keep="first")]
+        near = (joined["distance_to_osm"] - self.radius).abs() <= margin
+        matched = joined[~near]
+        result.loc[matched.index, "nearest_osm_index"] = matched["index_right"]
+        result.loc[matched.index, "distance_to_osm"] = matched["distance_to_osm"]
+        result.loc[matched.index, "matched"] = True
+        if near.any():
+            self.measure_near_radius(result, source, projected, joined.index[near])
+        return result
+
+    def measure_near_radius(
+        self,
+        result: DataFrame,
+        source: GeoDataFrame,
+        projected: GeoDataFrame,
+        index,
+    ):
+        """Decide the source features close to the radius with geopy"""
+        layer = self.osm_layer.geodataframe(crs=self.metric_crs)
+        # the boxes around the radius hold all the candidates
+        bounds = shapely.bounds(projected.geometry.loc[index].values)
+        reach = self.radius * (1 + FALLBACK_MARGIN)
+        source_positions, osm_positions = layer.sindex.query(
+            shapely.box(
+                bounds[:, 0] - reach,
+                bounds[:, 1] - reach,
+                bounds[:, 2] + reach,
+                bounds[:, 3] + reach,
+            )
+        )
+        points = shapely.point_on_surface(
+            source.to_crs("EPSG:4326").geometry.loc[index].values
+        )
+        logger.debug(f"Measuring {len(index)} source features with geopy")
+        for position, source_index in enumerate(index):
+            candidates = numpy.sort(osm_positions[source_positions == position])
+            distances = self.osm_layer.distances(points[position], candidates)
+            if not len(distances) or distances.min() > self.radius:
+                continue
+            # the first of equidistant features in the order of osm_df
+            nearest = candidates[numpy.argmin(distances)]
+            result.loc[source_index, "nearest_osm_index"] = layer.index[nearest]
+            result.loc[source_index, "distance_to_osm"] = distances.min()
+            result.loc[source_index, "matched"] = True
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(BaseModel):
+    """Thread safe token bucket shared by all workers talking to the OSM API
+    from threads or from asyncio tasks
+
+    requests_per_second tokens are added every second up to burst tokens.
+    Every request takes one token and waits until one is available."""
+
+    requests_per_second: float = 2.0
+    burst: int = 1
+    tokens: float = 0.0
+    last_refill: float = 0.0
+    lock: Any = None
+
+    def model_post_init(self, __context):
+        # every limiter needs its own lock and starts with a full bucket
+        self.lock = threading.Lock()
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.burst),
+            self.tokens + (now - self.last_refill) * self.requests_per_second,
+        )
+        self.last_refill = now
+
+    def seconds_until_token(self) -> float:
+        """Take a token if there is one and return 0
+        else return how long to wait for the next one"""
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.requests_per_second
+
+    def acquire(self):
+        """Block until a token is available"""
+        if self.requests_per_second <= 0:
+            # no limit
+            return
+        while True:
+            wait = self.seconds_until_token()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a token is available"""
+        if self.requests_per_second <= 0:
+            return
+        while True:
+            wait = self.seconds_until_token()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,114 @@
+import csv
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy
+import shapely
+from pandas import DataFrame, Series
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+RUN_JOURNAL_COLUMNS = ["date", "key", "outcome", "osm_id", "note_id"]
+
+# An OSM feature is within the radius
+MATCHED = "matched"
+# A note we created earlier is within the radius
+NEAR_NOTE = "near_note"
+# A note was created for the feature
+NOTE_CREATED = "note_created"
+# The feature is outside the bounding boxes and areas of the run
+SKIPPED_BY_AREA = "skipped_by_area"
+
+
+def geometry_hashes(geometries: Iterable) -> List[str]:
+    """Return a stable key for every geometry
+
+    The source ids are not persistent so the geometry rounded to
+    the 7 decimals the OSM API stores is hashed instead."""
+    rounded = shapely.set_precision(
+        numpy.asarray(geometries, dtype=object), grid_size=1e-7, mode="pointwise"
+    )
+    return [
+        hashlib.sha1(wkb).hexdigest()
+        for wkb in shapely.to_wkb(rounded, output_dimension=2, byte_order=1)
+    ]
+
+
+class RunJournal(BaseModel):
+    """Append-only log of the outcome of every source feature in a run
+
+    Only final outcomes are recorded, a feature without an OSM feature
+    or note nearby that got no note is worked on again when resuming.
+    The last row of every key wins."""
+
+    file_path: str
+    entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if self.entries is None:
+            self.entries = {}
+            if os.path.exists(self.file_path):
+                with open(self.file_path, newline="") as file:
+                    for row in csv.DictReader(file):
+                        self.entries[row["key"]] = row
+            logger.debug(f"Loaded {len(self.entries)} outcomes from {self.file_path}")
+        return self.entries
+
+    def clear(self) -> None:
+        """Start a new run"""
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self.entries = {}
+
+    def outcome(self, key: str) -> Optional[str]:
+        entry = self.load().get(key)
+        return None if entry is None else entry["outcome"]
+
+    def unprocessed(self, df: DataFrame) -> DataFrame:
+        """Return the rows of df without an outcome"""
+        entries = self.load()
+        if not entries or df.empty:
+            return df
+        done = Series(geometry_hashes(df.geometry), index=df.index).isin(entries)
+        logger.info(f"Skipping {done.sum()} features processed in an earlier run")
+        return df.loc[~done]
+
+    def record(self, key: str, outcome: str, osm_id="", note_id="") -> None:
+        self.record_many([key], outcome, osm_ids=[osm_id], note_ids=[note_id])
+
+    def record_many(
+        self,
+        keys: List[str],
+        outcome: str,
+        osm_ids: Optional[List[Any]] = None,
+        note_ids: Optional[List[Any]] = None,
+    ) -> None:
+        """Append the outcome of the features and flush them to disk once"""
+        if not keys:
+            return
+        date = str(datetime.today())
+        rows = [
+            {
+                "date": date,
+                "key": key,
+                "outcome": outcome,
+                "osm_id": "" if osm_ids is None else osm_ids[i],
+                "note_id": "" if note_ids is None else note_ids[i],
+            }
+            for i, key in enumerate(keys)
+        ]
+        entries = self.load()
+        write_header = not os.path.exists(self.file_path)
+        with open(self.file_path, "a", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=RUN_JOURNAL_COLUMNS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        for row in rows:
+            entries[row["key"]] = row
@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+import shapely
+from geopandas import GeoDataFrame
+from pandas import DataFrame
+from pydantic import BaseModel
+from shapely import STRtree, box
+
+from models.distance import meters_to_degrees
+from models.osm_layer import OsmLayer
+from models.proximity_join import ProximityJoin
+
+logger = logging.getLogger(__name__)
+
+# Memory-mapped arrays already opened in this process by file path
+loaded_arrays: Dict[str, numpy.ndarray] = {}
+
+
+class SharedGeometries(BaseModel):
+    """Geometries as WKB in memory-mapped files
+
+    The worker processes map the same files so the geometries are
+    shared through the page cache instead of being pickled per task.
+    Only the file paths are sent to the workers."""
+
+    data_path: str
+    offsets_path: str
+    # keep the mapping open in the workers for the next tasks
+    keep_loaded: bool = False
+
+    @classmethod
+    def create(
+        cls,
+        geometries: numpy.ndarray,
+        directory: str,
+        name: str,
+        keep_loaded: bool = False,
+    ) -> "SharedGeometries":
+        wkb = shapely.to_wkb(geometries)
+        lengths = numpy.fromiter((len(value) for value in wkb), dtype=numpy.int64)
+        offsets = numpy.concatenate([[0], numpy.cumsum(lengths)])
+        shared = cls(
+            data_path=os.path.join(directory, f"{name}.wkb.npy"),
+            offsets_path=os.path.join(directory, f"{name}.offsets.npy"),
+            keep_loaded=keep_loaded,
+        )
+        numpy.save(shared.data_path, numpy.frombuffer(b"".join(wkb), dtype=numpy.uint8))
+        numpy.save(shared.offsets_path, offsets)
+        return shared
+
+    def load(self, path: str) -> numpy.ndarray:
+        if not self.keep_loaded:
+            return numpy.load(path, mmap_mode="r")
+        if path not in loaded_arrays:
+            loaded_arrays[path] = numpy.load(path, mmap_mode="r")
+        return loaded_arrays[path]
+
+    def get(self, positions: numpy.ndarray) -> numpy.ndarray:
+        """Return the geometries at the positions"""
+        data = self.load(self.data_path)
+        offsets = self.load(self.offsets_path)
+        return shapely.from_wkb(
+            [data[offsets[p] : offsets[p + 1]].tobytes() for p in positions]
+        )
+
+
+def match_shard(
+    source: SharedGeometries,
+    source_positions: numpy.ndarray,
+    osm: SharedGeometries,
+    osm_positions: numpy.ndarray,
+    radius: float,
+    metric_crs: str,
+) -> DataFrame:
+    """Match one shard in a worker process
+
+    Both dataframes are indexed by position so the result
+    can be mapped back to the labels in the main process"""
+    source_df = GeoDataFrame(
+        geometry=source.get(source_positions), index=source_positions, crs="EPSG:4326"
+    )
+    osm_df = GeoDataFrame(
+        geometry=osm.get(osm_positions), index=osm_positions, crs="EPSG:4326"
+    )
+    return ProximityJoin(
+        source_df=source_df, osm_df=osm_df, radius=radius, metric_crs=metric_crs
+    ).join()
+
+
+class ShardedMatcher(BaseModel):
+    """Match the source features against OSM in a pool of processes
+
+    The source features are sharded by tiles of tile_size degrees.
+    Every shard is matched against the OSM features within the bounding
+    box of its source features grown by the radius (the halo) so a
+    feature close to a tile border sees the same OSM features as in
+    a serial join. All shards use the metric CRS of the whole source and
+    the results are merged back in the order of the source, so the
+    output is identical to ProximityJoin.join.
+
+    Use it as a context manager to start and stop the pool once
+    for all the chunks of a run."""
+
+    osm_layer: OsmLayer
+    processes: int = 2
+    tile_size: float = 0.5
+    radius: float = 100
+    directory: Optional[str] = None
+    executor: Optional[ProcessPoolExecutor] = None
+    osm_geometries: Optional[SharedGeometries] = None
+    osm_tree: Optional[STRtree] = None
+    number_of_joins: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        self.directory = tempfile.mkdtemp(prefix="geojson2osmnotes-")
+        self.osm_geometries = SharedGeometries.create(
+            self.osm_layer.representative, self.directory, "osm", keep_loaded=True
+        )
+        self.osm_tree = STRtree(self.osm_layer.representative)
+        # spawn instead of fork since the pipeline runs threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def shards(
+        self, geometries: numpy.ndarray
+    ) -> List[Tuple[Tuple[int, int], numpy.ndarray, numpy.ndarray]]:
+        """Return (tile, source positions, OSM positions) sorted by tile"""
+        points = shapely.point_on_surface(geometries)
+        tiles = DataFrame(
+            {
+                "row": numpy.floor(shapely.get_y(points) / self.tile_size).astype(int),
+                "column": numpy.floor(shapely.get_x(points) / self.tile_size).astype(
+                    int
+                ),
+            }
+        )
+        bounds = shapely.bounds(geometries)
+        shards = []
+        for tile, positions in sorted(tiles.groupby(["row", "column"]).indices.items()):
+            min_x, min_y = bounds[positions, :2].min(axis=0)
+            max_x, max_y = bounds[positions, 2:].max(axis=0)
+            delta_latitude, delta_longitude = meters_to_degrees(
+                self.radius, max(abs(min_y), abs(max_y))
+            )
+            halo = box(
+                min_x - delta_longitude,
+                min_y - delta_latitude,
+                max_x + delta_longitude,
+                max_y + delta_latitude,
+            )
+            osm_positions = numpy.sort(self.osm_tree.query(halo))
+            shards.append((tile, positions, osm_positions))
+        return shards
+
+    def join(self, source_df: DataFrame) -> DataFrame:
+        """Return the same dataframe as ProximityJoin.join"""
+        if self.executor is None:
+            self.start()
+        if source_df.empty or self.osm_layer.osm_df.empty:
+            return ProximityJoin(
+                source_df=source_df, osm_layer=self.osm_layer, radius=self.radius
+            ).join()
+        source = GeoDataFrame(geometry=source_df.geometry)
+        if source.crs is None:
+            source = source.set_crs("EPSG:4326")
+        metric_crs = source.estimate_utm_crs().to_string()
+        geometries = source.to_crs("EPSG:4326").geometry.to_numpy()
+        self.number_of_joins += 1
+        source_geometries = SharedGeometries.create(
+            geometries, self.directory, f"source-{self.number_of_joins}"
+        )
+        shards = self.shards(geometries)
+        logger.info(
+            f"Matching {len(geometries)} source features in {len(shards)} shards "
+            f"with {self.processes} processes"
+        )
+        futures = [
+            self.executor.submit(
+                match_shard,
+                source_geometries,
+                source_positions,
+                self.osm_geometries,
+                osm_positions,
+                self.radius,
+                metric_crs,
+            )
+            for _, source_positions, osm_positions in shards
+            if len(osm_positions)
+        ]
+        # merge in submission order and then in the order of the source
+        results: List[Any] = [future.result() for future in futures]
+        merged = DataFrame(index=numpy.arange(len(geometries)))
+        merged["nearest_osm_index"] = None
+        merged["distance_to_osm"] = float("nan")
+        merged["matched"] = False
+        if results:
+            matched = pandas.concat(results)
+            matched = matched[matched["matched"].astype(bool)]
+            osm_labels = self.osm_layer.osm_df.index[
+                matched["nearest_osm_index"].astype(int).to_numpy()
+            ]
+            merged.loc[matched.index, "nearest_osm_index"] = list(osm_labels)
+            merged.loc[matched.index, "distance_to_osm"] = matched["distance_to_osm"]
+            merged.loc[matched.index, "matched"] = True
+        merged.index = source_df.index
+        for path in source_geometries.data_path, source_geometries.offsets_path:
+            os.remove(path)
+        return merged
+
@@ -0,0 +1,139 @@
+import heapq
+import logging
+from typing import Optional
+
+import numpy
+import shapely
+from geopandas import GeoSeries
+from pandas import DataFrame
+from pydantic import BaseModel
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class SourceClusters(BaseModel):
+    """Collapse the source features within the radius of each other
+
+    The pairs closer than the radius are found with one STRtree query
+    in a local metric CRS. The features are then covered greedily
+    using only those pairs: the feature with the most uncovered
+    neighbours represents itself and them, ties go to the smallest total
+    distance to those neighbours and then to the coordinates so the
+    result does not depend on the order of the features. The counts of
+    the neighbours of covered features are updated in a heap so no
+    distance matrix is ever built.
+
+    The representatives keep their row and get a cluster_size column.
+
+    This is a point object where y=latitude and x=longitude"""
+
+    radius: float = config.source_cluster_radius
+    # estimated from the source features when not given
+    metric_crs: Optional[str] = None
+
+    def project(self, df: DataFrame) -> numpy.ndarray:
+        geometries = GeoSeries(
+            shapely.point_on_surface(df.geometry.values),
+            crs=getattr(df, "crs", None) or "EPSG:4326",
+        )
+        if self.metric_crs is None:
+            self.metric_crs = geometries.estimate_utm_crs().to_string()
+        return geometries.to_crs(self.metric_crs).values
+
+    @staticmethod
+    def cover(
+        number: int,
+        left: numpy.ndarray,
+        right: numpy.ndarray,
+        distances: numpy.ndarray,
+        x: numpy.ndarray,
+        y: numpy.ndarray,
+    ) -> numpy.ndarray:
+        """Return the representative of every position given the pairs
+        of neighbours in both directions sorted by left"""
+        labels = numpy.arange(number)
+        starts = numpy.searchsorted(left, numpy.arange(number + 1))
+        neighbours = right.tolist()
+        neighbour_distances = distances.tolist()
+        counts = numpy.diff(starts).tolist()
+        totals = numpy.bincount(left, weights=distances, minlength=number).tolist()
+        x, y = x.tolist(), y.tolist()
+        covered = [False] * number
+        versions = [0] * number
+
+        def entry(position: int):
+            # rounded so the order of the sums does not break ties
+            return (
+                -counts[position],
+                round(totals[position], 6),
+                x[position],
+                y[position],
+                versions[position],
+                position,
+            )
+
+        heap = [entry(position) for position in numpy.unique(left).tolist()]
+        heapq.heapify(heap)
+        while heap:
+            *_, version, chosen = heapq.heappop(heap)
+            if covered[chosen] or version != versions[chosen]:
+                continue
+            members = [chosen] + [
+                neighbour
+                for neighbour in neighbours[starts[chosen] : starts[chosen + 1]]
+                if not covered[neighbour]
+            ]
+            for member in members:
+                covered[member] = True
+                labels[member] = chosen
+            changed = set()
+            for member in members:
+                for pair in range(starts[member], starts[member + 1]):
+                    neighbour = neighbours[pair]
+                    if not covered[neighbour]:
+                        counts[neighbour] -= 1
+                        totals[neighbour] -= neighbour_distances[pair]
+                        changed.add(neighbour)
+            for neighbour in changed:
+                versions[neighbour] += 1
+                heapq.heappush(heap, entry(neighbour))
+        return labels
+
+    def labels(self, df: DataFrame) -> numpy.ndarray:
+        """Return the position of the representative of every feature"""
+        number = len(df.index)
+        if number < 2 or self.radius <= 0:
+            return numpy.arange(number)
+        points = self.project(df)
+        left, right = shapely.STRtree(points).query(
+            points, predicate="dwithin", distance=self.radius
+        )
+        pairs = left != right
+        left, right = left[pairs], right[pairs]
+        order = numpy.lexsort((right, left))
+        left, right = left[order], right[order]
+        return self.cover(
+            number,
+            left,
+            right,
+            shapely.distance(points[left], points[right]),
+            shapely.get_x(points),
+            shapely.get_y(points),
+        )
+
+    def collapse(self, df: DataFrame) -> DataFrame:
+        """Return one row per cluster with the number of features it covers"""
+        if self.radius <= 0 or df.empty:
+            return df
+        labels = self.labels(df)
+        representatives = numpy.flatnonzero(labels == numpy.arange(len(labels)))
+        sizes = numpy.bincount(labels, minlength=len(labels))
+        collapsed_df = df.iloc[representatives].copy()
+        collapsed_df["cluster_size"] = sizes[representatives]
+        logger.info(
+            f"Collapsed {len(df.index)} source features into "
+            f"{len(collapsed_df.index)} within {self.radius}m of each other"
+        )
+        return collapsed_df
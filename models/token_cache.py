@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+from pydantic import BaseModel
+from requests_oauth2client import BearerToken, OAuth2AccessTokenAuth, OAuth2Client
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache(BaseModel):
+    """The OAuth2 token of the last login stored between runs
+
+    The file is only readable and writable by the user running the script."""
+
+    file_path: str = config.token_cache_file
+
+    def load(self) -> Optional[BearerToken]:
+        try:
+            with open(self.file_path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Ignoring the unreadable token cache {self.file_path}")
+            return None
+        expires_at = data.pop("expires_at", None)
+        return BearerToken(
+            expires_at=(
+                datetime.fromtimestamp(expires_at, tz=timezone.utc)
+                if expires_at is not None
+                else None
+            ),
+            **data,
+        )
+
+    def save(self, token: BearerToken) -> None:
+        """Write the token atomically with 0600 permissions"""
+        data = dict(
+            access_token=token.access_token,
+            refresh_token=token.refresh_token,
+            expires_at=(
+                token.expires_at.timestamp() if token.expires_at is not None else None
+            ),
+            scope=token.scope,
+            token_type=token.token_type,
+        )
+        temporary_path = f"{self.file_path}.tmp"
+        # created with the permissions so the token is never readable by others
+        descriptor = os.open(
+            temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+        )
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({key: value for key, value in data.items() if value}, file)
+        os.chmod(temporary_path, 0o600)
+        os.replace(temporary_path, self.file_path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+
+class CachedTokenAuth(OAuth2AccessTokenAuth):
+    """Bearer auth that refreshes the token and stores every new token
+
+    The token is refreshed before it expires and once when the API answers
+    401. One session with this auth is shared by all the worker threads,
+    the lock makes sure only one of them refreshes the token."""
+
+    def __init__(self, client: OAuth2Client, token: BearerToken, cache: TokenCache):
+        super().__init__(client, token)
+        self.cache = cache
+        self.lock = threading.RLock()
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        with self.lock:
+            request = super().__call__(request)
+        request.register_hook("response", self.handle_unauthorized)
+        return request
+
+    def renew_token(self) -> None:
+        super().renew_token()
+        if self.token is not None:
+            logger.info("Refreshed the OAuth2 token")
+            self.cache.save(self.token)
+
+    def handle_unauthorized(
+        self, response: requests.Response, **kwargs
+    ) -> requests.Response:
+        """Refresh the token and send the request again once on 401"""
+        if response.status_code != 401 or getattr(response.request, "retried", False):
+            return response
+        with self.lock:
+            used = response.request.headers.get("Authorization")
+            if used == self.token.authorization_header():
+                if self.token.refresh_token is None:
+                    logger.warning(
+                        "The OAuth2 token was rejected, "
+                        f"removing {self.cache.file_path}"
+                    )
+                    self.cache.clear()
+                    return response
+                # another thread did not refresh it already
+                self.renew_token()
+            authorization = self.token.authorization_header()
+        # drain the rejected response so its connection can be reused
+        response.content
+        response.close()
+        request = response.request.copy()
+        request.headers["Authorization"] = authorization
+        request.retried = True
+        retried = response.connection.send(request, **kwargs)
+        retried.history.append(response)
+        retried.request = request
+        return retried
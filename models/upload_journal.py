@@ -0,0 +1,79 @@
+import csv
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+from shapely import Point
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_COLUMNS = ["date", "key", "state", "note_id", "latitude", "longitude"]
+
+# A note is being created, it might exist on the server
+PENDING = "pending"
+# The note exists and is in the notes store
+COMMITTED = "committed"
+
+
+class UploadJournal(BaseModel):
+    """Append-only log of the note creations
+
+    A pending row is written and fsync'd before every create and a
+    committed row after the note is in the notes store. The last row
+    of every key wins so a crashed run leaves the pending creations
+    to be checked against the API before they are tried again."""
+
+    file_path: str
+    entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @staticmethod
+    def key(point: Point) -> str:
+        """The location rounded to the 7 decimals the API stores
+
+        This is a point object where y=latitude and x=longitude"""
+        return f"{point.y:.7f},{point.x:.7f}"
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if self.entries is None:
+            self.entries = {}
+            if os.path.exists(self.file_path):
+                with open(self.file_path, newline="") as file:
+                    for row in csv.DictReader(file):
+                        self.entries[row["key"]] = row
+            logger.debug(f"Loaded {len(self.entries)} uploads from {self.file_path}")
+        return self.entries
+
+    def state(self, key: str) -> Optional[str]:
+        entry = self.load().get(key)
+        return None if entry is None else entry["state"]
+
+    def note_id(self, key: str) -> Optional[int]:
+        entry = self.load().get(key)
+        if entry is None or not entry["note_id"]:
+            return None
+        return int(entry["note_id"])
+
+    def record(
+        self, key: str, state: str, point: Point, note_id: Optional[int] = None
+    ) -> None:
+        """Append the state of the creation at the point to disk"""
+        entry = {
+            "date": str(datetime.today()),
+            "key": key,
+            "state": state,
+            "note_id": "" if note_id is None else note_id,
+            "latitude": point.y,
+            "longitude": point.x,
+        }
+        entries = self.load()
+        write_header = not os.path.exists(self.file_path)
+        with open(self.file_path, "a", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=JOURNAL_COLUMNS)
+            if write_header:
+                writer.writeheader()
+            writer.writerow(entry)
+            file.flush()
+            os.fsync(file.fileno())
+        entries[key] = entry
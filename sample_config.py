@@ -17,4 +17,57 @@ Deltag i diskussion om denna notimport på forumet: https://community.openstreet
 #scriptcreatednote
 """
 debug = False
-user_agent = "geojson2osmnotes by pangoSE, see https://github.com/dpriskorn/geojson2osmnotes"
\ No newline at end of file
+user_agent = "geojson2osmnotes by pangoSE, see https://github.com/dpriskorn/geojson2osmnotes"
+
+# Concurrency and rate limit used when talking to the OSM API
+max_workers = 4
+api_requests_per_second = 2
+# Timeouts in seconds and retries of idempotent requests for the HTTP session
+http_connect_timeout = 5
+http_read_timeout = 30
+http_retries = 3
+# OAuth2 of the OSM website used when creating and closing notes
+oauth_authorize_url = "https://www.openstreetmap.org/oauth2/authorize"
+oauth_token_url = "https://www.openstreetmap.org/oauth2/token"
+# The token of the last login is stored here, only readable by you
+token_cache_file = "osm_token.json"
+# Number of note creations in flight at the same time when uploading a plan
+max_uploads_in_flight = 2
+# Number of processes matching the source features against OSM, 1 matches serially
+processes = 1
+
+# Overpass API used for --osm-tag when no --osm-pbf extract is given
+overpass_url = "https://overpass-api.de/api/interpreter"
+overpass_timeout = 180
+# Tiled on-disk cache of the OSM features fetched with --osm-tag
+osm_cache_directory = "osm_cache"
+# Size of the tiles in degrees
+osm_tile_size = 0.5
+osm_cache_max_age_hours = 24
+
+# On-disk cache of the parsed geojson files
+frame_cache_directory = "frame_cache"
+frame_cache_max_megabytes = 2048
+
+# Source features closer than this to each other get one note, 0 to keep all
+source_cluster_radius = 100
+
+# Incremental runs against a new release of the source dataset
+# Features closer than this to one of the last run are unchanged
+diff_tolerance_meters = 1
+# Features further away than this from all of the last run were added
+diff_max_move_meters = 100
+
+# Incremental note status refresh
+# Closed notes whose status changed more than this many days ago are never checked again
+closed_note_terminal_age_days = 30
+# Open notes are checked again when the last check is older than this
+open_note_ttl_hours = 24
+
+# On-disk cache of the note status responses
+note_cache_file = "note_cache.sqlite"
+note_cache_ttl_hours = 1
+note_cache_max_entries = 100000
+
+# Comment used when closing all open notes
+close_comment = "Closing because there is now a maproulette challenge for this, see https://maproulette.org/browse/challenges/48914"
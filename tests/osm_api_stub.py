@@ -0,0 +1,166 @@
+"""Local stub of the parts of the OSM notes API that we use"""
+import hashlib
+import re
+import threading
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from osmapi import OsmApi
+
+from models.http_session import create_client
+
+
+class OsmApiStub:
+    """Serve notes from memory on a random local port
+
+    notes maps note_id to a dict with lat, lon, status, text and hidden.
+    failures maps a request path with or without the query to a list of
+    status codes to return before the request succeeds.
+    lost maps a path to status codes returned after the request was
+    processed, like a response lost on the way back."""
+
+    def __init__(self, notes: Dict[int, dict] = None):
+        self.notes: Dict[int, dict] = notes or {}
+        self.failures: Dict[str, List[int]] = {}
+        self.lost: Dict[str, List[int]] = {}
+        self.requests: List[str] = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def client(self) -> OsmApi:
+        return create_client(api=self.url)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def note_xml(note_id: int, note: dict) -> str:
+        return (
+            f'<note lon="{note["lon"]}" lat="{note["lat"]}">'
+            f"<id>{note_id}</id>"
+            f"<date_created>2023-09-30 15:38:42 UTC</date_created>"
+            f"<status>{note['status']}</status>"
+            f"<comments><comment>"
+            f"<date>2023-09-30 15:38:42 UTC</date>"
+            f"<text>{escape(note.get('text', ''))}</text>"
+            f"<html></html><action>opened</action>"
+            f"</comment></comments></note>"
+        )
+
+    def handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, code: int, body: str = "", etag: str = ""):
+                data = body.encode()
+                self.send_response(code)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def reply_notes(self, notes: Dict[int, dict]):
+                self.reply(
+                    200,
+                    '<osm version="0.6">'
+                    + "".join(stub.note_xml(i, n) for i, n in notes.items())
+                    + "</osm>",
+                )
+
+            def failure(self, failures: Dict[str, List[int]] = None) -> int:
+                with stub.lock:
+                    if failures is None:
+                        failures = stub.failures
+                        stub.requests.append(f"{self.command} {self.path}")
+                    codes = failures.get(self.path) or failures.get(
+                        urlparse(self.path).path
+                    )
+                    if codes:
+                        return codes.pop(0)
+                return 0
+
+            def do_GET(self):
+                code = self.failure()
+                if code:
+                    return self.reply(code)
+                url = urlparse(self.path)
+                if url.path == "/api/0.6/notes":
+                    query = parse_qs(url.query)
+                    min_lon, min_lat, max_lon, max_lat = map(
+                        float, query["bbox"][0].split(",")
+                    )
+                    limit = int(query.get("limit", ["100"])[0])
+                    notes = {
+                        note_id: note
+                        for note_id, note in stub.notes.items()
+                        if min_lon <= note["lon"] <= max_lon
+                        and min_lat <= note["lat"] <= max_lat
+                        and not note.get("hidden")
+                    }
+                    return self.reply_notes(dict(list(notes.items())[:limit]))
+                match = re.fullmatch(r"/api/0\.6/notes/(\d+)", self.path)
+                if match:
+                    note_id = int(match.group(1))
+                    note = stub.notes.get(note_id)
+                    if note is None:
+                        return self.reply(404)
+                    if note.get("hidden"):
+                        return self.reply(410)
+                    body = stub.note_xml(note_id, note)
+                    etag = f'"{hashlib.md5(body.encode()).hexdigest()}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.reply(304, etag=etag)
+                    return self.reply(200, f'<osm version="0.6">{body}</osm>', etag)
+                self.reply(404)
+
+            def do_POST(self):
+                code = self.failure()
+                if code:
+                    return self.reply(code)
+                url = urlparse(self.path)
+                if url.path == "/api/0.6/notes":
+                    query = parse_qs(url.query)
+                    with stub.lock:
+                        note_id = max(stub.notes, default=0) + 1
+                        note = dict(
+                            lat=float(query["lat"][0]),
+                            lon=float(query["lon"][0]),
+                            text=query["text"][0],
+                            status="open",
+                        )
+                        stub.notes[note_id] = note
+                    code = self.failure(stub.lost)
+                    if code:
+                        return self.reply(code)
+                    return self.reply_notes({note_id: note})
+                match = re.fullmatch(r"/api/0\.6/notes/(\d+)/close", url.path)
+                if match:
+                    note_id = int(match.group(1))
+                    with stub.lock:
+                        note = stub.notes.get(note_id)
+                        if note is None:
+                            return self.reply(404)
+                        if note["status"] == "closed":
+                            return self.reply(409)
+                        note["status"] = "closed"
+                    return self.reply_notes({note_id: note})
+                self.reply(404)
+
+        return Handler
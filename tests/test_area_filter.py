@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import geopandas
+from shapely import LineString, Point, Polygon
+
+from models.area_filter import AreaFilter
+from models.GeojsonHandler import GeojsonHandler
+
+
+class TestAreaFilter(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def points_df(self):
+        return geopandas.GeoDataFrame(
+            {"objektidentitet": ["inside first", "inside second", "outside"]},
+            geometry=[
+                Point(17.8322943, 59.5292131),
+                Point(12.5, 60.5),
+                Point(15.0, 58.0),
+            ],
+            crs="EPSG:4326",
+        )
+
+    def test_from_strings_multiple_boxes(self):
+        area_filter = AreaFilter.from_strings(
+            bounding_box_string="17.7835,59.4582,18.0306,59.6017;12.0,60.0,13.0,61.0"
+        )
+        assert len(area_filter.bounding_boxes) == 2
+        assert area_filter.bounds() == (12.0, 59.4582, 18.0306, 61.0)
+        df = area_filter.filter_points(self.points_df())
+        assert list(df["objektidentitet"]) == ["inside first", "inside second"]
+
+    def test_polygon(self):
+        area_filter = AreaFilter(
+            polygons=[Polygon([(12.0, 60.0), (14.0, 60.0), (12.0, 62.0)])]
+        )
+        df = area_filter.filter_points(self.points_df())
+        assert list(df["objektidentitet"]) == ["inside second"]
+
+    def test_filter_features_with_buffer(self):
+        area_filter = AreaFilter.from_strings(
+            bounding_box_string="17.7835,59.4582,18.0306,59.6017"
+        ).buffered(meters=100)
+        osm_df = geopandas.GeoDataFrame(
+            geometry=[
+                # 50m east of the box
+                Point(18.0315, 59.5),
+                LineString([(17.0, 59.5), (17.79, 59.5)]),
+                Point(18.05, 59.5),
+            ],
+            crs="EPSG:4326",
+        )
+        assert list(area_filter.filter_features(osm_df).index) == [0, 1]
+
+    def test_create_geodataframes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            source_file = os.path.join(directory, "source.geojson")
+            osm_file = os.path.join(directory, "osm.geojson")
+            self.points_df().to_file(source_file, driver="GeoJSON")
+            with open(osm_file, "w") as file:
+                json.dump(
+                    {
+                        "type": "FeatureCollection",
+                        "features": [
+                            {
+                                "type": "Feature",
+                                "properties": {"id": "node/1"},
+                                "geometry": {
+                                    "type": "Point",
+                                    "coordinates": [17.833, 59.5295],
+                                },
+                            },
+                            {
+                                "type": "Feature",
+                                "properties": {"id": "node/2"},
+                                "geometry": {
+                                    "type": "Point",
+                                    "coordinates": [11.0, 57.0],
+                                },
+                            },
+                        ],
+                    },
+                    file,
+                )
+            for stream in (False, True):
+                gh = GeojsonHandler(
+                    source_geojson=source_file,
+                    osm_geojson=osm_file,
+                    bounding_box_string="17.7835,59.4582,18.0306,59.6017",
+                    stream=stream,
+                )
+                gh.create_geodataframes()
+                assert list(gh.osm_df["id"]) == ["node/1"]
+                if not stream:
+                    assert list(gh.source_df["objektidentitet"]) == ["inside first"]
+        finally:
+            shutil.rmtree(directory)
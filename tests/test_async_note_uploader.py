@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from shapely import Point
+
+from models.async_note_uploader import AsyncNoteUploader
+from models.notes_store import CsvNotesStore
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+from models.upload_journal import COMMITTED, PENDING, UploadJournal
+from tests.osm_api_stub import OsmApiStub
+
+TEXT = "There is a bathing site here"
+
+
+class TestAsyncNoteUploader(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.notes_file = os.path.join(self.directory, "notes.csv")
+        self.journal_file = os.path.join(self.directory, "notes.csv.uploads.csv")
+        self.stub = OsmApiStub().__enter__()
+        self.points = [Point(17.8, 59.5), Point(17.9, 59.6), Point(18.0, 59.7)]
+
+    def tearDown(self):
+        self.stub.__exit__()
+        shutil.rmtree(self.directory)
+
+    def uploader(self, **kwargs) -> AsyncNoteUploader:
+        return AsyncNoteUploader(
+            osmnoteuploader=OsmNoteHandler(
+                client=self.stub.client(),
+                # the stub needs no login
+                initialized=True,
+                notes_store=CsvNotesStore(file_path=self.notes_file),
+            ),
+            journal=UploadJournal(file_path=self.journal_file),
+            rate_limiter=RateLimiter(requests_per_second=0),
+            max_in_flight=2,
+            backoff_seconds=0.01,
+            text=TEXT,
+            **kwargs,
+        )
+
+    def creates(self):
+        return [r for r in self.stub.requests if r.startswith("POST")]
+
+    def stored_note_ids(self):
+        df = CsvNotesStore(file_path=self.notes_file).read_dataframe()
+        return sorted(df["note_id"]) if not df.empty else []
+
+    def test_upload(self):
+        report = self.uploader().run(self.points)
+        assert report.uploaded == 3
+        assert len(self.stub.notes) == 3
+        assert self.stored_note_ids() == [1, 2, 3]
+        journal = UploadJournal(file_path=self.journal_file)
+        for point in self.points:
+            assert journal.state(journal.key(point)) == COMMITTED
+
+    def test_notes_store_is_read_once(self):
+        with patch.object(
+            CsvNotesStore,
+            "read_dataframe",
+            autospec=True,
+            side_effect=CsvNotesStore.read_dataframe,
+        ) as read_dataframe:
+            report = self.uploader().run(self.points)
+        assert report.uploaded == 3
+        read_dataframe.assert_called_once()
+        assert self.stored_note_ids() == [1, 2, 3]
+
+    def test_upload_again_is_skipped(self):
+        self.uploader().run(self.points)
+        report = self.uploader().run(self.points + [self.points[0]])
+        assert report.uploaded == 0
+        assert report.skipped == 4
+        assert len(self.creates()) == 3
+
+    def test_lost_response_does_not_duplicate(self):
+        # the note is created but the response never arrives
+        self.stub.lost["/api/0.6/notes"] = [502]
+        report = self.uploader().run(self.points[:1])
+        assert report.uploaded == 1
+        assert report.recovered == 1
+        assert len(self.stub.notes) == 1
+        assert self.stored_note_ids() == [1]
+
+    def test_retry_transient_failure(self):
+        self.stub.failures["/api/0.6/notes"] = [429]
+        report = self.uploader().run(self.points[:1])
+        assert report.uploaded == 1
+        assert report.recovered == 0
+        assert len(self.stub.notes) == 1
+
+    def test_resume_pending_after_crash(self):
+        point = self.points[0]
+        # the earlier run created the note and stopped before committing
+        self.stub.notes[7] = dict(lat=point.y, lon=point.x, text=TEXT, status="open")
+        journal = UploadJournal(file_path=self.journal_file)
+        journal.record(journal.key(point), PENDING, point)
+        report = self.uploader().run([point])
+        assert report.recovered == 1
+        assert self.creates() == []
+        assert self.stored_note_ids() == [7]
+
+    def test_other_note_at_the_location_is_not_ours(self):
+        point = self.points[0]
+        self.stub.notes[7] = dict(lat=point.y, lon=point.x, text="Other", status="open")
+        journal = UploadJournal(file_path=self.journal_file)
+        journal.record(journal.key(point), PENDING, point)
+        report = self.uploader().run([point])
+        assert report.recovered == 0
+        assert self.stored_note_ids() == [8]
+
+    def test_permanent_failure(self):
+        self.stub.failures["/api/0.6/notes"] = [400]
+        report = self.uploader().run(self.points[:1])
+        assert report.failed == 1
+        assert self.stored_note_ids() == []
+        journal = UploadJournal(file_path=self.journal_file)
+        assert journal.state(journal.key(self.points[0])) == PENDING
+
+    def test_max_number_of_open_notes(self):
+        report = self.uploader(
+            number_of_open_notes=1, max_number_of_open_notes=2
+        ).run(self.points)
+        assert report.uploaded == 1
+        assert report.skipped == 2
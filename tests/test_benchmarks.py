@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from benchmarks import datasets
+from benchmarks.stages import compare, run
+
+
+class TestBenchmarks(TestCase):
+    def test_datasets_are_reproducible(self):
+        source_df = datasets.source_df(100)
+        assert list(source_df.geometry) == list(datasets.source_df(100).geometry)
+        notes_df = datasets.notes_df(source_df, open_notes=10)
+        assert notes_df["open"].sum() == 10
+        assert len(datasets.osm_df(source_df).index) == 100
+
+    def test_run(self):
+        report = run([50], lookups=10, writes=10, max_requests=5)
+        stages = [result["stage"] for result in report["results"]]
+        assert "check_note_status" in stages
+        assert "calculate_distance_to_osm_features" in stages
+        assert all(result["seconds"] >= 0 for result in report["results"])
+        assert all(result["peak_rss_mb"] > 0 for result in report["results"])
+
+    def test_compare(self):
+        baseline = [
+            dict(
+                stage="proximity_join",
+                size=1000,
+                items=1000,
+                seconds=1.0,
+                peak_rss_mb=100,
+            )
+        ]
+        assert compare(baseline, baseline, tolerance=0.25) == []
+        fewer_items = [
+            dict(
+                stage="proximity_join",
+                size=1000,
+                items=500,
+                seconds=0.5,
+                peak_rss_mb=100,
+            )
+        ]
+        assert compare(fewer_items, baseline, tolerance=0.25) == []
+        slower = [
+            dict(
+                stage="proximity_join",
+                size=1000,
+                items=1000,
+                seconds=1.5,
+                peak_rss_mb=110,
+            )
+        ]
+        assert len(compare(slower, baseline, tolerance=0.25)) == 1
+        bigger = [
+            dict(
+                stage="proximity_join",
+                size=1000,
+                items=1000,
+                seconds=1.0,
+                peak_rss_mb=200,
+            )
+        ]
+        assert len(compare(bigger, baseline, tolerance=0.25)) == 1
+        # sizes missing in the baseline are not compared
+        assert compare(slower, [], tolerance=0.25) == []
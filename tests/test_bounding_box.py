@@ -1,5 +1,6 @@
 from unittest import TestCase
 
+import numpy
 from shapely import Point
 
 from models.bounding_box import BoundingBox
@@ -36,3 +37,18 @@ class TestBoundingBox(TestCase):
     def test_is_valid_false(self):
         bb = BoundingBox(x1=0, x2=1, y1=1, y2=1)
         assert bb.is_valid is False
+
+    def test_mask(self):
+        bb = BoundingBox(x1=17.7835, y1=59.4582, x2=18.0306, y2=59.6017)
+        mask = bb.mask(
+            numpy.array([17.8322943, 17.8322943, 16.0]),
+            numpy.array([59.5292131, 69.5292131, 59.5]),
+        )
+        assert list(mask) == [True, False, False]
+
+    def test_buffered(self):
+        bb = BoundingBox(x1=17.7835, y1=59.4582, x2=18.0306, y2=59.6017)
+        buffered = bb.buffered(100)
+        # 100m is about 0.0009 degrees latitude and 0.0018 degrees longitude here
+        assert bb.y2 + 0.0009 < buffered.y2
+        assert buffered.x1 < bb.x1 - 0.0018
@@ -0,0 +1,51 @@
+import subprocess
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.startup import GEO_MODULES
+from models.cli import parse_arguments
+from models.notes_handler import NotesHandler
+from models.osm_note_uploader import OsmNoteHandler
+
+
+class TestCli(TestCase):
+    def test_notes_handler_does_not_import_the_geo_libraries(self):
+        modules = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, models.notes_handler; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        packages = {module.split(".")[0] for module in modules}
+        assert not GEO_MODULES & packages
+        assert "requests_oauth2client" not in packages
+
+    def test_parse_arguments(self):
+        args = parse_arguments(["list", "--notes-file", "notes.csv"])
+        assert args.command == "list"
+        handler = NotesHandler()
+        handler.apply_arguments(args)
+        assert handler.notes_file_path == "notes.csv"
+        assert not handler.dry_run
+
+    def test_osm_geojson_or_osm_tag(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            parse_arguments(["match", "--notes-file", "n.csv", "--source-geojson", "s"])
+
+    def test_login_on_first_write_only(self):
+        uploader = OsmNoteHandler()
+
+        def log_in(pool_size):
+            uploader.initialized = True
+
+        with patch.object(
+            OsmNoteHandler, "initialize_client", side_effect=log_in
+        ) as initialize_client:
+            uploader.authenticate()
+            uploader.authenticate()
+        initialize_client.assert_called_once()
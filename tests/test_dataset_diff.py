@@ -0,0 +1,166 @@
+import io
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+from unittest.mock import patch
+
+import geopandas
+from pandas import DataFrame
+from shapely import LineString, Point
+
+import config
+from benchmarks import datasets
+from models.area_filter import AreaFilter
+from models.bounding_box import BoundingBox
+from models.dataset_diff import DatasetDiff, SourceSnapshot
+from models.GeojsonHandler import GeojsonHandler
+from models.notes_index import NotesIndex
+
+# about 1m north
+ONE_METER = 1 / 111_000
+
+
+def source_df(geometries, ids=None) -> geopandas.GeoDataFrame:
+    return geopandas.GeoDataFrame(
+        {"objektidentitet": ids or [f"id{i}" for i in range(len(geometries))]},
+        geometry=geometries,
+        crs="EPSG:4326",
+    )
+
+
+class TestDatasetDiff(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_df = source_df(
+            [
+                Point(17.9, 59.7),
+                Point(18.0, 59.7),
+                Point(18.1, 59.7),
+                Point(18.2, 59.7),
+                LineString([(18.3, 59.7), (18.31, 59.7)]),
+            ]
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_diff(self):
+        current_df = source_df(
+            [
+                # new ids for the same features
+                Point(17.9, 59.7),
+                Point(18.0, 59.7 + 0.5 * ONE_METER),
+                Point(18.1, 59.7 + 20 * ONE_METER),
+                Point(18.5, 59.7),
+                LineString([(18.3, 59.7), (18.31, 59.7)]),
+            ],
+            ids=["a", "b", "c", "d", "e"],
+        )
+        result = DatasetDiff(previous_df=self.previous_df, current_df=current_df).diff()
+        assert list(result.added["objektidentitet"]) == ["d"]
+        assert list(result.moved["objektidentitet"]) == ["c"]
+        assert list(result.removed.geometry) == [Point(18.2, 59.7)]
+        assert result.unchanged == 3
+        assert list(result.changed["objektidentitet"]) == ["c", "d"]
+
+    def test_pairs_one_to_one(self):
+        current_df = source_df(
+            [Point(17.9, 59.7 + 30 * ONE_METER), Point(17.9, 59.7 + 10 * ONE_METER)]
+        )
+        result = DatasetDiff(
+            previous_df=self.previous_df.iloc[:1], current_df=current_df
+        ).diff()
+        # the closest is the moved one, the other was added
+        assert list(result.moved["objektidentitet"]) == ["id1"]
+        assert list(result.added["objektidentitet"]) == ["id0"]
+        assert result.removed.empty
+
+    def test_large_release_with_few_changes(self):
+        previous_df = datasets.source_df(20000)
+        current_df = previous_df.copy()
+        current_df.loc[5, "geometry"] = Point(11.5, 56.0)
+        result = DatasetDiff(previous_df=previous_df, current_df=current_df).diff()
+        assert list(result.added.index) == [5]
+        assert len(result.removed.index) == 1
+        assert result.unchanged == 19999
+
+    def test_incremental_run(self):
+        notes_file = os.path.join(self.directory, "notes.csv")
+        SourceSnapshot.for_notes_file(notes_file).write(self.previous_df)
+        notes_index = NotesIndex()
+        notes_index.build(
+            DataFrame(
+                [
+                    dict(note_id=7, latitude=59.7001, longitude=18.2001, open=True),
+                    dict(note_id=8, latitude=59.7001, longitude=17.9001, open=True),
+                ]
+            )
+        )
+        handler = GeojsonHandler(
+            source_df=self.previous_df.iloc[[0, 1, 2, 4]],
+            notes_file_path=notes_file,
+            notes_index=notes_index,
+            flag_removed=True,
+        )
+        with redirect_stdout(io.StringIO()) as output:
+            handler.select_changed_source_features()
+        assert handler.source_df.empty
+        assert len(handler.source_snapshot_df.index) == 4
+        assert "https://www.openstreetmap.org/note/7" in output.getvalue()
+        assert "note/8" not in output.getvalue()
+
+    def test_snapshot_of_an_interrupted_run(self):
+        notes_file = os.path.join(self.directory, "notes.csv")
+        snapshot = SourceSnapshot.for_notes_file(notes_file)
+        snapshot.write(self.previous_df.iloc[:2])
+        notes_index = NotesIndex()
+        notes_index.build(
+            DataFrame([dict(note_id=7, latitude=59.7001, longitude=18.1001)])
+        )
+        handler = GeojsonHandler(
+            source_df=self.previous_df.iloc[:4],
+            osm_df=geopandas.GeoDataFrame(
+                {"id": ["node/1"]}, geometry=[Point(18.5, 59.7)], crs="EPSG:4326"
+            ),
+            notes_file_path=notes_file,
+            notes_index=notes_index,
+            incremental=True,
+            command="iterate",
+            # skips the status check
+            number_of_open_notes=1,
+        )
+        with redirect_stdout(io.StringIO()), patch.object(
+            config, "upload_to_osm", False
+        ), patch.object(config, "press_enter_to_continue", False):
+            handler.select_changed_source_features()
+            handler.iterate_source_features()
+            handler.write_source_snapshot()
+        # the feature near a note is finished, the one without a note is not
+        assert list(snapshot.read().geometry) == list(self.previous_df.geometry[:3])
+
+    def test_snapshot_outside_the_areas_is_kept(self):
+        notes_file = os.path.join(self.directory, "notes.csv")
+        snapshot = SourceSnapshot.for_notes_file(notes_file)
+        snapshot.write(self.previous_df)
+        handler = GeojsonHandler(
+            # the run covers only the first two features
+            source_df=self.previous_df.iloc[:2],
+            area_filter=AreaFilter(
+                bounding_boxes=[BoundingBox(x1=17.8, y1=59.6, x2=18.05, y2=59.8)]
+            ),
+            notes_file_path=notes_file,
+            flag_removed=True,
+        )
+        with redirect_stdout(io.StringIO()) as output:
+            handler.select_changed_source_features()
+        assert handler.source_df.empty
+        assert "0 removed" in output.getvalue()
+        assert len(handler.source_snapshot_df.index) == 5
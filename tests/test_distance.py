@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+import numpy
+from geopy.distance import distance
+
+from models.distance import (
+    distance_meters,
+    equirectangular,
+    geodesic,
+    haversine,
+    within_radius,
+)
+
+
+def random_pairs(number: int, max_meters: float):
+    """Pairs around our Swedish latitudes up to about max_meters apart"""
+    generator = numpy.random.default_rng(42)
+    latitude1 = generator.uniform(55, 69, number)
+    longitude1 = generator.uniform(11, 24, number)
+    meters = generator.uniform(0, max_meters, number)
+    bearing = generator.uniform(0, 2 * numpy.pi, number)
+    latitude2 = latitude1 + meters * numpy.cos(bearing) / 111_000
+    longitude2 = longitude1 + meters * numpy.sin(bearing) / (
+        111_000 * numpy.cos(numpy.radians(latitude1))
+    )
+    return latitude1, longitude1, latitude2, longitude2
+
+
+class TestDistance(TestCase):
+    def test_kernels_close_to_geopy(self):
+        pairs = random_pairs(500, 200)
+        expected = geodesic(*pairs)
+        for kernel in (haversine, equirectangular):
+            error = numpy.abs(kernel(*pairs) - expected)
+            assert (error <= expected * 0.006 + 1e-6).all()
+
+    def test_geodesic(self):
+        assert geodesic(59.5, 17.8, 59.5001, 17.8) == distance(
+            (59.5, 17.8), (59.5001, 17.8)
+        ).meters
+
+    def test_within_radius_decides_like_geopy(self):
+        pairs = random_pairs(2000, 110)
+        expected = geodesic(*pairs) <= 100
+        for kernel in (haversine, equirectangular):
+            distances = within_radius(*pairs, radius=100, kernel=kernel)
+            assert ((distances <= 100) == expected).all()
+
+    def test_broadcast_point(self):
+        latitude1, longitude1, _, _ = random_pairs(10, 100)
+        distances = within_radius(latitude1, longitude1, 59.5, 17.8, radius=100)
+        assert distances.shape == (10,)
+
+    def test_distance_meters(self):
+        assert distance_meters(59.5, 17.8, 59.5, 17.8) == 0
+        assert round(distance_meters(59.5, 17.8, 59.5009, 17.8)) == round(
+            distance((59.5, 17.8), (59.5009, 17.8)).meters
+        )
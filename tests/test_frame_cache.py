@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from models.frame_cache import FrameCache
+from models.geojson_stream import read_geojson
+from tests.test_geojson_stream import features
+
+
+class TestFrameCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FrameCache(directory=os.path.join(self.directory, "cache"))
+        self.file_path = self.write("source.geojson", features())
+        self.parsed = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, feature_list) -> str:
+        file_path = os.path.join(self.directory, name)
+        with open(file_path, "w") as file:
+            json.dump({"type": "FeatureCollection", "features": feature_list}, file)
+        return file_path
+
+    def read(self, **kwargs):
+        def parse():
+            self.parsed += 1
+            return read_geojson(self.file_path, ["objektidentitet"], stream=True)
+
+        return self.cache.read(self.file_path, ["objektidentitet"], parse, **kwargs)
+
+    def test_hit(self):
+        df = self.read()
+        cached_df = self.read()
+        assert self.parsed == 1
+        assert list(cached_df["objektidentitet"]) == list(df["objektidentitet"])
+        assert list(cached_df.geometry) == list(df.geometry)
+        assert cached_df.crs == df.crs
+
+    def test_changed_file_is_parsed_again(self):
+        self.read()
+        time.sleep(0.01)
+        self.write("source.geojson", features()[:3])
+        assert len(self.read().index) == 3
+        assert self.parsed == 2
+
+    def test_columns_are_part_of_the_key(self):
+        assert self.cache.key(self.file_path, ["a"]) != self.cache.key(
+            self.file_path, ["b"]
+        )
+
+    def test_refresh(self):
+        self.read()
+        self.read(refresh=True)
+        assert self.parsed == 2
+
+    def test_evict_least_recently_used(self):
+        self.cache.max_megabytes = 0
+        other_path = self.write("other.geojson", features())
+        self.read()
+        self.cache.put(other_path, [], read_geojson(other_path, [], stream=True))
+        # only the newest entry is kept
+        assert len(os.listdir(self.cache.directory)) == 1
+        assert self.cache.get(self.file_path, ["objektidentitet"]) is None
+        assert self.cache.get(other_path, []) is not None
+
+    def test_read_geojson_with_cache(self):
+        kwargs = dict(
+            columns=["objektidentitet"],
+            stream=False,
+            bbox=(17.65, 59.3, 17.85, 59.6),
+            cache=self.cache,
+        )
+        df = read_geojson(self.file_path, **kwargs)
+        cached_df = read_geojson(self.file_path, **kwargs)
+        assert list(df.columns) == ["objektidentitet", "geometry"]
+        assert list(cached_df["objektidentitet"]) == list(df["objektidentitet"])
+        assert list(df["objektidentitet"]) == [f"id{i}" for i in range(6)] + ["line"]
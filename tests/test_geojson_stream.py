@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import geopandas
+
+from models.geojson_stream import GeojsonStreamReader
+
+
+def features():
+    return [
+        {
+            "type": "Feature",
+            "properties": {"objektidentitet": f"id{i}", "unused": "x" * 50},
+            "geometry": {"type": "Point", "coordinates": [17.8 + i / 100, 59.5]},
+        }
+        for i in range(25)
+    ] + [
+        {
+            "type": "Feature",
+            "properties": {"objektidentitet": "line"},
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[17.7, 59.4], [17.7, 59.41]],
+            },
+        }
+    ]
+
+
+class TestGeojsonStreamReader(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, text: str) -> str:
+        file_path = os.path.join(self.directory, name)
+        with open(file_path, "w") as file:
+            file.write(text)
+        return file_path
+
+    def reader(self, file_path: str) -> GeojsonStreamReader:
+        # a tiny buffer makes values span several reads
+        return GeojsonStreamReader(
+            file_path=file_path,
+            columns=["objektidentitet"],
+            chunk_size=10,
+            buffer_size=7,
+        )
+
+    def test_feature_collection(self):
+        file_path = self.write(
+            "source.geojson",
+            json.dumps(
+                {
+                    "type": "FeatureCollection",
+                    "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+                    "features": features(),
+                    "name": "after the features",
+                },
+                indent=1,
+            ),
+        )
+        chunks = list(self.reader(file_path).iterate_chunks())
+        assert [len(chunk.index) for chunk in chunks] == [10, 10, 6]
+        assert list(chunks[1].index) == list(range(10, 20))
+        df = self.reader(file_path).read()
+        expected = geopandas.read_file(file_path)
+        assert list(df.columns) == ["objektidentitet", "geometry"]
+        assert list(df["objektidentitet"]) == list(expected["objektidentitet"])
+        assert df.geometry.geom_equals(expected.geometry).all()
+
+    def test_geojson_seq(self):
+        file_path = self.write(
+            "source.geojsonl",
+            "".join(f"\x1e{json.dumps(feature)}\n" for feature in features()),
+        )
+        df = self.reader(file_path).read()
+        assert len(df.index) == 26
+        assert df["objektidentitet"].iloc[0] == "id0"
+        assert df.geometry.iloc[-1].geom_type == "LineString"
+
+    def test_empty_feature_collection(self):
+        file_path = self.write(
+            "empty.geojson", '{"type": "FeatureCollection", "features": []}'
+        )
+        assert self.reader(file_path).read().empty
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from osmapi import ApiError
+
+from models.http_session import anonymous_session, create_client, create_session
+from tests.osm_api_stub import OsmApiStub
+
+
+class TestHttpSession(TestCase):
+    def test_create_session(self):
+        session = create_session(pool_size=8)
+        adapter = session.get_adapter("https://www.openstreetmap.org")
+        assert adapter._pool_maxsize == 8
+        assert "POST" not in adapter.max_retries.allowed_methods
+        assert session.headers["Accept-Encoding"] == "gzip, deflate"
+        assert session.auth is None
+
+    def test_reads_share_the_anonymous_session(self):
+        first = create_client()
+        second = create_client()
+        assert first.http_session is second.http_session
+        assert first.http_session is anonymous_session()
+
+    def test_get_is_retried_by_the_adapter(self):
+        notes = {1: dict(lat=59.5, lon=17.8, status="open")}
+        with OsmApiStub(notes) as stub:
+            stub.failures["/api/0.6/notes/1"] = [503]
+            client = create_client(session=create_session(), api=stub.url)
+            assert client.NoteGet(1)["status"] == "open"
+            assert stub.requests == ["GET /api/0.6/notes/1"] * 2
+
+    def test_create_is_sent_once(self):
+        with OsmApiStub({}) as stub:
+            stub.failures["/api/0.6/notes"] = [503]
+            client = create_client(session=create_session(), api=stub.url)
+            with self.assertRaises(ApiError):
+                client.NoteCreate(dict(lat=59.5, lon=17.8, text="note"))
+            assert len([r for r in stub.requests if r.startswith("POST")]) == 1
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from models.note_cache import NoteCache
+from models.note_status_refresher import NoteStatusRefresher
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+from tests.osm_api_stub import OsmApiStub
+
+
+class TestNoteCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stub = OsmApiStub(
+            {
+                1: dict(lat=59.5, lon=17.8, status="open"),
+                2: dict(lat=59.6, lon=17.9, status="open"),
+                3: dict(lat=59.7, lon=17.95, status="closed", hidden=True),
+            }
+        ).__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__()
+        shutil.rmtree(self.directory)
+
+    def handler(self, **kwargs) -> OsmNoteHandler:
+        return OsmNoteHandler(
+            client=self.stub.client(),
+            note_cache=NoteCache(
+                file_path=os.path.join(self.directory, "cache.sqlite"), **kwargs
+            ),
+        )
+
+    def test_hit(self):
+        handler = self.handler()
+        assert handler.get_status(note_id=1) == (True, False)
+        assert handler.get_status(note_id=1) == (True, False)
+        assert len(self.stub.requests) == 1
+        assert handler.note_cache.statistics.hits == 1
+        assert handler.note_cache.statistics.misses == 1
+
+    def test_hits_are_not_rate_limited(self):
+        refresher = NoteStatusRefresher(
+            osmnoteuploader=self.handler(),
+            rate_limiter=RateLimiter(requests_per_second=0),
+            show_progress=False,
+        )
+        with patch.object(RateLimiter, "acquire") as acquire:
+            refresher.refresh(note_ids=[1, 2])
+            refresher.refresh(note_ids=[1, 2])
+        assert acquire.call_count == 2
+        assert refresher.osmnoteuploader.note_cache.statistics.hits == 2
+
+    def test_cache_survives_restarts(self):
+        self.handler().get_status(note_id=1)
+        assert self.handler().get_status(note_id=1) == (True, False)
+        assert len(self.stub.requests) == 1
+
+    def test_revalidate(self):
+        handler = self.handler(ttl=timedelta(0))
+        handler.get_status(note_id=1)
+        assert handler.get_status(note_id=1) == (True, False)
+        assert handler.note_cache.statistics.revalidated == 1
+        self.stub.notes[1]["status"] = "closed"
+        assert handler.get_status(note_id=1) == (False, False)
+        assert handler.note_cache.statistics.misses == 2
+
+    def test_hidden(self):
+        handler = self.handler()
+        assert handler.get_status(note_id=3) == (False, True)
+        assert handler.is_hidden(note_id=3)
+        assert len(self.stub.requests) == 1
+
+    def test_bypass(self):
+        handler = self.handler()
+        handler.get_status(note_id=1)
+        self.stub.notes[1]["status"] = "closed"
+        assert handler.get_status(note_id=1) == (True, False)
+        assert handler.get_status(note_id=1, bypass_cache=True) == (False, False)
+        # the authoritative answer is cached
+        assert handler.get_status(note_id=1) == (False, False)
+
+    def test_evict_least_recently_used(self):
+        handler = self.handler(max_entries=2)
+        handler.get_status(note_id=1)
+        handler.get_status(note_id=2)
+        handler.get_status(note_id=1)
+        handler.get_status(note_id=3)
+        assert handler.note_cache.get(1) is not None
+        assert handler.note_cache.get(2) is None
+        assert handler.note_cache.get(3) is not None
+
+    def test_close_invalidates(self):
+        handler = self.handler()
+        # the stub needs no login
+        handler.initialized = True
+        handler.get_status(note_id=1)
+        handler.close(note_id=1, comment="closing")
+        assert handler.get_status(note_id=1) == (False, False)
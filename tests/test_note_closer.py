@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from models.note_closer import NoteCloser
+from models.note_status_refresher import NoteStatusRefresher
+from models.notes_store import CsvNotesStore
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+from tests.osm_api_stub import OsmApiStub
+
+
+class TestNoteCloser(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = CsvNotesStore(file_path=os.path.join(self.directory, "notes.csv"))
+        for note_id, is_open in [(1, True), (2, True), (3, False), (4, True)]:
+            self.store.append(
+                dict(note_id=note_id, latitude=59.5, longitude=17.8, open=is_open)
+            )
+        self.stub = OsmApiStub(
+            {
+                1: dict(lat=59.5, lon=17.8, status="open"),
+                2: dict(lat=59.5, lon=17.8, status="closed"),
+                3: dict(lat=59.5, lon=17.8, status="closed"),
+                4: dict(lat=59.5, lon=17.8, status="open"),
+            }
+        ).__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__()
+        shutil.rmtree(self.directory)
+
+    def closer(self, **kwargs) -> NoteCloser:
+        return NoteCloser(
+            notes_store=CsvNotesStore(file_path=self.store.file_path),
+            refresher=NoteStatusRefresher(
+                osmnoteuploader=OsmNoteHandler(
+                    client=self.stub.client(), initialized=True
+                ),
+                max_workers=2,
+                rate_limiter=RateLimiter(requests_per_second=0),
+                show_progress=False,
+            ),
+            comment="closing",
+            **kwargs,
+        )
+
+    def posts(self):
+        return sorted(r for r in self.stub.requests if r.startswith("POST"))
+
+    def test_default_refresher(self):
+        closer = NoteCloser(notes_store=self.store)
+        assert closer.refresher.rate_limiter.requests_per_second > 0
+        assert NoteCloser(notes_store=self.store).refresher is not closer.refresher
+
+    def test_dry_run(self):
+        report = self.closer(dry_run=True).close_open_notes()
+        assert report.closed == 0
+        assert self.posts() == []
+        df = CsvNotesStore(file_path=self.store.file_path).read_dataframe()
+        assert list(df["open"]) == [True, True, False, True]
+
+    def test_close_and_resume(self):
+        self.stub.failures["/api/0.6/notes/4/close?text=closing"] = [403]
+        report = self.closer().close_open_notes()
+        assert (report.closed, report.already_closed, report.failed) == (1, 1, 1)
+        df = CsvNotesStore(file_path=self.store.file_path).read_dataframe()
+        assert list(df["open"]) == [False, False, False, True]
+        # the second run only closes the note that failed
+        self.stub.requests.clear()
+        report = self.closer().close_open_notes()
+        assert (report.closed, report.already_closed, report.failed) == (1, 0, 0)
+        assert self.posts() == ["POST /api/0.6/notes/4/close?text=closing"]
+        df = CsvNotesStore(file_path=self.store.file_path).read_dataframe()
+        assert not df["open"].any()
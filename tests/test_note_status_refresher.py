@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas
+import requests
+from osmapi import ApiError
+from pandas import DataFrame
+
+from models.http_session import is_transient
+from models.note_status_refresher import NoteStatusRefresher
+from models.osm_note_uploader import OsmNoteHandler
+from models.rate_limiter import RateLimiter
+from tests.osm_api_stub import OsmApiStub
+
+
+def notes():
+    return {
+        1: dict(lat=59.5, lon=17.8, status="open"),
+        2: dict(lat=59.6, lon=17.9, status="closed"),
+        3: dict(lat=59.7, lon=17.95, status="closed", hidden=True),
+    }
+
+
+class TestNoteStatusRefresher(TestCase):
+    def refresher(self, stub: OsmApiStub) -> NoteStatusRefresher:
+        return NoteStatusRefresher(
+            osmnoteuploader=OsmNoteHandler(client=stub.client()),
+            max_workers=3,
+            rate_limiter=RateLimiter(requests_per_second=0),
+            backoff_seconds=0.01,
+            show_progress=False,
+        )
+
+    def test_refresh(self):
+        with OsmApiStub(notes()) as stub:
+            statuses = self.refresher(stub).refresh(note_ids=[1, 2, 3])
+            assert statuses[1].open is True and statuses[1].hidden is False
+            assert statuses[2].open is False and statuses[2].hidden is False
+            assert statuses[3].open is False and statuses[3].hidden is True
+            # one request per note
+            assert len(stub.requests) == 3
+
+    def test_refresh_retries_rate_limited_requests(self):
+        with OsmApiStub(notes()) as stub:
+            stub.failures["/api/0.6/notes/1"] = [429, 429]
+            statuses = self.refresher(stub).refresh(note_ids=[1])
+            assert statuses[1].open is True
+            assert len(stub.requests) == 3
+
+    def test_refresh_gives_up_on_one_note_only(self):
+        with OsmApiStub(notes()) as stub:
+            stub.failures["/api/0.6/notes/1"] = [429] * 10
+            refresher = self.refresher(stub)
+            refresher.max_retries = 2
+            statuses = refresher.refresh(note_ids=[1, 2])
+            assert list(statuses) == [2]
+            assert stub.requests.count("GET /api/0.6/notes/1") == 3
+
+    def test_refresh_notes_keeps_failed_notes(self):
+        notes_df = DataFrame(
+            {
+                "note_id": [1, 2],
+                "latitude": [59.5, 59.6],
+                "longitude": [17.8, 17.9],
+                "open": [True, True],
+                "hidden": [False, False],
+            }
+        )
+        with OsmApiStub(notes()) as stub:
+            stub.failures["/api/0.6/notes/2"] = [429] * 10
+            refresher = self.refresher(stub)
+            refresher.max_retries = 1
+            report = refresher.refresh_notes(notes_df=notes_df)
+        assert (report.fetched, report.failed) == (2, 1)
+        assert list(notes_df["open"]) == [True, True]
+        # checked again in the next run
+        assert pandas.isna(notes_df.loc[1, "last_checked"])
+
+    def test_is_transient(self):
+        assert is_transient(ApiError(0, "Request timed out", ""))
+        assert is_transient(ApiError(503, "Service Unavailable", ""))
+        assert is_transient(requests.ConnectionError())
+        assert not is_transient(ApiError(404, "Not Found", ""))
+
+    def test_default_rate_limiter(self):
+        assert NoteStatusRefresher().rate_limiter.requests_per_second > 0
+
+    def test_tiles(self):
+        notes_df = DataFrame(
+            {
+                "note_id": [1, 2, 3],
+                "latitude": [59.5, 59.6, 62.0],
+                "longitude": [17.8, 17.9, 15.0],
+            }
+        )
+        tiles = NoteStatusRefresher(tile_size=0.25).tiles(notes_df)
+        assert len(tiles) == 2
+        for min_lon, min_lat, max_lon, max_lat in tiles:
+            assert (max_lon - min_lon) * (max_lat - min_lat) <= 25
+
+    def test_refresh_bulk(self):
+        with OsmApiStub(notes()) as stub:
+            notes_df = DataFrame(
+                {
+                    "note_id": [1, 2, 3],
+                    "latitude": [59.5, 59.6, 59.7],
+                    "longitude": [17.8, 17.9, 17.95],
+                }
+            )
+            statuses = self.refresher(stub).refresh_bulk(notes_df=notes_df)
+            assert statuses[1].open is True
+            assert statuses[2].open is False and statuses[2].hidden is False
+            assert statuses[3].hidden is True
+            # one tile and one NoteGet for the hidden note
+            assert len(stub.requests) == 2
+            assert stub.requests[-1] == "GET /api/0.6/notes/3"
+
+    def test_refresh_notes_skips_terminal_notes(self):
+        now = datetime.now()
+        notes_df = DataFrame(
+            {
+                "note_id": [1, 2, 3, 4, 5],
+                "latitude": [59.5] * 5,
+                "longitude": [17.8] * 5,
+                # checked within the ttl, never checked, hidden,
+                # closed long ago, closed recently and checked long ago
+                "open": [True, True, False, False, False],
+                "hidden": [False, False, True, False, False],
+                "last_checked": [
+                    str(now - timedelta(hours=1)),
+                    None,
+                    str(now - timedelta(days=100)),
+                    str(now - timedelta(days=100)),
+                    str(now - timedelta(days=2)),
+                ],
+                "status_changed_at": [
+                    None,
+                    None,
+                    None,
+                    str(now - timedelta(days=100)),
+                    str(now - timedelta(days=3)),
+                ],
+            }
+        )
+        stub_notes = {
+            1: dict(lat=59.5, lon=17.8, status="open"),
+            2: dict(lat=59.5, lon=17.8, status="closed"),
+            5: dict(lat=59.5, lon=17.8, status="closed"),
+        }
+        with OsmApiStub(stub_notes) as stub:
+            refresher = self.refresher(stub)
+            refresher.closed_note_terminal_age = timedelta(days=30)
+            refresher.open_note_ttl = timedelta(hours=24)
+            report = refresher.refresh_notes(notes_df=notes_df)
+            assert sorted(stub.requests) == [
+                "GET /api/0.6/notes/2",
+                "GET /api/0.6/notes/5",
+            ]
+        assert (report.skipped, report.fetched, report.changed) == (3, 2, 1)
+        assert list(notes_df["open"]) == [True, False, False, False, False]
+        assert notes_df.loc[1, "status_changed_at"] is not None
+        assert notes_df.loc[4, "status_changed_at"] == str(now - timedelta(days=3))
+        assert pandas.isna(notes_df.loc[0, "status_changed_at"])
+
+    def test_legacy_closed_note_becomes_terminal(self):
+        start = datetime(2024, 1, 1)
+        notes_df = DataFrame(
+            {
+                "note_id": [2],
+                "latitude": [59.6],
+                "longitude": [17.9],
+                "open": [False],
+                "hidden": [False],
+                # closed before status_changed_at was recorded
+                "last_checked": [str(start - timedelta(days=2))],
+                "status_changed_at": [None],
+            }
+        )
+        with OsmApiStub(notes()) as stub, patch(
+            "models.note_status_refresher.datetime"
+        ) as clock:
+            refresher = self.refresher(stub)
+            refresher.closed_note_terminal_age = timedelta(days=30)
+            refresher.open_note_ttl = timedelta(hours=24)
+            for day in range(0, 60, 2):
+                clock.now.return_value = start + timedelta(days=day)
+                refresher.refresh_notes(notes_df=notes_df)
+            fetches = len(stub.requests)
+        assert notes_df.loc[0, "status_changed_at"] == str(start)
+        # checked every other day until it was closed for 30 days
+        assert fetches == 16
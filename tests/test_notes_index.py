@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas
+from shapely import Point
+
+from models.GeojsonHandler import GeojsonHandler
+from models.notes_index import NotesIndex
+from models.osm_note_uploader import OsmNoteHandler
+
+
+class TestNotesIndex(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def test_query_from_notes_file(self):
+        notes_index = NotesIndex()
+        notes_index.build(pandas.read_csv("test_data/notes.csv"))
+        df = notes_index.query(point=Point(17.8330, 59.5295))
+        assert len(df.index) == 1
+        assert df["note_id"].iloc[0] == 3915849
+        assert df["distance_to_point"].iloc[0] < 100
+
+    def test_query_far_away(self):
+        notes_index = NotesIndex()
+        notes_index.build(pandas.read_csv("test_data/notes.csv"))
+        assert notes_index.query(point=Point(17.84, 59.5295)).empty
+
+    def test_query_across_cell_border(self):
+        notes_index = NotesIndex()
+        notes_index.add(dict(note_id=1, latitude=59.99999, longitude=17.99999))
+        df = notes_index.query(point=Point(18.00001, 60.00001))
+        assert list(df["note_id"]) == [1]
+
+    def test_note_created_in_the_same_run_blocks_duplicate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "notes.csv")
+            gh = GeojsonHandler(notes_file_path=file)
+            point = Point(17.8322943, 59.5292131)
+            assert gh.calculate_distance_to_previously_created_osm_notes(point).empty
+            uploader = OsmNoteHandler(notes_file_path=file, notes_index=gh.notes_index)
+            uploader.write_note_information_to_csv(note_id=1, point=point)
+            df = gh.calculate_distance_to_previously_created_osm_notes(point)
+            assert list(df["note_id"]) == [1]
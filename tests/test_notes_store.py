@@ -0,0 +1,103 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+import pandas
+from shapely import Point
+
+from models.GeojsonHandler import GeojsonHandler
+from models.notes_store import (
+    CsvNotesStore,
+    NOTES_COLUMNS,
+    NotesStore,
+    SqliteNotesStore,
+    get_notes_store,
+)
+from models.osm_note_uploader import OsmNoteHandler
+
+
+def note(note_id: int):
+    return dict(
+        date=datetime(2023, 9, 30),
+        note_id=note_id,
+        latitude=59.5,
+        longitude=17.8,
+        open=True,
+        hidden=False,
+    )
+
+
+class TestNotesStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_notes_store(self):
+        assert isinstance(get_notes_store("notes.csv"), CsvNotesStore)
+        assert isinstance(get_notes_store("notes.sqlite"), SqliteNotesStore)
+
+    def test_backend_methods_are_abstract(self):
+        with self.assertRaises(TypeError):
+            NotesStore(file_path="notes.csv")
+
+    def test_csv_append(self):
+        file = os.path.join(self.directory, "notes.csv")
+        store = CsvNotesStore(file_path=file)
+        store.append(note(1))
+        store.append(note(2))
+        df = pandas.read_csv(file)
+        assert list(df.columns) == list(NOTES_COLUMNS)
+        assert list(df["note_id"]) == [1, 2]
+        assert list(store.read_dataframe()["note_id"]) == [1, 2]
+
+    def test_csv_append_migrates_old_header(self):
+        file = os.path.join(self.directory, "notes.csv")
+        shutil.copy("test_data/notes.csv", file)
+        store = CsvNotesStore(file_path=file)
+        store.append(note(2))
+        df = pandas.read_csv(file)
+        assert list(df.columns) == list(NOTES_COLUMNS)
+        assert list(df["note_id"]) == [3915849, 2]
+        assert list(df["hidden"]) == [False, False]
+
+    def test_sqlite_append_and_replace(self):
+        store = SqliteNotesStore(file_path=os.path.join(self.directory, "notes.db"))
+        store.append(note(1))
+        store.append(note(2))
+        df = store.read_dataframe()
+        assert list(df["note_id"]) == [1, 2]
+        df["open"] = [False, True]
+        store.write_dataframe(df)
+        reloaded = SqliteNotesStore(file_path=store.file_path).read_dataframe()
+        assert list(reloaded["open"]) == [False, True]
+
+    def test_read_dataframe_is_live(self):
+        file = os.path.join(self.directory, "notes.csv")
+        gh = GeojsonHandler(notes_file_path=file)
+        gh.read_notes_dataframe()
+        assert gh.notes_df.empty
+        uploader = OsmNoteHandler(notes_store=gh.get_notes_store())
+        uploader.write_note_information_to_csv(
+            note_id=1, point=Point(17.8322943, 59.5292131)
+        )
+        gh.read_notes_dataframe()
+        assert list(gh.notes_df["note_id"]) == [1]
+
+    def test_sqlite_adds_new_columns(self):
+        file = os.path.join(self.directory, "notes.db")
+        connection = sqlite3.connect(file)
+        connection.execute(
+            "CREATE TABLE notes (date TEXT, note_id INTEGER, latitude REAL, "
+            "longitude REAL, open INTEGER, hidden INTEGER)"
+        )
+        connection.commit()
+        connection.close()
+        store = SqliteNotesStore(file_path=file)
+        store.append(dict(note(1), last_checked=datetime(2023, 10, 1)))
+        df = store.load()
+        assert df["last_checked"].iloc[0] == "2023-10-01 00:00:00"
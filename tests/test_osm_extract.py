@@ -0,0 +1,224 @@
+import importlib.util
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from unittest import TestCase, skipUnless
+from urllib.parse import parse_qs
+
+from requests import HTTPError
+
+from models.osm_extract import OverpassSource, PbfSource, TiledOsmCache, parse_tag
+
+ELEMENTS: List[Dict[str, Any]] = [
+    dict(type="node", id=1, lat=59.52, lon=17.83),
+    # closed way in the next tile
+    dict(
+        type="way",
+        id=2,
+        geometry=[
+            dict(lat=59.6, lon=18.1),
+            dict(lat=59.6, lon=18.2),
+            dict(lat=59.7, lon=18.2),
+            dict(lat=59.6, lon=18.1),
+        ],
+    ),
+    dict(
+        type="way",
+        id=3,
+        geometry=[dict(lat=59.4, lon=17.7), dict(lat=59.41, lon=17.7)],
+    ),
+    dict(type="relation", id=4, center=dict(lat=59.3, lon=17.6)),
+]
+
+
+class OverpassStub:
+    """Answer every query with the elements inside its bounding box"""
+
+    def __init__(self):
+        self.queries: List[str] = []
+        self.elements = list(ELEMENTS)
+        # status codes for the next queries, None answers normally
+        self.failures: List[Optional[int]] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                query = parse_qs(self.rfile.read(length).decode())["data"][0]
+                stub.queries.append(query)
+                failure = stub.failures.pop(0) if stub.failures else None
+                if failure is not None:
+                    self.send_response(failure)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                south, west, north, east = map(
+                    float, re.search(r"\(([^()]*)\);", query).group(1).split(",")
+                )
+
+                def inside(element):
+                    positions = element.get("geometry") or [
+                        element.get("center") or element
+                    ]
+                    return any(
+                        south <= position["lat"] <= north
+                        and west <= position["lon"] <= east
+                        for position in positions
+                    )
+
+                body = json.dumps(
+                    dict(elements=[e for e in stub.elements if inside(e)])
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/interpreter"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestOsmExtract(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stub = OverpassStub()
+
+    def tearDown(self):
+        self.stub.close()
+        shutil.rmtree(self.directory)
+
+    def cache(self, **kwargs) -> TiledOsmCache:
+        return TiledOsmCache(
+            source=OverpassSource(
+                tags=["leisure=bathing_place"],
+                url=self.stub.url,
+                max_retries=2,
+                backoff_seconds=0.01,
+            ),
+            directory=self.directory,
+            **kwargs,
+        )
+
+    def test_parse_tag(self):
+        assert parse_tag("leisure=bathing_place") == ("leisure", "bathing_place")
+        assert parse_tag("amenity") == ("amenity", None)
+
+    def test_query(self):
+        query = OverpassSource(tags=["leisure=bathing_place", "amenity"]).query(
+            (17.5, 59.0, 18.0, 59.5)
+        )
+        assert 'node["leisure"="bathing_place"](59.0,17.5,59.5,18.0);' in query
+        assert 'way["amenity"](59.0,17.5,59.5,18.0);' in query
+        assert 'relation["amenity"](59.0,17.5,59.5,18.0);' in query
+
+    def test_parse_elements(self):
+        df = OverpassSource.parse_elements(ELEMENTS)
+        assert list(df["id"]) == ["node/1", "way/2", "way/3", "relation/4"]
+        assert list(df.geom_type) == ["Point", "Polygon", "LineString", "Point"]
+
+    def test_load_only_fetches_stale_tiles(self):
+        cache = self.cache()
+        df = cache.load((17.5, 59.2, 18.3, 59.8))
+        # 2 rows and 2 columns of tiles
+        assert len(self.stub.queries) == 4
+        assert sorted(df["id"]) == ["node/1", "relation/4", "way/2", "way/3"]
+        df = cache.load((17.5, 59.2, 18.3, 59.8))
+        assert len(self.stub.queries) == 4
+        assert len(df.index) == 4
+
+    def test_load_tiles_intersecting_bounds(self):
+        df = self.cache().load((17.8, 59.5, 17.9, 59.55))
+        assert len(self.stub.queries) == 1
+        assert list(df["id"]) == ["node/1"]
+
+    def test_refresh_stale_tiles(self):
+        assert len(self.cache().refresh((17.8, 59.5, 17.9, 59.55))) == 1
+        assert self.cache().refresh((17.8, 59.5, 17.9, 59.55)) == []
+        stale_cache = self.cache(max_age=timedelta(0))
+        assert len(stale_cache.refresh((17.8, 59.5, 17.9, 59.55))) == 1
+        assert len(self.stub.queries) == 2
+
+    def test_busy_server_is_retried(self):
+        self.stub.failures = [429, 504]
+        df = self.cache().load((17.8, 59.5, 17.9, 59.55))
+        assert len(self.stub.queries) == 3
+        assert list(df["id"]) == ["node/1"]
+
+    def test_failed_refresh_keeps_the_fetched_tiles(self):
+        cache = self.cache()
+        # the first tile succeeds, the second fails after all retries
+        self.stub.failures = [None, 503, 503, 503]
+        with self.assertRaises(HTTPError):
+            cache.refresh((17.5, 59.2, 18.3, 59.8))
+        assert len(self.stub.queries) == 4
+        # only the tiles left are fetched again
+        assert len(cache.refresh((17.5, 59.2, 18.3, 59.8))) == 3
+
+    def test_features_are_stored_once(self):
+        cache = self.cache(tile_size=0.1)
+        df = cache.load((17.5, 59.2, 18.3, 59.8))
+        assert sorted(df["id"]) == ["node/1", "relation/4", "way/2", "way/3"]
+
+    def test_feature_crossing_a_tile_edge(self):
+        self.stub.elements.append(
+            dict(
+                type="way",
+                id=5,
+                geometry=[dict(lat=59.6, lon=17.99), dict(lat=59.6, lon=18.4)],
+            )
+        )
+        cache = self.cache(tile_size=0.5)
+        # most of the way is in the tile east of the bounds
+        df = cache.load((17.9, 59.55, 17.995, 59.65))
+        assert sorted(df["id"]) == ["node/1", "way/5"]
+        # loaded once from both tiles
+        df = cache.load((17.9, 59.55, 18.3, 59.65))
+        assert sorted(df["id"]) == ["node/1", "way/2", "way/5"]
+
+    @skipUnless(importlib.util.find_spec("osmium"), "needs pyosmium")
+    def test_pbf_source(self):
+        import osmium
+        from osmium.osm.mutable import Node, Way
+
+        file_path = os.path.join(self.directory, "extract.osm.pbf")
+        writer = osmium.SimpleWriter(file_path)
+        writer.add_node(
+            Node(id=1, location=(17.83, 59.52), tags={"leisure": "bathing_place"})
+        )
+        for node_id, location in enumerate(
+            [(18.1, 59.6), (18.2, 59.6), (18.2, 59.7), (17.7, 59.4), (17.7, 59.41)],
+            start=10,
+        ):
+            writer.add_node(Node(id=node_id, location=location))
+        writer.add_way(
+            Way(id=2, nodes=[10, 11, 12, 10], tags={"leisure": "bathing_place"})
+        )
+        writer.add_way(Way(id=3, nodes=[13, 14], tags={"leisure": "bathing_place"}))
+        writer.add_way(Way(id=4, nodes=[13, 14], tags={"highway": "path"}))
+        writer.close()
+        cache = TiledOsmCache(
+            source=PbfSource(tags=["leisure=bathing_place"], file_path=file_path),
+            directory=self.directory,
+        )
+        df = cache.load((17.5, 59.2, 18.3, 59.8))
+        assert sorted(df["id"]) == ["node/1", "way/2", "way/3"]
+        assert cache.refresh((17.5, 59.2, 18.3, 59.8)) == []
@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+import geopandas
+from shapely import LineString, Point, Polygon
+
+from models.GeojsonHandler import GeojsonHandler
+from models.osm_feature_index import OsmFeatureIndex
+
+
+class TestOsmFeatureIndex(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    point = Point(17.8322943, 59.5292131)
+
+    def osm_df(self):
+        return geopandas.GeoDataFrame(
+            {"name": ["near point", "far point", "polygon", "line", "far line"]},
+            geometry=[
+                Point(17.8330, 59.5295),
+                Point(17.9, 59.6),
+                Polygon(
+                    [
+                        (17.8318, 59.5290),
+                        (17.8328, 59.5290),
+                        (17.8328, 59.5296),
+                        (17.8318, 59.5296),
+                    ]
+                ),
+                LineString([(17.8310, 59.5300), (17.8340, 59.5300)]),
+                LineString([(17.7, 59.4), (17.7, 59.41)]),
+            ],
+            crs="EPSG:4326",
+        )
+
+    def test_query_matches_full_scan(self):
+        osm_df = self.osm_df()
+        index = OsmFeatureIndex(osm_df=osm_df)
+        df = index.query(
+            point=self.point,
+            distance_function=GeojsonHandler.calculate_distance_geopandas,
+        )
+        full_scan = osm_df.copy()
+        full_scan["distance_to_point"] = osm_df.apply(
+            GeojsonHandler.calculate_distance_geopandas, axis=1, args=(self.point,)
+        )
+        full_scan = full_scan.loc[full_scan["distance_to_point"] <= 100].sort_values(
+            by="distance_to_point"
+        )
+        assert list(df["name"]) == list(full_scan["name"])
+        assert list(df["distance_to_point"]) == list(full_scan["distance_to_point"])
+        assert set(df["name"]) == {"near point", "polygon", "line"}
+
+    def test_vectorized_query_matches_distance_function(self):
+        index = OsmFeatureIndex(osm_df=self.osm_df())
+        df = index.query(point=self.point)
+        expected = index.query(
+            point=self.point,
+            distance_function=GeojsonHandler.calculate_distance_geopandas,
+        )
+        assert list(df["name"]) == list(expected["name"])
+        for distance, expected_distance in zip(
+            df["distance_to_point"], expected["distance_to_point"]
+        ):
+            self.assertAlmostEqual(distance, expected_distance, delta=0.01)
+
+    def test_query_empty(self):
+        index = OsmFeatureIndex(osm_df=self.osm_df())
+        df = index.query(
+            point=Point(11.0, 58.0),
+            distance_function=GeojsonHandler.calculate_distance_geopandas,
+        )
+        assert df.empty
+
+    def test_envelope_contains_radius(self):
+        index = OsmFeatureIndex()
+        envelope = index.envelope(self.point)
+        minx, miny, maxx, maxy = envelope.bounds
+        # 100m is about 0.0009 degrees latitude and 0.0018 degrees longitude here
+        assert maxy - self.point.y > 0.0009
+        assert maxx - self.point.x > 0.0018
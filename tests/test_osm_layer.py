@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+import geopandas
+import numpy
+from shapely import (
+    GeometryCollection,
+    LineString,
+    MultiLineString,
+    MultiPolygon,
+    Point,
+    Polygon,
+)
+
+from models.exceptions import GeometryError
+from models.GeojsonHandler import GeojsonHandler
+from models.osm_layer import OsmLayer
+
+
+def square(x: float, y: float, size: float = 0.0004) -> Polygon:
+    return Polygon([(x, y), (x + size, y), (x + size, y + size), (x, y + size)])
+
+
+class TestOsmLayer(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    point = Point(17.8322943, 59.5292131)
+
+    def osm_df(self):
+        return geopandas.GeoDataFrame(
+            {"name": ["point", "polygon", "line", "multipolygon", "multiline"]},
+            geometry=[
+                Point(17.8330, 59.5295),
+                square(17.8318, 59.5290),
+                LineString([(17.8310, 59.5300), (17.8340, 59.5300)]),
+                MultiPolygon([square(17.8300, 59.5280), square(17.8320, 59.5280)]),
+                MultiLineString(
+                    [
+                        [(17.8300, 59.5285), (17.8310, 59.5285)],
+                        [(17.8330, 59.5290), (17.8330, 59.5300)],
+                    ]
+                ),
+            ],
+            crs="EPSG:4326",
+        )
+
+    def test_distances_match_calculate_distance_geopandas(self):
+        osm_df = self.osm_df()
+        layer = OsmLayer(osm_df=osm_df)
+        distances = layer.distances(self.point, numpy.arange(len(osm_df.index)))
+        expected = osm_df.apply(
+            GeojsonHandler.calculate_distance_geopandas, axis=1, args=(self.point,)
+        )
+        numpy.testing.assert_allclose(distances, expected, atol=1)
+
+    def test_representative_geometries(self):
+        layer = OsmLayer(osm_df=self.osm_df())
+        assert layer.representative[0] == Point(17.8330, 59.5295)
+        assert layer.representative[1].geom_type == "Point"
+        assert layer.representative[2].geom_type == "LineString"
+        # the centroid between the two squares
+        self.assertAlmostEqual(layer.representative[3].x, 17.8312)
+        assert layer.representative[4].geom_type == "MultiLineString"
+
+    def test_multi_line_closest_part(self):
+        layer = OsmLayer(osm_df=self.osm_df())
+        # about 25m east of the second part of the multiline
+        point = Point(17.83345, 59.5295)
+        distance = layer.distances(point, numpy.array([4]))[0]
+        assert 20 < distance < 30
+
+    def test_projected_layer_is_cached(self):
+        layer = OsmLayer(osm_df=self.osm_df())
+        projected = layer.geodataframe(crs="EPSG:3006")
+        assert layer.geodataframe(crs="EPSG:3006") is projected
+        assert list(projected.index) == list(range(5))
+
+    def test_unsupported_geometry(self):
+        osm_df = geopandas.GeoDataFrame(
+            geometry=[GeometryCollection([Point(17.8, 59.5)])], crs="EPSG:4326"
+        )
+        with self.assertRaises(GeometryError):
+            OsmLayer(osm_df=osm_df)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+from typing import List
+from unittest import TestCase
+
+import geopandas
+from pandas import DataFrame
+from shapely import Point
+
+from models.async_note_uploader import AsyncNoteUploader
+from models.notes_index import NotesIndex
+from models.notes_store import CsvNotesStore
+from models.osm_note_uploader import OsmNoteHandler
+from models.pipeline import Candidate, NotePipeline, read_candidates, write_candidates
+from models.rate_limiter import RateLimiter
+from models.upload_journal import COMMITTED, UploadJournal
+from tests.osm_api_stub import OsmApiStub
+
+
+class TestNotePipeline(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stub = OsmApiStub().__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__()
+        shutil.rmtree(self.directory)
+
+    def uploader(self, **kwargs) -> AsyncNoteUploader:
+        return AsyncNoteUploader(
+            osmnoteuploader=OsmNoteHandler(
+                client=self.stub.client(),
+                # the stub needs no login
+                initialized=True,
+                notes_store=CsvNotesStore(
+                    file_path=os.path.join(self.directory, "notes.csv")
+                ),
+            ),
+            journal=UploadJournal(
+                file_path=os.path.join(self.directory, "notes.csv.uploads.csv")
+            ),
+            rate_limiter=RateLimiter(requests_per_second=0),
+            backoff_seconds=0.01,
+            **kwargs,
+        )
+
+    def uploaded_points(self) -> List[Point]:
+        return [
+            Point(note["lon"], note["lat"]) for note in self.stub.notes.values()
+        ]
+
+    def source_df(self):
+        return geopandas.GeoDataFrame(
+            {"objektidentitet": ["a", "b", "c", "d"]},
+            geometry=[
+                Point(17.8322943, 59.5292131),  # near the osm point
+                Point(17.9, 59.7),  # near an existing note
+                Point(18.2, 59.8),  # nothing nearby
+                Point(18.2001, 59.8001),  # next to c
+            ],
+            crs="EPSG:4326",
+        )
+
+    def pipeline(self, **kwargs) -> NotePipeline:
+        osm_df = geopandas.GeoDataFrame(
+            {"id": [1]}, geometry=[Point(17.8330, 59.5295)], crs="EPSG:4326"
+        )
+        notes_index = NotesIndex()
+        notes_index.build(
+            DataFrame([dict(note_id=1, latitude=59.7001, longitude=17.9001)])
+        )
+        return NotePipeline(osm_df=osm_df, notes_index=notes_index, **kwargs)
+
+    def test_match(self):
+        candidates = list(self.pipeline().match([self.source_df()]))
+        assert [candidate.source_id for candidate in candidates] == ["b", "c", "d"]
+        assert candidates[0].source_index == 1
+        assert candidates[0].latitude == 59.7
+
+    def test_plan(self):
+        pipeline = self.pipeline()
+        candidates = list(pipeline.plan(pipeline.match([self.source_df()])))
+        # b has a note nearby and d is next to the planned c
+        assert [candidate.source_id for candidate in candidates] == ["c"]
+
+    def test_write_and_read_candidates(self):
+        file_path = os.path.join(self.directory, "plan.csv")
+        candidates = [
+            Candidate(source_index=2, source_id="c", latitude=59.8, longitude=18.2),
+            Candidate(source_index=3, latitude=59.8001, longitude=18.2001),
+        ]
+        assert list(write_candidates(file_path, candidates)) == candidates
+        assert list(read_candidates(file_path)) == candidates
+
+    def test_run(self):
+        pipeline = self.pipeline(
+            upload_to_osm=True, queue_size=1, uploader=self.uploader()
+        )
+        plan_file = os.path.join(self.directory, "plan.csv")
+        source_df = self.source_df()
+        chunks = [source_df.iloc[:2], source_df.iloc[2:]]
+        assert pipeline.run(chunks=chunks, plan_file=plan_file) == 1
+        assert self.uploaded_points() == [Point(18.2, 59.8)]
+        assert [c.source_id for c in read_candidates(plan_file)] == ["c"]
+        assert not pipeline.stopped
+
+    def test_run_again_does_not_duplicate_notes(self):
+        plan_file = os.path.join(self.directory, "plan.csv")
+        for _ in range(2):
+            pipeline = self.pipeline(upload_to_osm=True, uploader=self.uploader())
+            pipeline.run(chunks=[self.source_df()], plan_file=plan_file)
+        assert self.uploaded_points() == [Point(18.2, 59.8)]
+        journal = UploadJournal(
+            file_path=os.path.join(self.directory, "notes.csv.uploads.csv")
+        )
+        assert journal.state(journal.key(Point(18.2, 59.8))) == COMMITTED
+
+    def test_run_without_upload_is_not_finished(self):
+        pipeline = self.pipeline(upload_to_osm=False)
+        plan_file = os.path.join(self.directory, "plan.csv")
+        assert pipeline.run(chunks=[self.source_df()], plan_file=plan_file) == 0
+        assert pipeline.number_of_unfinished_candidates == 1
+        assert pipeline.stopped
+
+    def test_run_stops_at_max_open_notes(self):
+        pipeline = self.pipeline(
+            upload_to_osm=True, uploader=self.uploader(max_number_of_open_notes=0)
+        )
+        plan_file = os.path.join(self.directory, "plan.csv")
+        assert pipeline.run(chunks=[self.source_df()], plan_file=plan_file) == 0
+        assert self.uploaded_points() == []
+        assert pipeline.stopped
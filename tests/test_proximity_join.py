@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+import geopandas
+from geopy.distance import distance
+from shapely import LineString, Point, Polygon
+
+from models.GeojsonHandler import GeojsonHandler
+from models.proximity_join import ProximityJoin
+
+
+class TestProximityJoin(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def source_df(self):
+        return geopandas.GeoDataFrame(
+            {"objektidentitet": ["a", "b", "c", "d"]},
+            geometry=[
+                Point(17.8322943, 59.5292131),  # near the osm point
+                Point(17.9, 59.7),  # far from everything
+                Point(17.7005, 59.405),  # near the line
+                Point(18.1002, 59.6001),  # near the polygon centroid
+            ],
+            crs="EPSG:4326",
+        )
+
+    def osm_df(self):
+        return geopandas.GeoDataFrame(
+            {"name": ["point", "line", "polygon"]},
+            geometry=[
+                Point(17.8330, 59.5295),
+                LineString([(17.7, 59.4), (17.7, 59.41)]),
+                Polygon(
+                    [(18.0995, 59.5995), (18.1005, 59.5995), (18.1005, 59.6005)]
+                ),
+            ],
+            crs="EPSG:4326",
+        )
+
+    def test_join(self):
+        df = ProximityJoin(source_df=self.source_df(), osm_df=self.osm_df()).join()
+        assert list(df["matched"]) == [True, False, True, True]
+        assert list(df["nearest_osm_index"]) == [0, None, 1, 2]
+
+    def test_join_agrees_with_geodesic_distance(self):
+        osm_df = self.osm_df()
+        gh = GeojsonHandler(osm_df=osm_df)
+        df = ProximityJoin(source_df=self.source_df(), osm_df=osm_df).join()
+        for index, row in self.source_df().iterrows():
+            osm_distance_df = gh.calculate_distance_to_osm_features(row.geometry)
+            assert df.loc[index, "matched"] == (not osm_distance_df.empty)
+            if not osm_distance_df.empty:
+                self.assertAlmostEqual(
+                    df.loc[index, "distance_to_osm"],
+                    osm_distance_df["distance_to_point"].iloc[0],
+                    delta=0.5,
+                )
+
+    def test_join_near_the_radius_agrees_with_geopy(self):
+        osm_point = Point(24.0, 60.0)
+        points = []
+        for meters in (99.0, 99.8, 99.95, 100.05, 100.2, 101.0):
+            for bearing in (0, 45, 90, 135):
+                destination = distance(meters=meters).destination(
+                    (osm_point.y, osm_point.x), bearing
+                )
+                points.append(Point(destination.longitude, destination.latitude))
+        source_df = geopandas.GeoDataFrame(geometry=points, crs="EPSG:4326")
+        osm_df = geopandas.GeoDataFrame(geometry=[osm_point], crs="EPSG:4326")
+        # far from the central meridian of the zone the planar distance
+        # is about 0.3% longer than the geodesic one
+        df = ProximityJoin(
+            source_df=source_df, osm_df=osm_df, metric_crs="EPSG:32633"
+        ).join()
+        expected = [
+            distance((point.y, point.x), (osm_point.y, osm_point.x)).meters <= 100
+            for point in points
+        ]
+        assert list(df["matched"]) == expected
+        assert sum(expected) == 12
+
+    def test_join_empty_osm(self):
+        df = ProximityJoin(source_df=self.source_df()).join()
+        assert not df["matched"].any()
+        assert len(df.index) == 4
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import geopandas
+from pandas import DataFrame
+from shapely import LineString, Point
+
+import config
+from models.geojson_stream import GeojsonStreamReader
+from models.GeojsonHandler import GeojsonHandler
+from models.notes_index import NotesIndex
+from models.run_journal import (
+    MATCHED,
+    NEAR_NOTE,
+    NOTE_CREATED,
+    RunJournal,
+    geometry_hashes,
+)
+from models.sharded_matcher import ShardedMatcher
+
+
+class TestRunJournal(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.notes_file = os.path.join(self.directory, "notes.csv")
+        self.uploaded = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_geometry_hashes(self):
+        keys = geometry_hashes(
+            [
+                Point(17.9, 59.7),
+                # below the precision the API stores
+                Point(17.9, 59.70000001),
+                Point(17.9, 59.7001),
+                LineString([(17.9, 59.7), (17.91, 59.7)]),
+            ]
+        )
+        assert keys[0] == keys[1]
+        assert len(set(keys)) == 3
+
+    def test_last_outcome_wins_after_reload(self):
+        file_path = os.path.join(self.directory, "run.csv")
+        journal = RunJournal(file_path=file_path)
+        journal.record("a", MATCHED, osm_id="node/1")
+        journal.record_many(["b", "a"], NEAR_NOTE, note_ids=[1, 2])
+        reloaded = RunJournal(file_path=file_path)
+        assert reloaded.outcome("a") == NEAR_NOTE
+        assert reloaded.outcome("b") == NEAR_NOTE
+        assert reloaded.outcome("c") is None
+        reloaded.clear()
+        assert not os.path.exists(file_path)
+        assert RunJournal(file_path=file_path).outcome("a") is None
+
+    def handler(self, **kwargs) -> GeojsonHandler:
+        notes_index = NotesIndex()
+        notes_index.build(
+            DataFrame([dict(note_id=7, latitude=59.7001, longitude=17.9001)])
+        )
+        handler = GeojsonHandler(
+            source_df=geopandas.GeoDataFrame(
+                {"objektidentitet": ["a", "b", "c", "d"]},
+                geometry=[
+                    Point(17.8322943, 59.5292131),  # near the osm point
+                    Point(17.9, 59.7),  # near an existing note
+                    Point(18.2, 59.8),  # nothing nearby
+                    Point(18.3, 59.9),  # nothing nearby
+                ],
+                crs="EPSG:4326",
+            ),
+            osm_df=geopandas.GeoDataFrame(
+                {"id": ["node/1"]},
+                geometry=[Point(17.8330, 59.5295)],
+                crs="EPSG:4326",
+            ),
+            notes_index=notes_index,
+            notes_file_path=self.notes_file,
+            # skips the status check
+            number_of_open_notes=1,
+            **kwargs,
+        )
+        return handler
+
+    def iterate(self, handler: GeojsonHandler, interrupt_at: int = 0):
+        """Record the uploaded points in self.uploaded,
+        upload number interrupt_at is stopped like Ctrl-C"""
+        test = self
+
+        def upload_note(handler, point: Point):
+            if len(test.uploaded) + 1 == interrupt_at:
+                raise KeyboardInterrupt()
+            test.uploaded.append(point)
+            return 100 + len(test.uploaded)
+
+        with patch.object(config, "press_enter_to_continue", False), patch.object(
+            config, "upload_to_osm", True
+        ), patch.object(GeojsonHandler, "upload_note", new=upload_note):
+            handler.iterate_source_features()
+
+    def test_resume(self):
+        # the run is interrupted while uploading the second note
+        with self.assertRaises(KeyboardInterrupt):
+            self.iterate(self.handler(), interrupt_at=2)
+        journal = RunJournal(file_path=f"{self.notes_file}.run.csv")
+        a, b, c, d = geometry_hashes(self.handler().source_df.geometry)
+        assert journal.load()[a]["outcome"] == MATCHED
+        assert journal.load()[a]["osm_id"] == "node/1"
+        assert journal.load()[b]["outcome"] == NEAR_NOTE
+        assert journal.load()[b]["note_id"] == "7"
+        assert journal.load()[c]["outcome"] == NOTE_CREATED
+        assert journal.outcome(d) is None
+
+        handler = self.handler(resume=True)
+        self.iterate(handler)
+        # only the feature without an outcome was worked on
+        assert list(handler.source_df["objektidentitet"]) == ["d"]
+        assert self.uploaded[-1] == Point(18.3, 59.9)
+        assert RunJournal(file_path=journal.file_path).outcome(d) == NOTE_CREATED
+
+    def test_without_resume_starts_a_new_run(self):
+        with self.assertRaises(KeyboardInterrupt):
+            self.iterate(self.handler(), interrupt_at=2)
+        handler = self.handler()
+        self.iterate(handler)
+        assert len(handler.source_df.index) == 4
+        assert len(self.uploaded) == 3
+
+    def test_stream_starts_one_pool_for_all_chunks(self):
+        handler = self.handler(stream=True, processes=2)
+        source_df = handler.source_df
+        chunks = [source_df.iloc[:2], source_df.iloc[2:]]
+        with patch.object(
+            GeojsonStreamReader, "iterate_chunks", return_value=iter(chunks)
+        ), patch.object(
+            ShardedMatcher, "start", autospec=True, side_effect=ShardedMatcher.start
+        ) as start:
+            self.iterate(handler)
+        start.assert_called_once()
+        assert handler.matcher is None
+        journal = RunJournal(file_path=f"{self.notes_file}.run.csv")
+        a, b, c, d = geometry_hashes(source_df.geometry)
+        assert [journal.outcome(key) for key in (a, b, c, d)] == [
+            MATCHED,
+            NEAR_NOTE,
+            NOTE_CREATED,
+            NOTE_CREATED,
+        ]
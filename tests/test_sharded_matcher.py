@@ -0,0 +1,90 @@
+import tempfile
+from unittest import TestCase
+
+import geopandas
+import numpy
+import shapely
+from shapely import LineString, Point, Polygon
+
+from models.osm_layer import OsmLayer
+from models.proximity_join import ProximityJoin
+from models.sharded_matcher import SharedGeometries, ShardedMatcher
+
+
+class TestShardedMatcher(TestCase):
+    def source_df(self):
+        return geopandas.GeoDataFrame(
+            {"objektidentitet": ["a", "b", "c", "d", "e"]},
+            geometry=[
+                Point(17.8322943, 59.5292131),  # near the osm point
+                Point(17.9, 59.7),  # far from everything
+                Point(17.7005, 59.405),  # near the line
+                Point(18.1002, 59.6001),  # near the polygon centroid
+                # in the next tile, the osm point is in the halo
+                Point(17.8400, 59.5295),
+            ],
+            index=[10, 11, 12, 13, 14],
+            crs="EPSG:4326",
+        )
+
+    def osm_df(self):
+        return geopandas.GeoDataFrame(
+            {"name": ["point", "line", "polygon", "border"]},
+            geometry=[
+                Point(17.8330, 59.5295),
+                LineString([(17.7, 59.4), (17.7, 59.41)]),
+                Polygon(
+                    [(18.0995, 59.5995), (18.1005, 59.5995), (18.1005, 59.6005)]
+                ),
+                Point(17.8395, 59.5295),
+            ],
+            index=["n1", "w2", "w3", "n4"],
+            crs="EPSG:4326",
+        )
+
+    def test_join_equals_serial_join(self):
+        osm_layer = OsmLayer(osm_df=self.osm_df())
+        serial = ProximityJoin(
+            source_df=self.source_df(), osm_layer=osm_layer
+        ).join()
+        # tiles of about 500m so the features are spread over several shards
+        with ShardedMatcher(
+            osm_layer=osm_layer, processes=2, tile_size=0.005
+        ) as matcher:
+            sharded = matcher.join(self.source_df())
+        assert list(sharded.index) == list(serial.index)
+        assert list(sharded["matched"]) == list(serial["matched"])
+        assert list(sharded["nearest_osm_index"]) == list(serial["nearest_osm_index"])
+        numpy.testing.assert_array_equal(
+            sharded["distance_to_osm"].to_numpy(), serial["distance_to_osm"].to_numpy()
+        )
+        assert list(sharded["nearest_osm_index"]) == ["n1", None, "w2", "w3", "n4"]
+
+    def test_shards_include_the_halo(self):
+        osm_layer = OsmLayer(osm_df=self.osm_df())
+        matcher = ShardedMatcher(osm_layer=osm_layer, tile_size=0.005)
+        matcher.osm_tree = shapely.STRtree(osm_layer.representative)
+        geometries = numpy.array([Point(17.8400, 59.5295)])
+        [(_, positions, osm_positions)] = matcher.shards(geometries)
+        assert list(positions) == [0]
+        # only the border point is within 100m of the bounds
+        assert list(osm_positions) == [3]
+
+    def test_empty_osm(self):
+        with ShardedMatcher(osm_layer=OsmLayer(), processes=2) as matcher:
+            df = matcher.join(self.source_df())
+        assert list(df.index) == [10, 11, 12, 13, 14]
+        assert not df["matched"].any()
+
+
+class TestSharedGeometries(TestCase):
+    def test_round_trip(self):
+        geometries = numpy.array(
+            [Point(17.83, 59.52), LineString([(17.7, 59.4), (17.7, 59.41)])]
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            shared = SharedGeometries.create(geometries, directory, "test")
+            assert list(shared.get(numpy.array([1, 0]))) == [
+                geometries[1],
+                geometries[0],
+            ]
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+import geopandas
+import numpy
+from shapely import Point
+
+from benchmarks import datasets
+from models.distance import distance_meters
+from models.source_clusters import SourceClusters
+
+# about 1m north
+ONE_METER = 1 / 111_000
+
+
+def source_df(points) -> geopandas.GeoDataFrame:
+    return geopandas.GeoDataFrame(
+        {"objektidentitet": [f"id{i}" for i in range(len(points))]},
+        geometry=points,
+        crs="EPSG:4326",
+    )
+
+
+class TestSourceClusters(TestCase):
+    """
+    # This use point object where y=latitude and x=longitude
+    latitude = point.y
+    longitude = point.x
+    """
+
+    def test_collapse(self):
+        df = source_df(
+            [
+                Point(17.9, 59.7),
+                Point(18.5, 59.7),
+                Point(17.9, 59.7 + 30 * ONE_METER),
+                Point(17.9, 59.7 + 15 * ONE_METER),
+            ]
+        )
+        collapsed_df = SourceClusters().collapse(df)
+        # the middle one is closest to the others
+        assert list(collapsed_df["objektidentitet"]) == ["id1", "id3"]
+        assert list(collapsed_df["cluster_size"]) == [1, 3]
+
+    def test_independent_of_the_order(self):
+        df = datasets.source_df(2000)
+        # a dense area with chains of nearby features
+        df.geometry = df.geometry.scale(0.02, 0.02, origin=(17.9, 59.7))
+        clusters = SourceClusters()
+        collapsed_df = clusters.collapse(df)
+        assert len(collapsed_df.index) < len(df.index)
+        assert collapsed_df["cluster_size"].sum() == len(df.index)
+        shuffled_df = df.iloc[numpy.random.default_rng(1).permutation(len(df.index))]
+        shuffled_collapsed_df = clusters.collapse(shuffled_df)
+        assert sorted(collapsed_df.index) == sorted(shuffled_collapsed_df.index)
+
+    def test_chain_is_covered_within_the_radius(self):
+        df = source_df([Point(17.9, 59.7 + i * 80 * ONE_METER) for i in range(5)])
+        clusters = SourceClusters()
+        labels = clusters.labels(df)
+        # the ones with two neighbours cover three features
+        assert list(labels) == [1, 1, 1, 4, 4]
+        for position, representative in enumerate(labels):
+            point = df.geometry.iloc[position]
+            center = df.geometry.iloc[representative]
+            assert distance_meters(point.y, point.x, center.y, center.x) <= 100
+
+    def test_long_chain_without_a_distance_matrix(self):
+        # one component, a dense matrix of it would need about 3GB
+        df = source_df([Point(17.9, 59.7 + i * 80 * ONE_METER) for i in range(20000)])
+        collapsed_df = SourceClusters().collapse(df)
+        assert collapsed_df["cluster_size"].sum() == 20000
+        assert len(collapsed_df.index) <= 20000 // 3 + 1
+
+    def test_disabled(self):
+        df = source_df([Point(17.9, 59.7), Point(17.9, 59.7 + ONE_METER)])
+        assert SourceClusters(radius=0).collapse(df) is df
@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+from requests_oauth2client import BearerToken, OAuth2Client
+
+from models.exceptions import MissingInformationError
+from models.http_session import create_session
+from models.osm_note_uploader import OsmNoteHandler
+from models.token_cache import CachedTokenAuth, TokenCache
+
+
+class TokenEndpointStub:
+    """Issue tokens on /token and accept only the newest one on /api"""
+
+    def __init__(self):
+        self.grants: List[dict] = []
+        self.access_token = "access0"
+        self.expires_in = 3600
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, code: int, data: dict):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                form = parse_qs(self.rfile.read(length).decode())
+                with stub.lock:
+                    stub.grants.append({k: v[0] for k, v in form.items()})
+                    stub.access_token = f"access{len(stub.grants)}"
+                    self.reply(
+                        200,
+                        dict(
+                            access_token=stub.access_token,
+                            token_type="Bearer",
+                            expires_in=stub.expires_in,
+                            refresh_token=f"refresh{len(stub.grants)}",
+                        ),
+                    )
+
+            def do_GET(self):
+                if self.headers["Authorization"] == f"Bearer {stub.access_token}":
+                    self.reply(200, dict(ok=True))
+                else:
+                    self.reply(401, dict(error="invalid_token"))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestTokenCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = TokenCache(file_path=os.path.join(self.directory, "token.json"))
+        self.stub = TokenEndpointStub()
+        self.oauth2client = OAuth2Client(
+            token_endpoint=f"{self.stub.url}/token",
+            auth=("id", "secret"),
+            # allows the plain http of the stub
+            testing=True,
+        )
+
+    def tearDown(self):
+        self.stub.close()
+        shutil.rmtree(self.directory)
+
+    def token(self, expires_in: int = 3600, **kwargs) -> BearerToken:
+        return BearerToken(
+            access_token="access0",
+            refresh_token="refresh0",
+            expires_at=datetime.now(tz=timezone.utc) + timedelta(seconds=expires_in),
+            **kwargs,
+        )
+
+    def session(self, token: BearerToken):
+        return create_session(
+            auth=CachedTokenAuth(self.oauth2client, token, self.cache)
+        )
+
+    def test_save_and_load(self):
+        token = self.token(scope="write_notes")
+        self.cache.save(token)
+        assert stat.S_IMODE(os.stat(self.cache.file_path).st_mode) == 0o600
+        loaded = self.cache.load()
+        assert loaded.access_token == "access0"
+        assert loaded.refresh_token == "refresh0"
+        assert loaded.scope == "write_notes"
+        assert abs((loaded.expires_at - token.expires_at).total_seconds()) < 1
+
+    def test_missing_or_broken_cache(self):
+        assert self.cache.load() is None
+        with open(self.cache.file_path, "w") as file:
+            file.write("{")
+        assert self.cache.load() is None
+
+    def test_valid_token_is_not_refreshed(self):
+        response = self.session(self.token()).get(f"{self.stub.url}/api")
+        assert response.status_code == 200
+        assert self.stub.grants == []
+
+    def test_expired_token_is_refreshed_once(self):
+        self.stub.access_token = "expired"
+        session = self.session(self.token(expires_in=-10))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(
+                executor.map(lambda _: session.get(f"{self.stub.url}/api"), range(8))
+            )
+        assert [response.status_code for response in responses] == [200] * 8
+        assert len(self.stub.grants) == 1
+        assert self.stub.grants[0]["grant_type"] == "refresh_token"
+        assert self.stub.grants[0]["refresh_token"] == "refresh0"
+        # the next run starts with the refreshed token
+        assert self.cache.load().access_token == "access1"
+
+    def test_rejected_token_is_refreshed(self):
+        self.stub.access_token = "revoked"
+        response = self.session(self.token()).get(f"{self.stub.url}/api")
+        assert response.status_code == 200
+        assert response.history[0].status_code == 401
+        assert len(self.stub.grants) == 1
+        assert self.cache.load().refresh_token == "refresh1"
+
+    def test_rejected_token_without_refresh_token(self):
+        self.cache.save(BearerToken(access_token="access0"))
+        self.stub.access_token = "revoked"
+        response = self.session(self.cache.load()).get(f"{self.stub.url}/api")
+        assert response.status_code == 401
+        # the next run logs in again
+        assert not os.path.exists(self.cache.file_path)
+
+    def test_initialize_client_uses_the_cache(self):
+        self.cache.save(self.token())
+        uploader = OsmNoteHandler(token_cache_file=self.cache.file_path)
+        with patch.object(
+            OsmNoteHandler, "create_oauth2client", return_value=self.oauth2client
+        ), patch.object(OsmNoteHandler, "authorize") as authorize:
+            uploader.authenticate()
+        authorize.assert_not_called()
+        assert uploader.initialized
+        response = uploader.client._session._session.get(f"{self.stub.url}/api")
+        assert response.status_code == 200
+
+    def test_initialize_client_without_a_terminal(self):
+        uploader = OsmNoteHandler(token_cache_file=self.cache.file_path)
+        with patch.object(
+            OsmNoteHandler, "create_oauth2client", return_value=self.oauth2client
+        ), patch("sys.stdin") as stdin, self.assertRaises(MissingInformationError):
+            stdin.isatty.return_value = False
+            uploader.authenticate()
+        assert not uploader.initialized